@@ -1,6 +1,24 @@
+import os
 import sys
-import copy
+import json
+import mmap
+import time
 import random
+import struct
+import queue
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 class Board:
@@ -10,31 +28,41 @@ class Board:
     This class initializes, prints, and updates the game board
 
     Attributes:
-        board (list): 2D array for the board, 6x7
+        board (list): 2D array for the board, 6x7 by default
+        geometry (Geometry): Board size and the number of tokens in a line that wins
 
     Methods:
-        __init__(state, game=None): Initializes New or Old Board
+        __init__(state, game=None, rows=6, cols=7, connect=4): Initializes New or Old Board
         print_board(): Prints the state of the game board.
         valid_move(row, col): Checks for valid move based on the provided row and column.
         move(row, col, token): Places a player's token at the specified row and column.
+        wins_at(row, col, token): Checks the lines through a cell for a full line of a player's tokens.
         board_full(): Checks if the board is completely filled with tokens.
 
     """
-    def __init__(self, state, game=None):
+    def __init__(self, state, game=None, rows=6, cols=7, connect=4):
         """
         Constructor for Board Class
 
         Parameters:
         state (str): Accepts state if board is new or old
         game (list, optional): Accepts an existing board if old
+        rows (int, optional): Number of rows of a new board, an old board keeps its own
+        cols (int, optional): Number of columns of a new board, an old board keeps its own
+        connect (int, optional): Tokens in a line needed to win
+
+        Raises:
+        ValueError: If no line of connect tokens fits on the board
         """
         if state == "New":
             self.board = [
-                [0 for number in range(7)]
-                for num in range(6)
+                [0 for number in range(cols)]
+                for num in range(rows)
             ]
         elif state == "Old":
             self.board = game
+            rows, cols = len(game), len(game[0])
+        self.geometry = Geometry.get(rows, cols, connect)
 
     def print_board(self):
         """
@@ -54,7 +82,7 @@ class Board:
         Returns:
         bool: If Move valid, True, otherwise False
         """
-        if row == 6:
+        if row == len(self.board):
             if self.board[row - 1][col - 1] == 0:
                 return True
             else:
@@ -76,6 +104,28 @@ class Board:
         """
         self.board[row - 1][col - 1] = token
 
+    def wins_at(self, row, col, token):
+        """
+        Checks if the token at the row/col completes a line of geometry.connect. Only the windows through that
+        cell in the geometry's shared line index are checked, so after a move this finds a win without
+        scanning the whole board.
+
+        Parameters:
+        row (int): Row of the move
+        col (int): Column of the move
+        token (int): Player's Token Choice
+
+        Returns:
+        bool: True if the cell is part of a full row, column or diagonal
+        """
+        geometry = self.geometry
+        cols = geometry.cols
+        cell = (col - 1) * geometry.height + geometry.rows - row
+        for number in geometry.cell_windows[cell]:
+            if all(self.board[index // cols][index % cols] == token for index in geometry.flat_windows[number]):
+                return True
+        return False
+
     def board_full(self):
         """
         Checks if the board is full
@@ -100,9 +150,10 @@ class Player:
         available_tokens (list): List of available token numbers (1-9) for players
         player (str): Player name
         token (int): Token number
+        unique (bool): Whether the token is taken from available_tokens
 
     Methods:
-        __init__(name, token): Initializes a player with a name and a unique token.
+        __init__(name, token, unique=True): Initializes a player with a name and a unique token.
         player: Getter and setter for the player's name.
         token: Getter and setter for the player's token, ensuring it's not zero and is available.
         __str__(): Returns a string representation of the player with their name and token.
@@ -110,15 +161,17 @@ class Player:
     """
     available_tokens = [1, 2, 3, 4, 5, 6, 7, 8, 9]
 
-    def __init__(self, name, token):
+    def __init__(self, name, token, unique=True):
         """
         Initializes a player with a name and a token.
 
         Parameters:
         name (str): Player's name
         token (str): Player's token name
+        unique (bool, optional): Take the token from available_tokens, False for players of headless games
         """
         self.player = name
+        self.unique = unique
         self.token = token
 
     @property
@@ -158,10 +211,11 @@ class Player:
         Raises:
         ValueError: If token is 0, or its already taken
         """
-        if token_num == 0 or token_num not in Player.available_tokens:
+        if token_num == 0 or (self.unique and token_num not in Player.available_tokens):
             raise ValueError("Please input a one number token that is not 0 or presently taken.\n")
         else:
-            Player.available_tokens.remove(token_num)
+            if self.unique:
+                Player.available_tokens.remove(token_num)
             self._token = token_num
 
     def __str__(self):
@@ -169,35 +223,274 @@ class Player:
         return f"Player {self._player} is using token {self._token}!\n"
 
 
+class GameState:
+    """
+    GameState class is a headless game between two players
+
+    It applies moves and reports the result, and never prompts, prints or exits, so any number of games can
+    run in one process. The command line Game is a shell over it. Columns are 0-indexed, as in the AI.
+
+    Attributes:
+        board (Board): The board instance representing the game state.
+        players (tuple): The two players, index 0 moves first on a new board
+        turn (int): Index of the player to move
+        moves (list): Columns played since the state was created
+        last_move (int): Column of the latest move, None before the first one
+        winner (Player or AI): Player with four in a line, None if there is none
+
+    Methods:
+        __init__(p1, p2, board=None, turn=0): Starts a game, or picks one up from an existing board
+        new(names=("Player", "AI"), tokens=(2, 1), ai=None, rows=6, cols=7, connect=4): Builds the players and
+            a new game
+        current(): Returns the player to move
+        is_over(): Checks if the game has a winner or a full board
+        legal_moves(): Returns the columns that are not full
+        apply_move(col): Drops the current player's token into a column
+        ai_move(budget=None): Lets the AI to move pick and play its move
+        ponder(): Lets an AI opponent search its answers while a human player thinks
+        status(): Returns the state of the game as a dict
+        close(): Frees the resources held by AI players
+    """
+    def __init__(self, p1, p2, board=None, turn=0):
+        """
+        Constructor for GameState Class
+
+        Parameters:
+        p1 (Player or AI): Player at index 0
+        p2 (Player or AI): Player at index 1
+        board (Board, optional): Existing board, a new one if None
+        turn (int, optional): Index of the player to move
+
+        Raises:
+        ValueError: If both players use the same token
+        """
+        if p1.token == p2.token:
+            raise ValueError("Both players are using the same token.")
+        self.board = board if board is not None else Board("New")
+        self.players = (p1, p2)
+        self.turn = turn
+        self.moves = []
+        self.last_move = None
+        self.winner = None
+        # An existing board may already hold a win
+        for row in range(len(self.board.board)):
+            for col in range(len(self.board.board[0])):
+                for player in self.players:
+                    if self.winner is None and self.board.board[row][col] == player.token and \
+                            self.board.wins_at(row + 1, col + 1, player.token):
+                        self.winner = player
+
+    @classmethod
+    def new(cls, names=("Player", "AI"), tokens=(2, 1), ai=None, rows=6, cols=7, connect=4):
+        """
+        Builds the players and a new game. Tokens are not taken from Player.available_tokens, so games do not
+        compete for them.
+
+        Parameters:
+        names (tuple, optional): Names of the first and second player
+        tokens (tuple, optional): Tokens of the first and second player
+        ai (dict, optional): AI settings for the second player, None for two human players
+        rows (int, optional): Number of rows
+        cols (int, optional): Number of columns
+        connect (int, optional): Tokens in a line needed to win
+
+        Returns:
+        GameState: The new game
+
+        Raises:
+        ValueError: If no line of connect tokens fits on the board
+        """
+        board = Board("New", rows=rows, cols=cols, connect=connect)
+        p1 = Player(names[0], tokens[0], unique=False)
+        if ai is not None:
+            p2 = AI(names[1], tokens[1], tokens[0], geometry=board.geometry, **ai)
+        else:
+            p2 = Player(names[1], tokens[1], unique=False)
+        return cls(p1, p2, board)
+
+    def current(self):
+        """
+        Returns the player to move
+
+        Returns:
+        Player or AI: The player whose turn it is
+        """
+        return self.players[self.turn]
+
+    def is_over(self):
+        """
+        Checks if the game has a winner or a full board
+
+        Returns:
+        bool: True if no more moves can be played
+        """
+        return self.winner is not None or self.board.board_full()
+
+    def legal_moves(self):
+        """
+        Returns the columns that are not full
+
+        Returns:
+        list: Column indexes from left to right, empty once the game is over
+        """
+        if self.is_over():
+            return []
+        return [col for col in range(len(self.board.board[0])) if self.board.board[0][col] == 0]
+
+    def apply_move(self, col):
+        """
+        Drops the current player's token into a column and passes the turn, unless the move ends the game
+
+        Parameters:
+        col (int): Column index, 0-indexed
+
+        Returns:
+        dict: The status after the move
+
+        Raises:
+        ValueError: If the game is over or the column is full or off the board
+        """
+        if self.is_over():
+            raise ValueError("The game is over.")
+        if col not in self.legal_moves():
+            raise ValueError(f"Column {col} is not a legal move.")
+        row = max(row for row in range(len(self.board.board)) if self.board.board[row][col] == 0)
+        player = self.current()
+        self.board.move(row + 1, col + 1, player.token)
+        self.moves.append(col)
+        self.last_move = col
+        if self.board.wins_at(row + 1, col + 1, player.token):
+            self.winner = player
+        elif not self.board.board_full():
+            self.turn ^= 1
+        return self.status()
+
+    def ai_move(self, budget=None):
+        """
+        Lets the AI to move pick its move and plays it
+
+        Parameters:
+        budget (int, optional): Milliseconds for this move, None for the AI's own time budget or depth
+
+        Returns:
+        dict: The status after the move
+
+        Raises:
+        ValueError: If the game is over or the player to move is not an AI
+        """
+        player = self.current()
+        if self.is_over():
+            raise ValueError("The game is over.")
+        if not isinstance(player, AI):
+            raise ValueError(f"{player.player} is not an AI.")
+        # Answers pondered with the old budget must not be searched or stored under the new one
+        player.stop_pondering()
+        time_budget = player.time_budget
+        if budget is not None:
+            player.time_budget = budget
+        try:
+            best_spot = player.choose_move(self.board.board, True)[0]
+        finally:
+            player.time_budget = time_budget
+        return self.apply_move(best_spot[1])
+
+    def ponder(self):
+        """
+        Lets an AI opponent of the player to move find its answer to each of that player's moves in a background
+        thread, so its next ai_move is answered at once. The thread stops at the next ai_move or close.
+
+        Returns:
+        bool: True if the opponent is pondering
+        """
+        opponent = self.players[self.turn ^ 1]
+        if self.is_over() or isinstance(self.current(), AI) or not isinstance(opponent, AI):
+            return False
+        opponent.ponder(self.board.board)
+        return True
+
+    def status(self):
+        """
+        Returns the state of the game
+
+        Returns:
+        dict: state ("playing", "win" or "draw"), winner and turn as player names or None, the last move,
+            the legal moves and a copy of the board
+        """
+        if self.winner is not None:
+            state = "win"
+        elif self.board.board_full():
+            state = "draw"
+        else:
+            state = "playing"
+        return {"state": state, "winner": self.winner.player if self.winner is not None else None,
+                "turn": self.current().player if state == "playing" else None, "last_move": self.last_move,
+                "legal_moves": self.legal_moves(), "board": [list(row) for row in self.board.board]}
+
+    def close(self):
+        """
+        Frees the resources held by AI players, such as pondering threads and shared transposition tables
+        """
+        for player in self.players:
+            if isinstance(player, AI):
+                player.close()
+
+
 class Game:
     """
-    Game class handles flow of a two-player or AI-versus-player game.
+    Game class is the command line shell for a two-player or AI-versus-player game.
 
-    This class manages the game state, player initialization, gameplay loop, win-checking, saving, and loading of game states
-    for either AI or 2 player game.
+    This class prompts for players and moves, prints the board, and saves and loads games. The moves
+    themselves are applied by a GameState, for either AI or 2 player game.
 
     Attributes:
-        loaded_game (bool): Indicates if flag was from a saved state
+        loaded_game (bool): Indicates if flag was from the older single save file
+        ai_time_budget (int): Milliseconds per AI move, None to search to a fixed depth
+        ai_book (str): Opening book file for the AI, used if it exists
+        ai_cache (str): Position cache file for the AI, None for none
+        ai_stats_log (str): File the AI appends its search stats to, one JSON line per move, None for none
+        ai_ponder (bool): Lets the AI search its answers while the human types a move
+        archive (str): GameArchive file for finished games, None for none
+        save_dir (str): Folder of the SaveStore holding paused games
+        save_ttl (int): Seconds a paused game is kept
+        game_id (str): Name of the game's save, None until it is saved or loaded
         board (Board): The board instance representing the game state.
         p1 (Player): Initializing player object for p1
         p2 (Player or AI): Initializing player object for player or AI
+        state (GameState): Headless game the shell drives
         cur_player (str): Name of current player
-        game_status (bool): Indicates status of game
 
     Methods:
         __init__(state, is_ai=False): Initializes or Loads Board and Players
         init_players(): Initializes the two players, getting names and tokens
         init_ai_game(): Initializes the game with AI
+        make_ai(human_token): Builds the AI opponent with the game's AI settings
         ai_game(): AI-versus-player gameplay
         switch_player(): Switches the current player between Player 1 and Player 2.
         get_token(): Returns the token of the current player.
         win_check(token): Checks if player has won the game by verifying for a horizontal, vertical, or diagonal line of 4 tokens.
-        play_game(): Player-versus-player gameplay
+        play_game(): Runs the game until it ends or is paused
+        end_game(status): Announces the result and records it in the game history
         save_game(): Saves game state for later playing
         load_game(): Loads previously saved game
+        load_text_game(): Loads a game from the older single save file
     """
     #Used to Remove Content from Game if it's Loaded then Ended
     loaded_game = False
+    #Milliseconds per AI move, None keeps the AI at its fixed depth
+    ai_time_budget = None
+    #Opening book for the AI, used if the file exists
+    ai_book = "opening_book.bin"
+    #Position cache file kept between runs, None keeps searched positions in memory only
+    ai_cache = None
+    #File that gets one JSON line of search stats per AI move, None for no log
+    ai_stats_log = None
+    #Search the AI's answers to the human's moves while waiting for the human to type one
+    ai_ponder = True
+    #Archive that gets the moves of every game played from the empty board, None for no archive
+    archive = "games.c4a"
+    #Folder of paused games, and how long a paused game is kept in seconds
+    save_dir = "saves"
+    save_ttl = 30 * 24 * 60 * 60
 
     def __init__(self, state, is_ai=False):
         """
@@ -207,6 +500,7 @@ class Game:
         state (str): 'New' for a new game, 'Old' to load an existing game
         is_ai (bool): Optional input for whether the game will involve AI
         """
+        self.game_id = None
         if state == "New":
             if is_ai:
                 self.board = Board(state)
@@ -217,7 +511,10 @@ class Game:
         elif state == "Old":
             self.load_game()
 
-        self.game_status = False
+    @property
+    def cur_player(self):
+        """Getter for the name of the player to move"""
+        return self.state.current().player
 
     def init_players(self):
         """
@@ -239,7 +536,7 @@ class Game:
         self.p2 = Player(player2, player2_token)
 
         # Let Player 1 be the first player
-        self.cur_player = self.p1.player
+        self.state = GameState(self.p1, self.p2, self.board)
 
         self.play_game()
 
@@ -253,63 +550,35 @@ class Game:
             player1 = str(input("Please enter a string name for player 1:\n"))
             player1_token = int(input("Please enter a valid digit token for player 1:\n"))
         self.p1 = Player(player1, player1_token)
-        self.p2 = AI('AI', 1, player1_token)
-        self.cur_player = self.p1.player
+        self.p2 = self.make_ai(player1_token)
+        self.state = GameState(self.p1, self.p2, self.board)
         self.ai_game()
 
-    def ai_game(self):
-        """
-        Runs the game when one player is an AI. The AI makes moves automatically.
+    def make_ai(self, human_token):
         """
-        while not self.win_check(self.get_token()) or self.board.board_full():
-            self.board.print_board()
-            if self.cur_player == 'AI':
-                depth = 5
-                best_spot = self.p2.minimax(self.board.board, depth, -99999, 99999, False)[0]
-                best_spot[0] += 1
-                best_spot[1] += 1
-                self.board.move(best_spot[0], best_spot[1], self.get_token())
-            else:
-                move_row = int(input(f"Please enter the row, {self.cur_player}, you'd like to move to:\n"))
-                move_col = int(input(f"Please enter the column, {self.cur_player}, you'd like to move to:\n"))
-                while not self.board.valid_move(move_row, move_col) or self.board.board_full():
-                    move_row = int(input(f"Please enter a valid row, {self.cur_player}:\n"))
-                    move_col = int(input(f"Please enter a valid column, {self.cur_player}:\n"))
-
-                self.board.move(move_row, move_col, self.get_token())
-
-            if (self.win_check(self.get_token()) or self.board.board_full()) and Game.loaded_game:
-                with open('game_pause.txt', 'w') as file:
-                    pass
-
-            if self.win_check(self.get_token()):
-                history = GameHistory()
-                history.add_history(self.cur_player)
-                print(f"{self.cur_player} Wins")
-                print("Game Over")
-                sys.exit()
+        Builds the AI opponent, always token 1, with the time budget, opening book and cache set on Game
 
-            if self.board.board_full():
-                print("The Board is Full, There is No Winner. Restart Game.")
-                history = GameHistory()
-                history.add_history("Tie")
-                print("Game Over")
-                sys.exit()
+        Parameters:
+        human_token (int): Token of the human player
 
-            self.switch_player()
+        Returns:
+        AI: The AI player
+        """
+        book = OpeningBook(Game.ai_book) if Game.ai_book and os.path.exists(Game.ai_book) else None
+        return AI('AI', 1, human_token, time_budget=Game.ai_time_budget, book=book, cache=Game.ai_cache,
+                  stats_log=Game.ai_stats_log)
 
-            pause = int(input("Press 1 if You would like to pause the game, 0 to continue:\n"))
-            if pause:
-                print("Saving Game...\n")
-                self.save_game()
-            else:
-                print("Continuing...\n")
+    def ai_game(self):
+        """
+        Runs the game when one player is an AI. The AI makes moves automatically.
+        """
+        self.play_game()
 
     def switch_player(self):
         """
         Switches the current player between Player 1 and Player 2.
         """
-        self.cur_player = self.p1.player if self.cur_player == self.p2.player else self.p2.player
+        self.state.turn ^= 1
 
     def get_token(self):
         """
@@ -318,14 +587,12 @@ class Game:
         Returns:
         int: The token of the current player.
         """
-        if self.cur_player == self.p1.player:
-            return self.p1.token
-        else:
-            return self.p2.token
+        return self.state.current().token
 
     def win_check(self, token):
         """
-        Checks if the current player has won the game by verifying for a horizontal, vertical, or diagonal line of 4 tokens.
+        Checks if the current player has won the game by verifying for a horizontal, vertical, or diagonal line of
+        geometry.connect tokens.
 
         Parameters:
         token (int): The token of the player whose victory is being checked.
@@ -333,86 +600,138 @@ class Game:
         Returns:
         bool: True if the player has won, False otherwise.
         """
-        for row in range(6):
-            for col in range(7):
-                if self.board.board[row][col] == token:
-                    if col < 4 and self.board.board[row][col + 1] == token and self.board.board[row][
-                        col + 2] == token and self.board.board[row][col + 3] == token:
-                        return True
-                    if row < 3 and self.board.board[row + 1][col] == token and self.board.board[row + 2][
-                        col] == token and self.board.board[row + 3][col] == token:
-                        return True
-                    if row < 3 and col < 4 and self.board.board[row + 1][col + 1] == token and \
-                            self.board.board[row + 2][col + 2] == token and self.board.board[row + 3][col + 3] == token:
-                        return True
-                    if row > 2 and col < 4 and self.board.board[row - 1][col + 1] == token and \
-                            self.board.board[row - 2][col + 2] == token and self.board.board[row - 3][col + 3] == token:
-                        return True
+        cells = [cell for row in self.board.board for cell in row]
+        for window in self.board.geometry.flat_windows:
+            if all(cells[index] == token for index in window):
+                return True
         return False
+
     def play_game(self):
         '''
-        Controls regular 2 player gameplay
+        Controls gameplay, prompting human players for moves and letting an AI player move on its own
 
         :return:
-        Will end the program through either pausing or a winner or a draw
+        Returns once the game is won, drawn or paused
         '''
-        while not self.win_check(self.get_token()) or self.board.board_full():
+        status = self.state.status()
+        while status["state"] == "playing":
             self.board.print_board()
-            move_row = int(input(f"Please enter the row, {self.cur_player}, you'd like to move to:\n"))
-            move_col = int(input(f"Please enter the column, {self.cur_player}, you'd like to move to:\n"))
-            while not self.board.valid_move(move_row, move_col) or self.board.board_full():
-                move_row = int(input(f"Please enter a valid row, {self.cur_player}:\n"))
-                move_col = int(input(f"Please enter a valid column, {self.cur_player}:\n"))
-
-            self.board.move(move_row, move_col, self.get_token())
+            if isinstance(self.state.current(), AI):
+                status = self.state.ai_move()
+                if Game.ai_ponder:
+                    self.state.ponder()
+            else:
+                if Game.ai_ponder:
+                    self.state.ponder()
+                move_row = int(input(f"Please enter the row, {self.cur_player}, you'd like to move to:\n"))
+                move_col = int(input(f"Please enter the column, {self.cur_player}, you'd like to move to:\n"))
+                while not self.board.valid_move(move_row, move_col):
+                    move_row = int(input(f"Please enter a valid row, {self.cur_player}:\n"))
+                    move_col = int(input(f"Please enter a valid column, {self.cur_player}:\n"))
+                status = self.state.apply_move(move_col - 1)
 
-            if (self.win_check(self.get_token()) or self.board.board_full()) and Game.loaded_game:
-                with open('game_pause.txt', 'w') as file:
-                    pass
-            if self.win_check(self.get_token()):
-                if Game.loaded_game:
-                    with open('game_pause.txt', 'w') as file:
-                        pass
-                history = GameHistory()
-                history.add_history(self.cur_player)
-                print(f"{self.cur_player} Wins")
-                print("Game Over")
-                sys.exit()
-
-            if self.board.board_full():
-                if Game.loaded_game:
-                    with open('game_pause.txt', 'w') as file:
-                        pass
-                print("The Board is Full, There is No Winner. Restart Game.")
-                history = GameHistory()
-                history.add_history("Tie")
-                print("Game Over")
-                sys.exit()
-
-            self.switch_player()
+            if status["state"] != "playing":
+                break
 
             pause = int(input("Press 1 if You would like to pause the game, 0 to continue:\n"))
             if pause:
                 print("Saving Game...\n")
                 self.save_game()
+                self.state.close()
+                return
             else:
                 print("Continuing...\n")
-    def save_game(self, savegame="game_pause.txt"):
+
+        self.end_game(status)
+        self.state.close()
+
+    def end_game(self, status):
         """
-        Saves the current game state to a file for later loading.
+        Announces the result of a finished game and records it in the game history
+
+        Parameters:
+        status (dict): Final status from the GameState
+        """
+        self.board.print_board()
+        if self.game_id is not None:
+            SaveStore(Game.save_dir, Game.save_ttl).delete(self.game_id)
+        if Game.loaded_game:
+            with open('game_pause.txt', 'w') as file:
+                pass
+        history = GameHistory()
+        players = [player.player for player in self.state.players]
+        if status["state"] == "win":
+            history.add_history(status["winner"], players, self.state.moves)
+            print(f"{status['winner']} Wins")
+        else:
+            print("The Board is Full, There is No Winner. Restart Game.")
+            history.add_history("Tie", players, self.state.moves)
+        history.close()
+        if Game.archive is not None:
+            try:
+                GameArchive(Game.archive).record_game(self.state)
+            except ValueError:
+                # Games loaded from the older save file lack their early moves
+                pass
+        print("Game Over")
+
+    def save_game(self):
         """
-        with open(savegame, 'w') as game_state:
-            game_state.write(f"{self.p1.player} : {self.p1.token}\n")
-            game_state.write(f"{self.p2.player} : {self.p2.token}\n")
-            game_state.write(f"Turn : {self.get_token()}\n")
-            for row in self.board.board:
-                game_state.write(f"{row}\n")
+        Saves the current game state in the save store for later loading. A game that was loaded goes back
+        into its own save, otherwise the player names the save, and a name that is already saved is refused.
+        """
+        store = SaveStore(Game.save_dir, Game.save_ttl)
+        while self.game_id is None:
+            game_id = str(input("Please enter a name for this saved game (letters, digits, - or _):\n"))
+            try:
+                taken = store.load(game_id) is not None
+            except ValueError as error:
+                print(error)
+                continue
+            if taken:
+                print(f"There is already a saved game called {game_id}, please choose another name.")
+            else:
+                self.game_id = game_id
+        store.save(self.game_id, self.state)
         print("Closing Game. Open Loaded Game Next Time to Resume.")
-        sys.exit()
 
     def load_game(self, loadgame="game_pause.txt"):
         """
-        Loads a saved game from a file.
+        Loads a saved game from the save store, or from the older single save file if the store is empty.
+        """
+        store = SaveStore(Game.save_dir, Game.save_ttl)
+        store.expire()
+        saves = store.list()
+        if not saves:
+            self.load_text_game(loadgame)
+            return
+        print("Saved Games:")
+        for game_id, saved in saves:
+            print(f"{game_id} (saved {time.strftime('%Y-%m-%d %H:%M', time.localtime(saved))})")
+        record = None
+        while record is None:
+            game_id = str(input("Please enter the name of the game to load:\n"))
+            try:
+                record = store.load(game_id)
+            except ValueError as error:
+                print(error)
+        self.game_id = game_id
+
+        self.p1 = Player(record["names"][0], record["tokens"][0])
+        if record["ai"][1]:
+            self.p2 = self.make_ai(record["tokens"][0])
+        else:
+            self.p2 = Player(record["names"][1], record["tokens"][1])
+        self.board = Board("Old", record["board"])
+        self.state = GameState(self.p1, self.p2, self.board, record["turn"])
+        self.state.moves = record["moves"]
+
+        print("Game Loaded.")
+        self.play_game()
+
+    def load_text_game(self, loadgame="game_pause.txt"):
+        """
+        Loads a game saved as text by earlier versions.
         """
         Game.loaded_game = True
         game = []
@@ -421,119 +740,253 @@ class Game:
                 for line in game_state:
                     game.append(line.strip())
         except FileNotFoundError:
+            pass
+        if len(game) < 9:
             print("No Old Game File Found")
+            return
 
         p1, p1_token = game[0].strip().split(":")
         p1_token = p1_token.strip()
         p1 = p1.strip()
-        # print(p1, p1_token)
         self.p1 = Player(p1, int(p1_token))
 
         p2, p2_token = game[1].strip().split(":")
         p2_token = p2_token.strip()
         p2 = p2.strip()
         if p2 == "AI":
-            self.p2 = AI('AI', 1, p1_token)
-
-            self.cur_player = self.p1.player if self.p1.token == int(game[2].split(":")[1]) else self.p2.player
-
-            load_board = []
-            for row in game[3:9]:  # Skip the first three lines which are player data
-                # Remove the square brackets and split by commas, then convert to integers
-                row = row.strip()[1:-1]  # Strip off the surrounding brackets
-                row_list = [int(x.strip()) for x in row.split(',')]  # Split by commas and convert to integers
-                load_board.append(row_list)  # Add the row to the board
-            self.board = Board("Old", load_board)
-            self.ai_game()
-
+            self.p2 = self.make_ai(int(p1_token))
         else:
             self.p2 = Player(p2, int(p2_token))
 
-            self.cur_player = self.p1.player if self.p1.token == int(game[2].split(":")[1]) else self.p2.player
+        turn = 0 if self.p1.token == int(game[2].split(":")[1]) else 1
 
-            load_board = []
-            for row in game[3:9]:  # Skip the first three lines which are player data
-                # Remove the square brackets and split by commas, then convert to integers
-                row = row.strip()[1:-1]  # Strip off the surrounding brackets
-                row_list = [int(x.strip()) for x in row.split(',')]  # Split by commas and convert to integers
-                load_board.append(row_list)  # Add the row to the board
-            self.board = Board("Old", load_board)
-
-            self.play_game()
+        load_board = []
+        for row in game[3:9]:  # Skip the first three lines which are player data
+            # Remove the square brackets and split by commas, then convert to integers
+            row = row.strip()[1:-1]  # Strip off the surrounding brackets
+            row_list = [int(x.strip()) for x in row.split(',')]  # Split by commas and convert to integers
+            load_board.append(row_list)  # Add the row to the board
+        self.board = Board("Old", load_board)
+        self.state = GameState(self.p1, self.p2, self.board, turn)
 
         print("Game Loaded.")
+        self.play_game()
+
 
 class GameHistory:
     '''
     Class for managing and storing a previous game
 
-    This class handles the reading, updating, and displaying of game history stored in a file. It allows tracking
-    player names along with their total wins.
+    Every finished game is appended as one JSON line to a result log, which is never rewritten, so writers in
+    different processes cannot lose each other's records. Per-player totals are kept in a small index file
+    that records how far into the log it has counted. Loading reads the index and only the log records after
+    that point, and the index is compacted in a background thread once enough records pile up behind it.
 
     Attributes:
-        file_name (str): Default is "game_history.txt", file for reading data
+        file_name (str): Default is "game_history.txt", index file of per-player totals
+        log_name (str): Result log, by default the index file name with a .log extension
+        compact_every (int): Records behind the index that start a background compaction
         history (dict): Dictionary mapping players to their wins
+        pending (int): Records in the log that the index has not counted yet
+        compactor (threading.Thread): Latest background compaction, None if none was started
 
     Methods:
-        load_history(): Loads the game history from the file and returns it as a dictionary
-        add_history(player): Adds a win for the given player or updates existing count
+        load_history(): Loads the totals from the index and the newer log records and returns them as a dictionary
+        read_index(): Reads the totals and log offset stored in the index file
+        read_log(offset): Reads the complete log records from an offset
+        records(): Returns every record in the log
+        add_history(player, players=None, moves=None): Appends a finished game and adds a win for the player
+        start_compaction(): Starts a compaction in a background thread
+        compact(): Folds the newer log records into the index file
+        remove_stale(): Removes temporary index files left by a compaction that was cut off
+        close(): Waits for the background compaction to finish
         disp_history(): Displays the game history, showing each players wins
     '''
-    def __init__(self, file_name="game_history.txt"):
+    def __init__(self, file_name="game_history.txt", log_name=None, compact_every=64):
         """
         GameHistory class constructor
 
         Parameters:
         file_name (str): Default name of the file that stores the game history
+        log_name (str, optional): Result log, defaults to file_name with a .log extension
+        compact_every (int, optional): Records behind the index that start a background compaction
         """
         self.file_name = file_name
+        self.log_name = log_name if log_name is not None else os.path.splitext(file_name)[0] + ".log"
+        self.compact_every = compact_every
+        self.pending = 0
+        self.compactor = None
+        self.remove_stale()
         self.history = self.load_history()
+        if self.pending >= self.compact_every:
+            self.start_compaction()
 
     def load_history(self):
         """
-        Loads the game history from the file
+        Loads the game history from the index file and the log records it has not counted yet
 
         Returns:
         dict: Player names and their wins
         """
+        history, offset = self.read_index()
+        records = self.read_log(offset)[0]
+        for record in records:
+            history[record["winner"]] = history.get(record["winner"], 0) + 1
+        self.pending = len(records)
+        return history
+
+    def read_index(self):
+        """
+        Reads the index file. Its header is "Player : # Wins", followed by "@ offset" once it counts log records,
+        so a history file written before the log existed loads as totals with nothing counted from the log.
+
+        Returns:
+        tuple: (dict of player names and their wins, log offset the totals cover)
+        """
+        history, offset = {}, 0
         try:
             with open(self.file_name, "r") as game_hist:
-                history = {}
-
-                i = 0
+                header = game_hist.readline()
+                if "@" in header:
+                    offset = int(header.split("@")[1])
                 for line in game_hist:
-                    if i == 0:
-                        i += 1
-                    else:
-                        player, wins = line.strip().split(" : ")
-                        history[player] = int(wins)
-                return history
+                    player, wins = line.rstrip("\n").split(" : ")
+                    history[player] = int(wins)
+        except FileNotFoundError:
+            pass
+        return history, offset
+
+    def read_log(self, offset=0):
+        """
+        Reads the complete records of the log from an offset. A record still being written by another process
+        has no newline yet and is left for the next read.
+
+        Parameters:
+        offset (int, optional): Byte offset to start at
+
+        Returns:
+        tuple: (list of record dicts, offset just past the last complete record)
+        """
+        try:
+            with open(self.log_name, "rb") as log:
+                log.seek(offset)
+                data = log.read()
         except FileNotFoundError:
-            return {}
+            return [], offset
+        complete = data[:data.rfind(b"\n") + 1]
+        return [json.loads(line) for line in complete.splitlines() if line], offset + len(complete)
+
+    def records(self):
+        """
+        Returns every game in the log
+
+        Returns:
+        list: Record dicts with time, players, winner and moves
+        """
+        return self.read_log()[0]
 
-    def add_history(self, player):
+    def add_history(self, player, players=None, moves=None):
         """
-        Adds the given player to the game history or increases their count.
+        Appends the game to the log and adds a win for the given player. Only one short record is written,
+        under an exclusive lock, whatever the size of the history.
 
         Parameters:
-        player (str): The name of the player whose win to add
+        player (str): The name of the player whose win to add, or "Tie"
+        players (list, optional): Names of the two players, first mover first
+        moves (list, optional): 0-indexed columns played
 
         Raises:
         ValueError: If the provided player is not a string
         """
         if not isinstance(player, str):
             raise ValueError("Incorrect type, unable to add to history")
-        else:
-            with open(self.file_name, "w") as game_add:
-                game_add.write(f"Player : # Wins\n")
-                if player in self.history:
-                    self.history[player] += 1
-                    for player, wins in self.history.items():
-                        game_add.write(f"{player} : {wins}\n")
-                else:
-                    self.history[player] = 1
-                    for player, wins in self.history.items():
-                        game_add.write(f"{player} : {wins}\n")
+        record = {"time": round(time.time(), 3), "players": list(players) if players is not None else None,
+                  "winner": player, "moves": "".join(map(str, moves)) if moves is not None else None}
+        line = (json.dumps(record) + "\n").encode()
+        descriptor = os.open(self.log_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(descriptor, fcntl.LOCK_EX)
+            os.write(descriptor, line)
+        finally:
+            os.close(descriptor)
+        self.history[player] = self.history.get(player, 0) + 1
+        self.pending += 1
+        if self.pending >= self.compact_every:
+            self.pending = 0
+            self.start_compaction()
+
+    def start_compaction(self):
+        """
+        Starts a compaction in a background thread. The thread is not a daemon, so the interpreter waits for it
+        at exit rather than killing it halfway through writing the index.
+        """
+        self.close()
+        self.compactor = threading.Thread(target=self.compact)
+        self.compactor.start()
+
+    def compact(self):
+        """
+        Folds the log records the index has not counted into the index file, which is written to a temporary
+        file and swapped in, so readers always see a whole index. Compactions from different processes take
+        turns on a lock file.
+
+        Returns:
+        int: Number of records folded in
+        """
+        with open(self.file_name + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            history, offset = self.read_index()
+            records, offset = self.read_log(offset)
+            if not records:
+                return 0
+            for record in records:
+                history[record["winner"]] = history.get(record["winner"], 0) + 1
+            temporary = f"{self.file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "w") as game_add:
+                game_add.write(f"Player : # Wins @ {offset}\n")
+                for player, wins in history.items():
+                    game_add.write(f"{player} : {wins}\n")
+            os.replace(temporary, self.file_name)
+        return len(records)
+
+    def remove_stale(self):
+        """
+        Removes the temporary index files a compaction leaves behind if its process dies before swapping the
+        file in. A running compaction holds the lock while its temporary file exists, so the files are only
+        removed under the lock.
+
+        Returns:
+        int: Number of files removed
+        """
+        folder, prefix = os.path.split(self.file_name)
+        try:
+            names = [name for name in os.listdir(folder or ".") if name.startswith(prefix + ".")
+                     and name.endswith(".tmp")]
+        except FileNotFoundError:
+            return 0
+        if not names:
+            return 0
+        removed = 0
+        with open(self.file_name + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            for name in names:
+                try:
+                    os.remove(os.path.join(folder, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def close(self):
+        """
+        Waits for the background compaction, if one is running, to finish writing the index.
+        """
+        if self.compactor is not None:
+            self.compactor.join()
+            self.compactor = None
 
     def disp_history(self):
         """
@@ -547,199 +1000,2532 @@ class GameHistory:
                 print(f"{player} has {wins} wins.")
 
 
-class AI(Player):
-    '''
+class SaveStore:
     """
-    AI class for automated ConnectFour Moves
+    SaveStore class keeps many paused games, one small binary file per game ID
 
-    AI uses a minimax algorithm with alpha-beta pruning, based on a custom heuristic function
-    to determine optimal moves.
+    A save holds both players' names and tokens, which of them is the AI, the side to move, the board as two
+    bitmasks and the columns played. Saving and loading touch only the one file for the ID, and saves are
+    written to a temporary file that is swapped in, so a save is never seen half written.
 
     Attributes:
-        human_token (int): Token for opponent
-        token (int): AI's Token (1)
-        name (str): AI name (AI)
+        HEADER (struct.Struct): Magic, version, save time, side to move, tokens, AI flags, masks and move count
+        MAGIC (bytes): First bytes of every save file
+        VERSION (int): Save layout version
+        EXTENSION (str): File extension of saves
+        directory (str): Folder holding the saves
+        ttl (float): Seconds a save is kept, None to keep saves until they are deleted
 
     Methods:
-        transpose(s): Transposes the board to check moves
-        valid_moves(s): Returns a list of valid moves for AI
-        switch_nested_values(nested_lists): Switches column and row values for valid move checking
-        win_check(s): Checks the board for a winner (horizontal, vertical, or diagonal)
-        count_score(s): Evaluates the game board with heuristic and returns a score difference
-        minimax(board, depth, alpha, beta, player_bool): Implements the minimax algorithm with alpha-beta pruning
+        __init__(directory="saves", ttl=None): Opens a store, creating its folder if needed
+        path(game_id): Returns the file of a save, checking the ID
+        encode(state): Packs a GameState into bytes
+        decode(data): Unpacks a save
+        save(game_id, state): Saves a game, replacing any save with the same ID
+        load(game_id): Loads a save, None if there is none or it expired
+        delete(game_id): Deletes a save
+        list(): Returns the ID and save time of every save
+        expire(now=None): Deletes the saves older than ttl
     """
-    '''
-    def __init__(self, name, token, human):
+    HEADER = struct.Struct("<4sBdBBBBQQB")
+    MAGIC = b"C4SV"
+    VERSION = 1
+    EXTENSION = ".c4s"
+
+    def __init__(self, directory="saves", ttl=None):
         """
-        AI Class Initialization, Inheritance of Player attributes
+        Constructor for SaveStore Class
 
         Parameters:
-        name (str): AI name (AI)
-        token (int): AI token (1)
-        human (int): Human token used for minimax algorithm
+        directory (str, optional): Folder holding the saves
+        ttl (float, optional): Seconds a save is kept, None to keep saves until they are deleted
         """
-        super().__init__(name, token)
-        self.human_token = human
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
 
-    def transpose(self, s):
+    def path(self, game_id):
         """
-        Transposes a 2D array for move checking
+        Returns the file of a save
 
         Parameters:
-        s (list): Board to transpose
+        game_id (str): Save ID, letters, digits, '-' and '_'
 
         Returns:
-        list: 2D transposed array
+        str: Path of the save file
+
+        Raises:
+        ValueError: If the ID is empty, too long or has other characters
         """
-        return [[s[j][i] for j in range(len(s))] for i in range(len(s[0]))]
+        if not game_id or len(game_id) > 64 or not all(char.isalnum() or char in "-_" for char in game_id):
+            raise ValueError("A save ID must be 1 to 64 letters, digits, '-' or '_'.")
+        return os.path.join(self.directory, game_id + SaveStore.EXTENSION)
 
-    def valid_moves(self, s):
+    @staticmethod
+    def encode(state):
         """
-        Checks for valid moves in each column of the board.
+        Packs a game into bytes
 
         Parameters:
-        s (list): 2D board to check for moves
+        state (GameState): Game to pack
 
         Returns:
-        list: List of possible moves, each represented by a list of coordinates [col, row]
-        """
-        new_s = self.transpose(s)
-        possible_moves = []
-        for col in range(len(new_s)):
-            for row in range(len(new_s[0]) - 1, -1, -1):
-                if new_s[col][row] == 0:
-                    possible_moves.append([col, row])
-                    break
-        self.switch_nested_values(possible_moves)
-        return possible_moves
+        bytes: The save
 
-    def switch_nested_values(self, nested_lists):
+        Raises:
+        ValueError: If the board is not 6x7 connect-4 or a name is longer than 255 bytes
         """
-        Switches the values from col, row to row, col to be implemented onto board
+        if state.board.geometry is not Geometry.STANDARD:
+            raise ValueError("Only 6x7 connect-4 games can be saved.")
+        players = state.players
+        position = Bitboard.from_board(state.board.board, (players[0].token, players[1].token))
+        ai = sum(1 << index for index, player in enumerate(players) if isinstance(player, AI))
+        data = bytearray(SaveStore.HEADER.pack(SaveStore.MAGIC, SaveStore.VERSION, time.time(), state.turn,
+                                               players[0].token, players[1].token, ai, position.masks[0],
+                                               position.masks[1], len(state.moves)))
+        data += bytes(state.moves)
+        for player in players:
+            name = player.player.encode()
+            if len(name) > 255:
+                raise ValueError(f"Player name {player.player} is too long to save.")
+            data += bytes((len(name),)) + name
+        return bytes(data)
+
+    @staticmethod
+    def decode(data):
+        """
+        Unpacks a save
 
         Parameters:
-        nested_lists (list): List of pairs to switch
+        data (bytes): The save
+
+        Returns:
+        dict: names, tokens, ai (whether each player is the AI), turn, board (6x7 list of lists), moves and
+            saved (time of the save)
+
+        Raises:
+        ValueError: If the data is not a save, or is truncated or corrupt
         """
-        for nested_list in nested_lists:
-            nested_list[0], nested_list[1] = nested_list[1], nested_list[0]
+        if data[:4] != SaveStore.MAGIC:
+            raise ValueError("Not a saved game.")
+        if len(data) < SaveStore.HEADER.size:
+            raise ValueError("Truncated save.")
+        magic, version, saved, turn, token1, token2, ai, mask1, mask2, count = SaveStore.HEADER.unpack_from(data)
+        if version != SaveStore.VERSION:
+            raise ValueError(f"Saved game version {version} is not supported.")
+        if turn > 1 or mask1 & mask2 or (mask1 | mask2) & ~Bitboard.BOARD_MASK or count > Bitboard.ROWS * Bitboard.COLS:
+            raise ValueError("Corrupt save.")
+        offset = SaveStore.HEADER.size
+        if len(data) < offset + count:
+            raise ValueError("Truncated save.")
+        moves = list(data[offset:offset + count])
+        offset += count
+        names = []
+        for index in range(2):
+            if len(data) <= offset or len(data) < offset + 1 + data[offset]:
+                raise ValueError("Truncated save.")
+            length = data[offset]
+            names.append(data[offset + 1:offset + 1 + length].decode())
+            offset += 1 + length
+        heights = [bin((mask1 | mask2) >> (col * Bitboard.HEIGHT) & Bitboard.COLUMN_MASK).count("1")
+                   for col in range(Bitboard.COLS)]
+        board = Bitboard((token1, token2), [mask1, mask2], heights).to_board()
+        return {"names": names, "tokens": [token1, token2], "ai": [bool(ai & 1), bool(ai & 2)], "turn": turn,
+                "board": board, "moves": moves, "saved": saved}
+
+    def save(self, game_id, state):
+        """
+        Saves a game, replacing any save with the same ID
 
-    def win_check(self, s):
+        Parameters:
+        game_id (str): Save ID
+        state (GameState): Game to save
         """
-        Checks the board for a winner:
-            four in a row, diagonal, or column
+        path = self.path(game_id)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(SaveStore.encode(state))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+    def load(self, game_id):
+        """
+        Loads a save
 
         Parameters:
-        s (list): Board being checked
+        game_id (str): Save ID
 
         Returns:
-        int: Token for the winner, if any
+        dict: The save as returned by decode, None if there is none or it expired
         """
-        # Horizontal Checks
-        for row in range(len(s)):
-            for col in range(len(s[0]) - 3):
-                if s[row][col] == s[row][col + 1] == s[row][col + 2] == s[row][col + 3] and s[row][col] != 0:
-                    return s[row][col]
-
-        # Vertical Checks
-        for y in range(len(s) - 3):
-            for z in range(len(s[0])):
-                if s[y][z] == s[y + 1][z] == s[y + 2][z] == s[y + 3][z] and s[y][z] != 0:
-                    return s[y][z]
-
-        # Two sets of Diagonal checks
-        for a in range(len(s) - 3):
-            for b in range(len(s[0]) - 3):
-                if s[a][b] == s[a + 1][b + 1] == s[a + 2][b + 2] == s[a + 3][b + 3] and s[a][b] != 0:
-                    return s[a][b]
-                elif s[a][6 - b] == s[a + 1][5 - b] == s[a + 2][4 - b] == s[a + 3][3 - b] and s[a][b] != 0:
-                    return s[a][b]
-        return False
+        try:
+            with open(self.path(game_id), "rb") as file:
+                record = SaveStore.decode(file.read())
+        except FileNotFoundError:
+            return None
+        if self.ttl is not None and time.time() - record["saved"] > self.ttl:
+            self.delete(game_id)
+            return None
+        return record
 
-    def count_score(self, s):
+    def delete(self, game_id):
         """
-        Custom heuristic function to evaluate moves based on AI and opponent move potential.
+        Deletes a save, if there is one
 
         Parameters:
-        s (list): Board to eval
-
-        Returns:
-        int: Potential score difference between player and AI
+        game_id (str): Save ID
         """
-        player1Score = 0
+        try:
+            os.remove(self.path(game_id))
+        except FileNotFoundError:
+            pass
+
+    def list(self):
+        """
+        Returns every save that has not expired, reading only the header of each
+
+        Returns:
+        list: (save ID, save time) pairs, most recent first
+        """
+        saves = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(SaveStore.EXTENSION):
+                continue
+            try:
+                with open(entry.path, "rb") as file:
+                    header = SaveStore.HEADER.unpack(file.read(SaveStore.HEADER.size))
+            except (FileNotFoundError, struct.error):
+                continue
+            if header[0] == SaveStore.MAGIC and (self.ttl is None or time.time() - header[2] <= self.ttl):
+                saves.append((entry.name[:-len(SaveStore.EXTENSION)], header[2]))
+        return sorted(saves, key=lambda save: save[1], reverse=True)
+
+    def expire(self, now=None):
+        """
+        Deletes the saves older than ttl
+
+        Parameters:
+        now (float, optional): Current time, defaults to time.time()
+
+        Returns:
+        int: Number of saves deleted
+        """
+        if self.ttl is None:
+            return 0
+        now = time.time() if now is None else now
+        deleted = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(SaveStore.EXTENSION):
+                continue
+            try:
+                with open(entry.path, "rb") as file:
+                    saved = SaveStore.HEADER.unpack(file.read(SaveStore.HEADER.size))[2]
+            except (FileNotFoundError, struct.error):
+                continue
+            if now - saved > self.ttl:
+                self.delete(entry.name[:-len(SaveStore.EXTENSION)])
+                deleted += 1
+        return deleted
+
+
+class GameArchive:
+    """
+    GameArchive class appends finished games to a compact binary file and streams them back
+
+    After an 8-byte file header, each game is one byte with its move count, one byte with its result, then
+    one byte per column played, first mover first. A typical game takes under 30 bytes, and games are
+    read through a memory map one at a time, so an archive never has to fit in memory. Each game is written
+    in one append when it ends, or is given up unfinished, rather than move by move, since the records of
+    games played at the same time would otherwise interleave. A game whose process dies is not recorded.
+
+    Attributes:
+        HEADER (struct.Struct): File header, magic and version
+        MAGIC (bytes): First bytes of every archive
+        VERSION (int): Archive layout version
+        UNFINISHED, FIRST, SECOND, DRAW (int): Result codes, FIRST and SECOND name the winner by move order
+        path (str): Archive file
+
+    Methods:
+        __init__(path): Names the archive, which is created by the first append
+        encode(moves, result): Packs one game
+        append(moves, result): Appends one game under an exclusive lock
+        record_game(state): Appends a finished GameState
+        records(start=None): Streams (offset, result, moves) for each game
+        read(offset): Reads the game at an offset
+        results(): Counts the games by result, skipping the moves
+        board(moves, ply=None, tokens=(1, 2)): Rebuilds the Board after any number of moves
+    """
+    HEADER = struct.Struct("<4sB3x")
+    MAGIC = b"C4GA"
+    VERSION = 1
+    UNFINISHED, FIRST, SECOND, DRAW = range(4)
+
+    def __init__(self, path):
+        """
+        Constructor for GameArchive Class
+
+        Parameters:
+        path (str): Archive file
+        """
+        self.path = path
+
+    @staticmethod
+    def encode(moves, result):
+        """
+        Packs one game
+
+        Parameters:
+        moves (list): 0-indexed columns played
+        result (int): One of the result codes
+
+        Returns:
+        bytes: The packed game
+
+        Raises:
+        ValueError: If there are more moves than cells or a column is off the board
+        """
+        if len(moves) > Bitboard.ROWS * Bitboard.COLS or any(not 0 <= col < Bitboard.COLS for col in moves):
+            raise ValueError("Moves do not fit on the board.")
+        return bytes((len(moves), result)) + bytes(moves)
+
+    def append(self, moves, result):
+        """
+        Appends one game in a single write under an exclusive lock, so games finishing in several processes
+        at once never interleave
+
+        Parameters:
+        moves (list): 0-indexed columns played
+        result (int): One of the result codes
+        """
+        record = GameArchive.encode(moves, result)
+        descriptor = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(descriptor, fcntl.LOCK_EX)
+            if os.fstat(descriptor).st_size == 0:
+                record = GameArchive.HEADER.pack(GameArchive.MAGIC, GameArchive.VERSION) + record
+            os.write(descriptor, record)
+        finally:
+            os.close(descriptor)
+
+    def record_game(self, state):
+        """
+        Appends a game that was played from the empty board
+
+        Parameters:
+        state (GameState): Game to record
+
+        Raises:
+        ValueError: If the game is not 6x7 connect-4 or did not start from the empty board, so its moves do not
+            rebuild it
+        """
+        if state.board.geometry is not Geometry.STANDARD:
+            raise ValueError("Only 6x7 connect-4 games can be archived.")
+        tokens = sum(cell != 0 for row in state.board.board for cell in row)
+        if tokens != len(state.moves):
+            raise ValueError("Only games played from the empty board can be archived.")
+        if state.winner is None:
+            result = GameArchive.DRAW if state.board.board_full() else GameArchive.UNFINISHED
+        else:
+            # The player who made the last move won, so count back to the first mover
+            result = GameArchive.FIRST if len(state.moves) % 2 else GameArchive.SECOND
+        self.append(state.moves, result)
+
+    def records(self, start=None):
+        """
+        Streams the games of the archive from a memory map
+
+        Parameters:
+        start (int, optional): Offset of the first game to read, defaults to the first game in the file
+
+        Returns:
+        generator: (offset, result, moves as bytes) for each game, nothing if the archive is missing or empty
+
+        Raises:
+        ValueError: If the file is not an archive
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version = GameArchive.HEADER.unpack_from(data)
+            if magic != GameArchive.MAGIC or version != GameArchive.VERSION:
+                raise ValueError(f"{self.path} is not a game archive.")
+            offset = GameArchive.HEADER.size if start is None else start
+            end = len(data)
+            while offset < end:
+                count = data[offset]
+                yield offset, data[offset + 1], data[offset + 2:offset + 2 + count]
+                offset += 2 + count
+
+    def read(self, offset):
+        """
+        Reads the game at an offset given by records
+
+        Parameters:
+        offset (int): Offset of the game
+
+        Returns:
+        tuple: (result, moves as bytes)
+        """
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            count, result = file.read(2)
+            return result, file.read(count)
+
+    def results(self):
+        """
+        Counts the games by result. Only the two header bytes of each game are read.
+
+        Returns:
+        dict: Result code to number of games, with "games" and "moves" totals, all 0 for a missing or empty archive
+        """
+        counts = {"games": 0, "moves": 0, GameArchive.UNFINISHED: 0, GameArchive.FIRST: 0, GameArchive.SECOND: 0,
+                  GameArchive.DRAW: 0}
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return counts
+        tally = [0] * 256
+        moves = 0
+        with open(self.path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset, end = GameArchive.HEADER.size, len(data)
+            while offset < end:
+                count = data[offset]
+                tally[data[offset + 1]] += 1
+                moves += count
+                offset += 2 + count
+        for result in range(4):
+            counts[result] = tally[result]
+        counts["games"] = sum(tally)
+        counts["moves"] = moves
+        return counts
+
+    @staticmethod
+    def board(moves, ply=None, tokens=(1, 2)):
+        """
+        Rebuilds the board of a game after any number of its moves
+
+        Parameters:
+        moves (bytes): Columns played, as given by records
+        ply (int, optional): Number of moves to replay, defaults to all of them
+        tokens (tuple, optional): Tokens of the first and second player
+
+        Returns:
+        Board: The board after ply moves
+        """
+        position = Bitboard(tokens)
+        for col in moves[:ply]:
+            position.play(col)
+        return Board("Old", position.to_board())
+
+
+# Zobrist keys for each player and cell, seeded so every process hashes positions the same way
+_zobrist_random = random.Random(0xC4)
+ZOBRIST = [[_zobrist_random.getrandbits(64) for bit in range(64)] for player in range(2)]
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
+
+
+def line_windows(rows=6, cols=7, connect=4):
+    """
+    Lists every line of connect cells on the board: horizontal, vertical, then both diagonals
+
+    Parameters:
+    rows (int): Number of rows
+    cols (int): Number of columns
+    connect (int): Tokens in a line needed to win
+
+    Returns:
+    list: Tuples of connect (row, col) pairs, row 0 at the top
+    """
+    span = connect - 1
+    windows = []
+    for row in range(rows):
+        for col in range(cols - span):
+            windows.append(tuple((row, col + i) for i in range(connect)))
+    for col in range(cols):
+        for row in range(rows - span):
+            windows.append(tuple((row + i, col) for i in range(connect)))
+    for row in range(rows - span):
+        for col in range(cols - span):
+            windows.append(tuple((row + i, col + i) for i in range(connect)))
+            windows.append(tuple((row + i, col + span - i) for i in range(connect)))
+    return windows
+
+
+class Geometry:
+    """
+    Geometry class holds a board size, the number of tokens in a line that wins, and every table that
+    depends on them
+
+    Geometries are built by get() and kept, so the line and window tables for a size are only worked out
+    the first time that size is used and every board, search and evaluator of that size shares them.
+
+    Attributes:
+        STANDARD (Geometry): The 6x7 connect-4 geometry, the only one the opening book, endgame solver, saves,
+            archives and position caches hold
+        geometries (dict): Every geometry built so far, keyed by (rows, cols, connect)
+        rows (int): Number of rows
+        cols (int): Number of columns
+        connect (int): Tokens in a line needed to win
+        height (int): Bits per column of a Bitboard mask, one more than rows so lines never wrap
+        bottom (int): Mask of the bottom cell of every column
+        column_mask (int): Mask of the cells of the first column
+        board_mask (int): Mask of every cell
+        shifts (tuple): Mask shifts that step along a column, a row and both diagonals
+        windows (list): Every line of connect cells as (row, col) pairs, see line_windows, 69 on a 6x7 board
+        flat_windows (list): The same windows as indexes into a board flattened row by row
+        bit_windows (list): The same windows as Bitboard cell indexes
+        line_masks (list): The same windows as Bitboard masks
+        cell_windows (list): For each Bitboard cell, the indexes of the windows through it
+        cell_lines (list): For each Bitboard cell, the masks of the windows through it
+        center_cols (tuple): Middle columns, which earn the center bonus in their bottom three rows
+        center (set): Bitboard cells that earn the center bonus
+        flat_center (list): The same cells as flat board indexes
+        center_order (tuple): Columns from the middle outwards
+        zobrist (list): Zobrist keys for each player and Bitboard cell
+
+    Methods:
+        __init__(rows=6, cols=7, connect=4): Works out the tables for a size, use get() instead
+        get(rows=6, cols=7, connect=4): Returns the shared geometry for a size
+        window_scores(weights): Returns the heuristic score of a window for each count of one player's tokens
+        is_win(mask): Checks a mask for connect tokens in a line
+        is_win_at(mask, cell): Checks only the lines through one cell of a mask
+        winning_cells(player, occupied): Returns the empty cells that would complete a line for a player
+        threats(current, occupied): Returns the cells the mover must block or must not play under
+        non_losing_moves(current, occupied): Returns the moves that do not lose on the next turn
+    """
+    geometries = {}
+
+    def __init__(self, rows=6, cols=7, connect=4):
+        """
+        Constructor for Geometry Class
+
+        Parameters:
+        rows (int, optional): Number of rows
+        cols (int, optional): Number of columns
+        connect (int, optional): Tokens in a line needed to win
+
+        Raises:
+        ValueError: If a size is below 1 or no line of connect cells fits on the board
+        """
+        if rows < 1 or cols < 1 or connect < 1:
+            raise ValueError("Rows, columns and the line length must be at least 1.")
+        if connect > max(rows, cols):
+            raise ValueError(f"A line of {connect} does not fit on a {rows}x{cols} board.")
+        self.rows, self.cols, self.connect = rows, cols, connect
+        self.height = rows + 1
+        # One bit at the bottom of every column: 1 + 2^height + 2^(2 * height) + ... as a geometric series
+        self.bottom = ((1 << (cols * self.height)) - 1) // ((1 << self.height) - 1)
+        self.column_mask = (1 << rows) - 1
+        self.board_mask = self.bottom * self.column_mask
+        self.shifts = (1, self.height, self.height - 1, self.height + 1)
+
+        cells = cols * self.height
+        self.windows = line_windows(rows, cols, connect)
+        self.flat_windows = [tuple(row * cols + col for row, col in window) for window in self.windows]
+        self.bit_windows = [tuple(col * self.height + rows - 1 - row for row, col in window)
+                            for window in self.windows]
+        self.line_masks = [sum(1 << cell for cell in window) for window in self.bit_windows]
+        self.cell_windows = [[] for cell in range(cells)]
+        self.cell_lines = [[] for cell in range(cells)]
+        for number, window in enumerate(self.bit_windows):
+            for cell in window:
+                self.cell_windows[cell].append(number)
+                self.cell_lines[cell].append(self.line_masks[number])
+        self.center_cols = tuple(range(max((cols - 1) // 2 - 1, 0), min(cols // 2 + 2, cols)))
+        self.center = {col * self.height + height for col in self.center_cols for height in range(min(rows, 3))}
+        self.flat_center = sorted((rows - 1 - cell % self.height) * cols + cell // self.height for cell in self.center)
+        self.center_order = tuple(sorted(range(cols), key=lambda col: abs(2 * col - (cols - 1))))
+        # The 6x7 board keeps the original keys, larger boards get a table of their own
+        if cells <= len(ZOBRIST[0]):
+            self.zobrist = ZOBRIST
+        else:
+            keys = random.Random(f"{rows}x{cols}")
+            self.zobrist = [[keys.getrandbits(64) for cell in range(cells)] for player in range(2)]
+
+    def __reduce__(self):
+        """
+        Pickles the geometry as its size, so another process looks it up or builds it with get()
+        """
+        return Geometry.get, (self.rows, self.cols, self.connect)
+
+    def __repr__(self):
+        return f"Geometry({self.rows}, {self.cols}, {self.connect})"
+
+    @classmethod
+    def get(cls, rows=6, cols=7, connect=4):
+        """
+        Returns the geometry for a size, building its tables the first time the size is asked for
+
+        Parameters:
+        rows (int, optional): Number of rows
+        cols (int, optional): Number of columns
+        connect (int, optional): Tokens in a line needed to win
+
+        Returns:
+        Geometry: The shared geometry
+
+        Raises:
+        ValueError: If the size is not playable, see __init__
+        """
+        size = (rows, cols, connect)
+        if size not in cls.geometries:
+            cls.geometries[size] = cls(rows, cols, connect)
+        return cls.geometries[size]
+
+    def window_scores(self, weights):
+        """
+        Returns the heuristic score of one window for each number of one player's tokens in it. A full window
+        scores the third weight, one token short the second and two short the first, as in count_score.
+
+        Parameters:
+        weights (tuple): Scores for two, three and four tokens in a window of four and for a center token
+
+        Returns:
+        tuple: connect + 1 scores, indexed by the number of tokens
+        """
+        scores = [0] * (self.connect + 1)
+        for missing, weight in enumerate(reversed(weights[:3])):
+            if self.connect - missing > 0:
+                scores[self.connect - missing] = weight
+        return tuple(scores)
+
+    def is_win(self, mask):
+        """
+        Checks a mask for connect tokens in a line, testing every window of the line index
+
+        Parameters:
+        mask (int): Bitmask of one player's tokens
+
+        Returns:
+        bool: True if the mask holds a full line in a row, column or diagonal
+        """
+        for line in self.line_masks:
+            if mask & line == line:
+                return True
+        return False
+
+    def is_win_at(self, mask, cell):
+        """
+        Checks a mask for a full line through one cell. After a move, only lines through the new token can
+        have been completed, so this agrees with is_win on the mover's mask while testing only the windows
+        through the cell, at most 13 on a 6x7 board.
+
+        Parameters:
+        mask (int): Bitmask of one player's tokens
+        cell (int): Bit index of the cell
+
+        Returns:
+        bool: True if a line through the cell is full
+        """
+        for line in self.cell_lines[cell]:
+            if mask & line == line:
+                return True
+        return False
+
+    def winning_cells(self, player, occupied):
+        """
+        Returns every empty cell that would complete a line for a player, playable now or not. Each direction
+        takes connect - 1 shifts of the mask each way, so this costs the same whatever the position.
+
+        Parameters:
+        player (int): Bitmask of the player's tokens
+        occupied (int): Bitmask of every token
+
+        Returns:
+        int: Bitmask of the winning cells
+        """
+        if self.connect == 4:
+            # Written out for four, sharing each pair of shifted masks between two patterns
+            cells = (player << 1) & (player << 2) & (player << 3)
+            for shift in self.shifts[1:]:
+                pairs = (player << shift) & (player << 2 * shift)
+                cells |= pairs & ((player << 3 * shift) | (player >> shift))
+                pairs = (player >> shift) & (player >> 2 * shift)
+                cells |= pairs & ((player << shift) | (player >> 3 * shift))
+            return cells & (self.board_mask ^ occupied)
+        span = self.connect - 1
+        # Vertical: only the cell on top of a run can be empty
+        cells = self.board_mask
+        for step in range(1, self.connect):
+            cells &= player << step
+        for shift in self.shifts[1:]:
+            # below[n] and above[n]: the player holds the n cells before, or after, a cell along the line
+            below, above = [self.board_mask], [self.board_mask]
+            for step in range(1, self.connect):
+                below.append(below[-1] & (player << step * shift))
+                above.append(above[-1] & (player >> step * shift))
+            for before in range(self.connect):
+                cells |= below[before] & above[span - before]
+        return cells & (self.board_mask ^ occupied)
+
+    def threats(self, current, occupied):
+        """
+        Finds what the opponent of the player to move threatens
+
+        Parameters:
+        current (int): Bitmask of the mover's tokens
+        occupied (int): Bitmask of every token
+
+        Returns:
+        tuple: (playable cells, playable cells the opponent wins on and the mover must block, playable cells right
+            under a cell the opponent wins on), as bitmasks
+        """
+        possible = (occupied + self.bottom) & self.board_mask
+        theirs = self.winning_cells(current ^ occupied, occupied)
+        return possible, theirs & possible, (theirs >> 1) & possible
+
+    def non_losing_moves(self, current, occupied):
+        """
+        Returns the playable cells that do not let the opponent win on their next move
+
+        Parameters:
+        current (int): Bitmask of the mover's tokens
+        occupied (int): Bitmask of every token
+
+        Returns:
+        int: Bitmask of the cells, 0 if every move loses
+        """
+        possible, blocks, unsafe = self.threats(current, occupied)
+        if blocks:
+            # Two threats at once cannot both be blocked
+            if blocks & (blocks - 1):
+                return 0
+            possible = blocks
+        # Never play right under a cell the opponent wins on
+        return possible & ~unsafe
+
+
+Geometry.STANDARD = Geometry.get()
+
+
+class Bitboard:
+    """
+    Bitboard class holds a compact position for the AI search
+
+    Each player's tokens are kept in one integer mask. Column c uses bits c * 7 to c * 7 + 5, bottom row
+    first, and the seventh bit of each column is left empty so shifted lines never wrap between columns.
+    Other board sizes use geometry.height bits per column in the same way.
+
+    Attributes:
+        ROWS, COLS, HEIGHT, BOTTOM, COLUMN_MASK, BOARD_MASK: The standard 6x7 layout, used by the fixed size
+            files and tables
+        geometry (Geometry): Board size and line length of the position, with its line tables
+        tokens (tuple): Tokens of the two players, index 0 and index 1
+        masks (list): Bitmask of occupied cells for each player
+        heights (list): Number of tokens stacked in each column
+        turn (int): Index of the player to move
+        moves (list): Stack of columns played on this position, most recent last
+        hash (int): Zobrist hash of the position, updated incrementally by play and undo
+        evaluator (Evaluator): Optional heuristic kept in step with play and undo, None by default
+
+    Methods:
+        from_board(board, tokens, turn=0, geometry=None): Builds a bitboard from a Board.board
+        to_board(): Returns the position as a list of lists
+        compute_hash(): Computes the Zobrist hash from scratch
+        copy(): Returns an independent copy of the position
+        can_play(col): Checks if the column has room for another token
+        valid_moves(): Returns the playable columns, left to right
+        play(col): Drops the current player's token into the column
+        undo(): Takes back the most recent move
+        threats(): Returns the columns that win at once, must be blocked, or let the opponent win above them
+        mask_columns(mask, geometry): Lists the columns that hold a cell of a mask
+        last_move_won(): Checks if the most recent move made a full line
+        winner(): Returns the token of the winner, if any
+        board_full(): Checks if every column is full
+        key(): Returns a hashable integer key for the position
+        mirror_mask(mask): Returns a 6x7 mask flipped left to right
+    """
+    ROWS = Geometry.STANDARD.rows
+    COLS = Geometry.STANDARD.cols
+    HEIGHT = Geometry.STANDARD.height
+    BOTTOM = Geometry.STANDARD.bottom
+    COLUMN_MASK = Geometry.STANDARD.column_mask
+    BOARD_MASK = Geometry.STANDARD.board_mask
+
+    def __init__(self, tokens, masks=None, heights=None, turn=0, moves=None, geometry=None):
+        """
+        Constructor for Bitboard Class
+
+        Parameters:
+        tokens (tuple): Tokens of the two players
+        masks (list, optional): Existing bitmask for each player
+        heights (list, optional): Existing column heights
+        turn (int, optional): Index of the player to move
+        moves (list, optional): Existing move stack
+        geometry (Geometry, optional): Board size and line length, 6x7 connect-4 if None
+        """
+        self.geometry = geometry if geometry is not None else Geometry.STANDARD
+        self.tokens = tuple(tokens)
+        self.masks = list(masks) if masks is not None else [0, 0]
+        self.heights = list(heights) if heights is not None else [0] * self.geometry.cols
+        self.turn = turn
+        self.moves = list(moves) if moves is not None else []
+        self.hash = self.compute_hash()
+        self.evaluator = None
+
+    @classmethod
+    def from_board(cls, board, tokens, turn=0, geometry=None):
+        """
+        Builds a bitboard from a list of lists
+
+        Parameters:
+        board (list): 2D board, row 0 at the top
+        tokens (tuple): Tokens of the two players
+        turn (int, optional): Index of the player to move
+        geometry (Geometry, optional): Board size and line length, 6x7 connect-4 if None
+
+        Returns:
+        Bitboard: The converted position
+
+        Raises:
+        ValueError: If the board is not the geometry's size or holds a token that belongs to neither player
+        """
+        geometry = geometry if geometry is not None else Geometry.STANDARD
+        rows, cols = geometry.rows, geometry.cols
+        if len(board) != rows or any(len(row) != cols for row in board):
+            raise ValueError(f"The board is not {rows}x{cols}.")
+        tokens = tuple(tokens)
+        masks = [0, 0]
+        heights = [0] * cols
+        for col in range(cols):
+            for height in range(rows):
+                cell = board[rows - 1 - height][col]
+                if cell == 0:
+                    continue
+                if cell not in tokens:
+                    raise ValueError(f"Token {cell} does not belong to either player.")
+                masks[tokens.index(cell)] |= 1 << (col * geometry.height + height)
+            # The lowest empty cell is where the next token lands
+            column = [board[rows - 1 - height][col] for height in range(rows)]
+            heights[col] = column.index(0) if 0 in column else rows
+        return cls(tokens, masks, heights, turn, geometry=geometry)
+
+    def to_board(self):
+        """
+        Converts the position back into a list of lists
+
+        Returns:
+        list: 2D board, row 0 at the top
+        """
+        geometry = self.geometry
+        board = [[0 for col in range(geometry.cols)] for row in range(geometry.rows)]
+        for index in range(2):
+            mask = self.masks[index]
+            for col in range(geometry.cols):
+                for height in range(geometry.rows):
+                    if mask >> (col * geometry.height + height) & 1:
+                        board[geometry.rows - 1 - height][col] = self.tokens[index]
+        return board
+
+    def compute_hash(self):
+        """
+        Computes the Zobrist hash of the position from scratch
+
+        Returns:
+        int: 64-bit Zobrist hash
+        """
+        value = ZOBRIST_SIDE if self.turn else 0
+        for index in range(2):
+            mask = self.masks[index]
+            while mask:
+                bit = mask & -mask
+                value ^= self.geometry.zobrist[index][bit.bit_length() - 1]
+                mask ^= bit
+        return value
+
+    def copy(self):
+        """
+        Returns an independent copy of the position, without an evaluator
+
+        Returns:
+        Bitboard: The copied position
+        """
+        return Bitboard(self.tokens, self.masks, self.heights, self.turn, self.moves, self.geometry)
+
+    def can_play(self, col):
+        """
+        Checks if a token can be dropped into a column
+
+        Parameters:
+        col (int): Column index, 0-indexed
+
+        Returns:
+        bool: True if the column is not full
+        """
+        geometry = self.geometry
+        playable = ((self.masks[0] | self.masks[1]) + geometry.bottom) & geometry.board_mask
+        return bool((playable >> (col * geometry.height)) & geometry.column_mask)
+
+    def valid_moves(self):
+        """
+        Returns every playable column
+
+        Returns:
+        list: Column indexes from left to right
+        """
+        # Adding the bottom row carries into the lowest empty cell of each column
+        geometry = self.geometry
+        playable = ((self.masks[0] | self.masks[1]) + geometry.bottom) & geometry.board_mask
+        height, column_mask = geometry.height, geometry.column_mask
+        return [col for col in range(geometry.cols) if (playable >> (col * height)) & column_mask]
+
+    def play(self, col):
+        """
+        Drops the current player's token into a column and passes the turn
+
+        Parameters:
+        col (int): Column index, 0-indexed
+        """
+        geometry = self.geometry
+        cell = col * geometry.height + self.heights[col]
+        self.masks[self.turn] |= 1 << cell
+        self.hash ^= geometry.zobrist[self.turn][cell] ^ ZOBRIST_SIDE
+        if self.evaluator is not None:
+            self.evaluator.add(cell, self.turn)
+        self.heights[col] += 1
+        self.turn ^= 1
+        self.moves.append(col)
+
+    def undo(self):
+        """
+        Takes back the most recent move and returns the turn to that player
+
+        Returns:
+        int: Column of the move taken back
+
+        Raises:
+        IndexError: If there is no move on the stack
+        """
+        col = self.moves.pop()
+        geometry = self.geometry
+        self.turn ^= 1
+        self.heights[col] -= 1
+        cell = col * geometry.height + self.heights[col]
+        self.masks[self.turn] ^= 1 << cell
+        self.hash ^= geometry.zobrist[self.turn][cell] ^ ZOBRIST_SIDE
+        if self.evaluator is not None:
+            self.evaluator.remove(cell, self.turn)
+        return col
+
+    def threats(self):
+        """
+        Finds the forcing columns of the position for the player to move: the moves that win at once, the
+        opponent's winning cells that are playable now and must be blocked, and the moves that would put a token
+        right under a cell the opponent wins on
+
+        Returns:
+        tuple: (wins, blocks, unsafe), three lists of columns, left to right
+        """
+        geometry = self.geometry
+        current = self.masks[self.turn]
+        occupied = self.masks[0] | self.masks[1]
+        possible, blocks, unsafe = geometry.threats(current, occupied)
+        wins = geometry.winning_cells(current, occupied) & possible
+        if wins:
+            return Bitboard.mask_columns(wins, geometry), [], []
+        return [], Bitboard.mask_columns(blocks, geometry), Bitboard.mask_columns(unsafe, geometry)
+
+    @staticmethod
+    def mask_columns(mask, geometry):
+        """
+        Lists the columns that hold a cell of a mask
+
+        Parameters:
+        mask (int): Bitmask of cells
+        geometry (Geometry): Layout of the mask
+
+        Returns:
+        list: Column indexes from left to right
+        """
+        columns = []
+        while mask:
+            bit = mask & -mask
+            col = (bit.bit_length() - 1) // geometry.height
+            if col not in columns:
+                columns.append(col)
+            mask ^= bit
+        return columns
+
+    def last_move_won(self):
+        """
+        Checks if the most recent move on the stack made a full line for the player who played it
+
+        Returns:
+        bool: True if the last move won, False if it did not or there is no move on the stack
+        """
+        if not self.moves:
+            return False
+        col = self.moves[-1]
+        geometry = self.geometry
+        return geometry.is_win_at(self.masks[self.turn ^ 1], col * geometry.height + self.heights[col] - 1)
+
+    def winner(self):
+        """
+        Returns the token of the winner, if any
+
+        Returns:
+        int: Token for the winner, False if there is none
+        """
+        for index in range(2):
+            if self.geometry.is_win(self.masks[index]):
+                return self.tokens[index]
+        return False
+
+    def board_full(self):
+        """
+        Checks if the board is full
+
+        Returns:
+        bool: True if Full, False if Not
+        """
+        return (self.masks[0] | self.masks[1]) == self.geometry.board_mask
+
+    def key(self):
+        """
+        Returns a hashable key that is unique to the position and the player to move
+
+        Returns:
+        int: Position key
+        """
+        # Player 0's tokens plus the occupied cells, offset by the bottom row, encode both masks at once
+        return ((self.masks[0] + (self.masks[0] | self.masks[1]) + self.geometry.bottom) << 1) | self.turn
+
+    @staticmethod
+    def mirror_mask(mask):
+        """
+        Flips a 6x7 mask left to right
+
+        Parameters:
+        mask (int): Bitmask of cells
+
+        Returns:
+        int: The mask with column c moved to column 6 - c
+        """
+        mirrored = 0
+        for col in range(Bitboard.COLS):
+            column = (mask >> (col * Bitboard.HEIGHT)) & Bitboard.COLUMN_MASK
+            mirrored |= column << ((Bitboard.COLS - 1 - col) * Bitboard.HEIGHT)
+        return mirrored
+
+
+class Evaluator:
+    """
+    Evaluator class keeps the count_score heuristic up to date as moves are made and undone
+
+    The evaluator holds how many tokens each player has in every window of the position's geometry along
+    with the running score, so reading the score of a leaf is O(1) and a move only touches the windows
+    through its cell.
+
+    Attributes:
+        WEIGHTS (tuple): count_score's weights, for two, three and four tokens in a window and a center token
+        cell_windows (list): For each bitboard cell, the indexes of the windows that pass through it
+        center (set): Bitboard cells that earn the bottom-middle bonus
+        gains (tuple): Score gained when a window goes from n to n + 1 tokens
+        center_bonus (int): Score for a token in the bottom-middle cells
+        counts (list): Tokens in each window, one list per player
+        score (int): Heuristic score, player 0 minus player 1
+
+    Methods:
+        __init__(position, weights=WEIGHTS): Counts every window of an existing Bitboard
+        add(cell, index): Updates the windows after player index takes a cell
+        remove(cell, index): Updates the windows after player index gives a cell back
+    """
+    WEIGHTS = (2, 5, 100, 2)
+
+    def __init__(self, position, weights=WEIGHTS):
+        """
+        Constructor for Evaluator Class
+
+        Parameters:
+        position (Bitboard): Position to count
+        weights (tuple, optional): Scores for two, three and four tokens in a window and for a center token
+        """
+        geometry = position.geometry
+        self.cell_windows = geometry.cell_windows
+        self.center = geometry.center
+        self.center_bonus = weights[3]
+        # The window weights as steps from n to n + 1 tokens
+        scores = geometry.window_scores(weights)
+        self.gains = tuple(scores[count + 1] - scores[count] for count in range(geometry.connect))
+        self.counts = [[0] * len(geometry.windows), [0] * len(geometry.windows)]
+        self.score = 0
+        for index in range(2):
+            mask = position.masks[index]
+            while mask:
+                bit = mask & -mask
+                self.add(bit.bit_length() - 1, index)
+                mask ^= bit
+
+    def add(self, cell, index):
+        """
+        Updates the windows after a player takes a cell
+
+        Parameters:
+        cell (int): Bitboard cell index
+        index (int): Player index, 0 scores positive and 1 negative
+        """
+        counts = self.counts[index]
+        gains = self.gains
+        gain = self.center_bonus if cell in self.center else 0
+        for window in self.cell_windows[cell]:
+            count = counts[window]
+            gain += gains[count]
+            counts[window] = count + 1
+        self.score += -gain if index else gain
+
+    def remove(self, cell, index):
+        """
+        Updates the windows after a player gives a cell back
+
+        Parameters:
+        cell (int): Bitboard cell index
+        index (int): Player index, 0 scores positive and 1 negative
+        """
+        counts = self.counts[index]
+        gains = self.gains
+        loss = self.center_bonus if cell in self.center else 0
+        for window in self.cell_windows[cell]:
+            count = counts[window] - 1
+            loss += gains[count]
+            counts[window] = count
+        self.score -= -loss if index else loss
+
+
+class BatchEvaluator:
+    """
+    BatchEvaluator class scores a whole stack of positions with count_score's heuristic in one NumPy call
+
+    Every window is gathered at once through a precomputed index tensor, (69, 4) on a 6x7 board, so the
+    cost of the Python call is paid once per batch instead of once per leaf. Needs NumPy.
+
+    Attributes:
+        geometry (Geometry): Board size and line length of the positions
+        window_index (numpy.ndarray): Flat board index of every window cell, shape (windows, connect)
+        bit_index (numpy.ndarray): Bitboard cell of every flat board index, shape (rows * cols,)
+        center (numpy.ndarray): Flat board indexes of the bottom-middle cells
+        window_scores (numpy.ndarray): Window score for 0 to connect tokens of one player
+        center_bonus (int): Score for a token in the bottom-middle cells
+
+    Methods:
+        __init__(weights=Evaluator.WEIGHTS, geometry=None): Builds the index tensors
+        scores(boards, token, other): Scores a (N, rows, cols) stack of boards
+        scores_from_masks(masks): Scores packed bitboards, one pair of masks per position
+    """
+    def __init__(self, weights=Evaluator.WEIGHTS, geometry=None):
+        """
+        Constructor for BatchEvaluator Class
+
+        Parameters:
+        weights (tuple, optional): Scores for two, three and four tokens in a window and for a center token
+        geometry (Geometry, optional): Board size and line length, 6x7 connect-4 if None
+
+        Raises:
+        ImportError: If NumPy is not installed
+        """
+        if numpy is None:
+            raise ImportError("NumPy is needed for batched evaluation.")
+        self.geometry = geometry = geometry if geometry is not None else Geometry.STANDARD
+        rows, cols = geometry.rows, geometry.cols
+        self.center_bonus = weights[3]
+        self.window_scores = numpy.array(geometry.window_scores(weights), dtype=numpy.int64)
+        self.window_index = numpy.array(geometry.flat_windows, dtype=numpy.intp)
+        self.bit_index = numpy.array([col * geometry.height + rows - 1 - row
+                                      for row in range(rows) for col in range(cols)], dtype=numpy.uint64)
+        self.center = numpy.array(geometry.flat_center, dtype=numpy.intp)
+
+    def scores(self, boards, token, other):
+        """
+        Scores a stack of boards
+
+        Parameters:
+        boards (array_like): Boards of shape (N, rows, cols), row 0 at the top
+        token (int): Token that scores positive
+        other (int): Token that scores negative
+
+        Returns:
+        numpy.ndarray: N scores, equal to count_score for each board
+        """
+        flat = numpy.asarray(boards).reshape(-1, self.geometry.rows * self.geometry.cols)
+        return self.score_cells(flat == token, flat == other)
+
+    def scores_from_masks(self, masks):
+        """
+        Scores packed bitboards
+
+        Parameters:
+        masks (array_like): Shape (N, 2), Bitboard.masks of each position
+
+        Returns:
+        numpy.ndarray: N scores, player 0 minus player 1
+        """
+        size = self.geometry.cols * self.geometry.height
+        if size > 64:
+            # Masks wider than a uint64 are unpacked from their bytes instead of shifted
+            width = (size + 7) // 8
+            data = b"".join(mask.to_bytes(width, "little") for pair in masks for mask in pair)
+            bits = numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8), bitorder="little")
+            cells = bits.reshape(-1, 2, width * 8)[:, :, self.bit_index.astype(numpy.intp)]
+        else:
+            masks = numpy.asarray(masks, dtype=numpy.uint64)
+            cells = (masks[:, :, None] >> self.bit_index) & numpy.uint64(1)
+        return self.score_cells(cells[:, 0].astype(bool), cells[:, 1].astype(bool))
+
+    def score_cells(self, mine, theirs):
+        """
+        Scores boards given as two (N, rows * cols) boolean cell arrays, one per player
+
+        Returns:
+        numpy.ndarray: N scores
+        """
+        mine_counts = mine[:, self.window_index].sum(axis=2)
+        theirs_counts = theirs[:, self.window_index].sum(axis=2)
+        score = self.window_scores[mine_counts].sum(axis=1) - self.window_scores[theirs_counts].sum(axis=1)
+        center = mine[:, self.center].sum(axis=1) - theirs[:, self.center].sum(axis=1)
+        return score + self.center_bonus * center
+
+
+class TranspositionTable:
+    """
+    TranspositionTable class remembers positions the AI has already searched
+
+    Entries are keyed by Zobrist hash and kept in buckets of two slots. The first slot prefers the deepest
+    search of the current generation, the second slot is always replaced, so shallow results never push out
+    expensive ones and recent results are still kept.
+
+    Attributes:
+        EXACT (int): Flag for a score that is exact
+        LOWER (int): Flag for a score that is a lower bound (the search failed high)
+        UPPER (int): Flag for a score that is an upper bound (the search failed low)
+        size (int): Maximum number of entries
+        buckets (int): Number of two-slot buckets
+        generation (int): Search counter, bumped once per AI move
+        deep (list): Depth-preferred slot of each bucket
+        recent (list): Always-replace slot of each bucket
+
+    Methods:
+        __init__(size): Initializes an empty table holding at most size entries
+        new_search(): Starts a new generation so entries from older moves can be replaced first
+        probe(key): Looks up a position
+        store(key, depth, score, flag, move): Saves a search result
+        clear(): Empties the table
+        __len__(): Returns the number of filled slots
+    """
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    def __init__(self, size=1 << 18):
+        """
+        Constructor for TranspositionTable Class
+
+        Parameters:
+        size (int): Maximum number of entries, split across the two slots of each bucket
+        """
+        self.size = size
+        self.buckets = size // 2
+        self.generation = 0
+        self.clear()
+
+    def new_search(self):
+        """
+        Starts a new generation. Entries from earlier generations lose their claim on the deep slot.
+        """
+        self.generation += 1
+
+    def probe(self, key):
+        """
+        Looks up a position
+
+        Parameters:
+        key (int): Zobrist hash of the position
+
+        Returns:
+        tuple: (key, depth, score, flag, move, generation), or None if the position is not stored
+        """
+        if not self.buckets:
+            return None
+        index = key % self.buckets
+        entry = self.deep[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.recent[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        """
+        Saves a search result, replacing whichever slot the policy allows
+
+        Parameters:
+        key (int): Zobrist hash of the position
+        depth (int): Depth the position was searched to
+        score (int): Score found by the search
+        flag (int): EXACT, LOWER or UPPER
+        move (int): Best column found, or None
+        """
+        if not self.buckets:
+            return
+        index = key % self.buckets
+        entry = (key, depth, score, flag, move, self.generation)
+        current = self.deep[index]
+        if current is None or current[0] == key or current[5] != self.generation or depth >= current[1]:
+            if current is not None and current[0] != key:
+                self.recent[index] = current
+            self.deep[index] = entry
+        else:
+            self.recent[index] = entry
+
+    def clear(self):
+        """
+        Empties the table
+        """
+        self.deep = [None] * self.buckets
+        self.recent = [None] * self.buckets
+
+    def __len__(self):
+        """Returns the number of filled slots"""
+        return sum(entry is not None for entry in self.deep) + sum(entry is not None for entry in self.recent)
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """
+    SharedTranspositionTable class is a TranspositionTable that several processes can use at once
+
+    The buckets live in a multiprocessing.shared_memory block, two 16-byte slots each. A slot holds the
+    entry packed into one 64-bit word plus the key XORed with that word. Readers unpack the slot and check
+    that the XOR gives back their key, so a slot torn by two processes writing at once is read as a miss
+    instead of as a wrong entry, and no lock is needed.
+
+    Attributes:
+        SLOT (struct.Struct): Layout of one slot, checked key then packed entry
+        memory (SharedMemory): Shared block holding the buckets
+        buf (memoryview): Buffer the slots are read from and written to
+        base (int): Byte offset of the first bucket in buf
+        name (str): Name other processes attach to the block with
+
+    Methods:
+        __init__(size, name=None, generation=0): Creates a new block, or attaches to an existing one by name
+        __reduce__(): Lets the table be sent to another process, which attaches to the same block
+        probe(key): Looks up a position
+        store(key, depth, score, flag, move): Saves a search result
+        clear(): Empties the table
+        close(): Detaches this process from the block
+        unlink(): Frees the block once every process has closed it
+    """
+    SLOT = struct.Struct("<QQ")
+
+    def __init__(self, size=1 << 18, name=None, generation=0):
+        """
+        Constructor for SharedTranspositionTable Class
+
+        Parameters:
+        size (int): Maximum number of entries, split across the two slots of each bucket
+        name (str, optional): Name of an existing block to attach to, a new block is created if None
+        generation (int, optional): Generation to start from, so attached processes agree with the creator
+        """
+        self.size = size
+        self.buckets = size // 2
+        self.generation = generation
+        length = max(self.buckets, 1) * 2 * SharedTranspositionTable.SLOT.size
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=length)
+            self.memory.buf[:length] = bytes(length)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.buf = self.memory.buf
+        self.base = 0
+
+    def __reduce__(self):
+        """Processes that receive the table attach to the same block"""
+        return SharedTranspositionTable, (self.size, self.name, self.generation)
+
+    @staticmethod
+    def pack(depth, score, flag, move, generation):
+        """
+        Packs an entry into one 64-bit word. The score is offset so the word is never 0, which marks an empty slot.
+
+        Returns:
+        int: Packed entry
+        """
+        return ((score + (1 << 31)) | depth << 32 | flag << 40 | (255 if move is None else move) << 48
+                | (generation & 255) << 56)
+
+    def read(self, offset):
+        """
+        Reads and unpacks a slot
+
+        Parameters:
+        offset (int): Byte offset of the slot
+
+        Returns:
+        tuple: (key, depth, score, flag, move, generation), or None if the slot is empty
+        """
+        check, data = SharedTranspositionTable.SLOT.unpack_from(self.buf, offset)
+        if not data:
+            return None
+        move = data >> 48 & 255
+        return (check ^ data, data >> 32 & 255, (data & 0xFFFFFFFF) - (1 << 31), data >> 40 & 255,
+                None if move == 255 else move, data >> 56)
+
+    def probe(self, key):
+        """
+        Looks up a position
+
+        Parameters:
+        key (int): Zobrist hash of the position
+
+        Returns:
+        tuple: (key, depth, score, flag, move, generation), or None if the position is not stored
+        """
+        if not self.buckets:
+            return None
+        offset = self.base + key % self.buckets * 2 * SharedTranspositionTable.SLOT.size
+        for slot in (offset, offset + SharedTranspositionTable.SLOT.size):
+            entry = self.read(slot)
+            if entry is not None and entry[0] == key:
+                return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        """
+        Saves a search result, replacing whichever slot the policy allows
+
+        Parameters:
+        key (int): Zobrist hash of the position
+        depth (int): Depth the position was searched to
+        score (int): Score found by the search
+        flag (int): EXACT, LOWER or UPPER
+        move (int): Best column found, or None
+        """
+        if not self.buckets:
+            return
+        slot_size = SharedTranspositionTable.SLOT.size
+        offset = self.base + key % self.buckets * 2 * slot_size
+        data = SharedTranspositionTable.pack(depth, score, flag, move, self.generation)
+        current = self.read(offset)
+        if (current is None or current[0] == key or current[5] != self.generation & 255
+                or depth >= current[1]):
+            if current is not None and current[0] != key:
+                self.buf[offset + slot_size:offset + 2 * slot_size] = self.buf[offset:offset + slot_size]
+            SharedTranspositionTable.SLOT.pack_into(self.buf, offset, key ^ data, data)
+        else:
+            SharedTranspositionTable.SLOT.pack_into(self.buf, offset + slot_size, key ^ data, data)
+
+    def clear(self):
+        """
+        Empties the table
+        """
+        self.buf[self.base:] = bytes(len(self.buf) - self.base)
+
+    def close(self):
+        """
+        Detaches this process from the shared block
+        """
+        self.buf.release()
+        self.memory.close()
+
+    def unlink(self):
+        """
+        Frees the shared block. Only the process that created it should call this.
+        """
+        self.memory.unlink()
+
+    def __len__(self):
+        """Returns the number of filled slots"""
+        slot_size = SharedTranspositionTable.SLOT.size
+        return sum(self.read(offset) is not None
+                   for offset in range(self.base, self.base + self.buckets * 2 * slot_size, slot_size))
+
+
+class DiskTranspositionTable(SharedTranspositionTable):
+    """
+    DiskTranspositionTable class keeps searched positions in a memory-mapped file that outlives the process
+
+    The file is a small header followed by the same two-slot buckets as SharedTranspositionTable, so any
+    number of game processes and tournament workers can map it at once. Their writes merge through the
+    depth-preferred replacement policy, and the XOR check turns a slot torn by two writers into a miss.
+    The header records the heuristic weights, since scores from different weights cannot be mixed.
+
+    Attributes:
+        HEADER (struct.Struct): File header, magic, version, bucket count and heuristic weights
+        MAGIC (bytes): First bytes of every cache file
+        VERSION (int): File layout version
+        path (str): Cache file
+        weights (tuple): Heuristic weights the cached scores were found with
+
+    Methods:
+        __init__(path, size=1 << 18, weights=Evaluator.WEIGHTS): Opens the cache file, creating it if needed
+        create(path, size, weights): Writes an empty cache file atomically
+        new_search(): Does nothing, entries from every process and every run are equally current
+        entries(): Yields every stored entry
+        close(): Flushes and closes the cache file
+        unlink(): Does nothing, the cache file is kept
+        compact(path, size=None, min_depth=0): Rewrites a cache file, dropping shallow entries or resizing it
+    """
+    HEADER = struct.Struct("<4sH2xI4i4x")
+    MAGIC = b"C4TT"
+    VERSION = 1
+
+    def __init__(self, path, size=1 << 18, weights=Evaluator.WEIGHTS):
+        """
+        Constructor for DiskTranspositionTable Class
+
+        Parameters:
+        path (str): Cache file
+        size (int, optional): Entry cap used if the file has to be created, an existing file keeps its size
+        weights (tuple, optional): Heuristic weights of the AI, None to accept the weights in the file
+
+        Raises:
+        ValueError: If the file is not a cache file or was written with other weights
+        """
+        self.path = path
+        if not os.path.exists(path):
+            DiskTranspositionTable.create(path, size, Evaluator.WEIGHTS if weights is None else weights)
+        self.file = open(path, "r+b")
+        self.buf = mmap.mmap(self.file.fileno(), 0)
+        magic, version, buckets, *stored = DiskTranspositionTable.HEADER.unpack_from(self.buf, 0)
+        if magic != DiskTranspositionTable.MAGIC or version != DiskTranspositionTable.VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a position cache file.")
+        if weights is not None and tuple(stored) != tuple(weights):
+            self.close()
+            raise ValueError(f"{path} was written with weights {tuple(stored)}, not {tuple(weights)}.")
+        self.weights = tuple(stored)
+        self.base = DiskTranspositionTable.HEADER.size
+        self.buckets = buckets
+        self.size = buckets * 2
+        self.generation = 0
+
+    @staticmethod
+    def create(path, size, weights):
+        """
+        Writes an empty cache file under a temporary name and links it into place, so a process that opens
+        the file never sees it half written, and two processes creating it at once end up with one file
+
+        Parameters:
+        path (str): Cache file
+        size (int): Entry cap
+        weights (tuple): Heuristic weights to record
+        """
+        buckets = max(size // 2, 1)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(DiskTranspositionTable.HEADER.pack(DiskTranspositionTable.MAGIC, DiskTranspositionTable.VERSION,
+                                                          buckets, *weights))
+            file.truncate(DiskTranspositionTable.HEADER.size + buckets * 2 * SharedTranspositionTable.SLOT.size)
+        try:
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+
+    def __reduce__(self):
+        """Processes that receive the table open the same file"""
+        return DiskTranspositionTable, (self.path, self.size, self.weights)
+
+    def new_search(self):
+        """
+        Does nothing. Entries from every process and every run are equally current, so the deep slot is
+        only ever given up to a deeper search.
+        """
+
+    def entries(self):
+        """
+        Yields every stored entry
+
+        Returns:
+        generator: (key, depth, score, flag, move, generation) tuples
+        """
+        slot_size = SharedTranspositionTable.SLOT.size
+        for offset in range(self.base, self.base + self.buckets * 2 * slot_size, slot_size):
+            entry = self.read(offset)
+            if entry is not None:
+                yield entry
+
+    def close(self):
+        """
+        Flushes and closes the cache file
+        """
+        self.buf.flush()
+        self.buf.close()
+        self.file.close()
+
+    def unlink(self):
+        """
+        Does nothing, the cache file is kept for the next run
+        """
+
+    @staticmethod
+    def compact(path, size=None, min_depth=0):
+        """
+        Rewrites a cache file without its shallow entries, optionally at a new size. Deeper entries are
+        written last so they win any bucket they share. Run it while no process has the file open, since
+        writes to the old file are lost once it is replaced.
+
+        Parameters:
+        path (str): Cache file
+        size (int, optional): New entry cap, defaults to the current one
+        min_depth (int, optional): Entries searched to less than this depth are dropped
+
+        Returns:
+        tuple: (entries kept, entries dropped)
+
+        Raises:
+        ValueError: If there is no cache file at path
+        """
+        if not os.path.exists(path):
+            raise ValueError(f"{path} does not exist.")
+        old = DiskTranspositionTable(path, weights=None)
+        entries = list(old.entries())
+        kept = sorted((entry for entry in entries if entry[1] >= min_depth), key=lambda entry: entry[1])
+        temporary = f"{path}.compact"
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        new = DiskTranspositionTable(temporary, size or old.size, old.weights)
+        for key, depth, score, flag, move, generation in kept:
+            new.store(key, depth, score, flag, move)
+        stored = len(new)
+        new.close()
+        old.close()
+        os.replace(temporary, path)
+        return stored, len(entries) - stored
+
+
+class OpeningBook:
+    """
+    OpeningBook class serves precomputed opening moves from a memory-mapped file
+
+    The file is a table of fixed-size records sorted by position key: key, score and best column. It is
+    opened with mmap and searched with a binary search, so nothing is loaded up front and processes that
+    open the same file share its pages. Positions are stored from the point of view of the player to move,
+    and only the smaller of a position and its mirror image is stored.
+
+    Attributes:
+        RECORD (struct.Struct): Layout of one record, key, score and column
+        path (str): Book file
+        count (int): Number of positions in the book
+
+    Methods:
+        __init__(path): Opens and memory-maps a book file
+        key(position): Returns the book key of a position and whether it was mirrored
+        lookup(position): Returns the book column and score for a position, if any
+        close(): Closes the book file
+        build(path, plies=6, depth=12, workers=None): Searches every position up to plies and writes a book
+    """
+    RECORD = struct.Struct("<QiB3x")
+
+    def __init__(self, path):
+        """
+        Constructor for OpeningBook Class
+
+        Parameters:
+        path (str): Book file written by OpeningBook.build
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // OpeningBook.RECORD.size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @staticmethod
+    def key(position):
+        """
+        Returns the book key of a position: the mover's tokens plus the occupied cells, offset by the bottom
+        row, for whichever of the position and its mirror image gives the smaller key
+
+        Parameters:
+        position (Bitboard): Position to look up
+
+        Returns:
+        tuple: (key, True if the key belongs to the mirror image)
+        """
+        mover = position.masks[position.turn]
+        occupied = position.masks[0] | position.masks[1]
+        key = mover + occupied + Bitboard.BOTTOM
+        mirrored = Bitboard.mirror_mask(mover) + Bitboard.mirror_mask(occupied) + Bitboard.BOTTOM
+        return (key, False) if key <= mirrored else (mirrored, True)
+
+    def lookup(self, position):
+        """
+        Looks up a position with a binary search over the mapped records
+
+        Parameters:
+        position (Bitboard): Position to look up
+
+        Returns:
+        tuple: (column, score for the player to move), or None if the position is not in the book
+        """
+        key, mirrored = OpeningBook.key(position)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            found, score, col = OpeningBook.RECORD.unpack_from(self.map, middle * OpeningBook.RECORD.size)
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return (Bitboard.COLS - 1 - col if mirrored else col), score
+        return None
+
+    def close(self):
+        """
+        Closes the book file
+        """
+        if self.count:
+            self.map.close()
+        self.file.close()
+
+    @staticmethod
+    def build(path, plies=6, depth=12, workers=None):
+        """
+        Searches every position reachable in up to plies moves and writes the results as a book
+
+        Parameters:
+        path (str): Book file to write, replaced atomically
+        plies (int, optional): Deepest opening move to store
+        depth (int, optional): Search depth for every position
+        workers (int, optional): Size of the process pool, defaults to one per CPU
+
+        Returns:
+        int: Number of positions written
+        """
+        positions = {}
+        frontier = [Bitboard((1, 2))]
+        for ply in range(plies + 1):
+            children = []
+            for position in frontier:
+                key, mirrored = OpeningBook.key(position)
+                if key in positions:
+                    continue
+                # Search the position with the mover's tokens at index 0, in the orientation that gives the key
+                mover, other = position.masks[position.turn], position.masks[position.turn ^ 1]
+                if mirrored:
+                    mover, other = Bitboard.mirror_mask(mover), Bitboard.mirror_mask(other)
+                positions[key] = (mover, other)
+                if ply < plies:
+                    for col in position.valid_moves():
+                        child = position.copy()
+                        child.play(col)
+                        if not child.last_move_won():
+                            children.append(child)
+            frontier = children
+
+        jobs = [(key, mover, other, depth) for key, (mover, other) in positions.items()]
+        with multiprocessing.Pool(workers) as pool:
+            records = sorted(pool.imap_unordered(book_entry, jobs, chunksize=16))
+        with open(path + ".tmp", "wb") as file:
+            for key, score, col in records:
+                file.write(OpeningBook.RECORD.pack(key, score, col))
+        os.replace(path + ".tmp", path)
+        return len(records)
+
+
+class EndgameSolver:
+    """
+    EndgameSolver class finds the exact result of a position by searching to the end of the game
+
+    Scores count how early the game is decided: a win on the mover's own last token scores 1, a win one
+    token earlier scores 2 and so on, losses are negative and a draw is 0. The solver is a negamax that
+    narrows in on the score with null-window searches, and it only searches moves that do not hand the
+    opponent an immediate win, tries moves that create the most threats first, and keeps upper bounds in
+    a transposition table. Its threat masks are worked out for 6x7 connect-4 positions only.
+
+    Attributes:
+        CELLS (int): Cells on the board
+        size (int): Entry cap for the table, which is emptied when it fills
+        table (dict): Upper bound on the score of each position searched, keyed by position
+        nodes (int): Positions visited since the solver was built
+        stop (callable): Checked every 1024 nodes, the solve is abandoned when it returns True, None to never stop
+
+    Methods:
+        __init__(size=1 << 20, stop=None): Initializes an empty solver
+        winning_cells(player, occupied): Returns the empty cells that would complete four for a player
+        non_losing_moves(current, occupied): Returns the moves that do not lose on the next turn
+        solve(position): Returns the exact score for the player to move
+        best_move(position): Returns an optimal column with its exact score
+        negamax(current, occupied, moves, alpha, beta): Null-window negamax search
+    """
+    CELLS = Bitboard.ROWS * Bitboard.COLS
+
+    def __init__(self, size=1 << 20, stop=None):
+        """
+        Constructor for EndgameSolver Class
+
+        Parameters:
+        size (int, optional): Entry cap for the transposition table
+        stop (callable, optional): Returns True when the solve has to be abandoned, such as AI.out_of_time
+        """
+        self.size = size
+        self.table = {}
+        self.nodes = 0
+        self.stop = stop
+
+    @staticmethod
+    def winning_cells(player, occupied):
+        """
+        Returns every empty cell that would complete four in a line for a player, see Geometry.winning_cells
+
+        Parameters:
+        player (int): Bitmask of the player's tokens
+        occupied (int): Bitmask of every token
+
+        Returns:
+        int: Bitmask of the winning cells, playable now or not
+        """
+        return Geometry.STANDARD.winning_cells(player, occupied)
+
+    @staticmethod
+    def non_losing_moves(current, occupied):
+        """
+        Returns the playable cells that do not let the opponent win on their next move, see
+        Geometry.non_losing_moves
+
+        Parameters:
+        current (int): Bitmask of the mover's tokens
+        occupied (int): Bitmask of every token
+
+        Returns:
+        int: Bitmask of the cells, 0 if every move loses
+        """
+        return Geometry.STANDARD.non_losing_moves(current, occupied)
+
+    def solve(self, position):
+        """
+        Returns the exact score of a position for the player to move
+
+        Parameters:
+        position (Bitboard): Position to solve
+
+        Returns:
+        int: Positive if the mover wins, negative if the mover loses, 0 for a draw
+
+        Raises:
+        SearchTimeout: If stop returns True
+        """
+        current = position.masks[position.turn]
+        occupied = position.masks[0] | position.masks[1]
+        moves = bin(occupied).count("1")
+        possible = (occupied + Bitboard.BOTTOM) & Bitboard.BOARD_MASK
+        if EndgameSolver.winning_cells(current, occupied) & possible:
+            return (EndgameSolver.CELLS + 1 - moves) // 2
+
+        low = -((EndgameSolver.CELLS - moves) // 2)
+        high = (EndgameSolver.CELLS + 1 - moves) // 2
+        while low < high:
+            # Null-window probes, biased towards 0 since most positions are close to a draw
+            middle = low + (high - low) // 2
+            if middle <= 0 and int(low / 2) < middle:
+                middle = int(low / 2)
+            elif middle >= 0 and int(high / 2) > middle:
+                middle = int(high / 2)
+            score = self.negamax(current, occupied, moves, middle, middle + 1)
+            if score <= middle:
+                high = score
+            else:
+                low = score
+        return low
+
+    def best_move(self, position):
+        """
+        Returns an optimal move
+
+        Parameters:
+        position (Bitboard): Position to solve, the game must not be over
+
+        Returns:
+        tuple: (column, exact score for the player to move)
+
+        Raises:
+        SearchTimeout: If stop returns True, the position is left as it was
+        """
+        best_col, best = None, None
+        for col in [col for col in AI.CENTER_ORDER if col in position.valid_moves()]:
+            position.play(col)
+            try:
+                if position.last_move_won():
+                    score = (EndgameSolver.CELLS + 2 - sum(position.heights)) // 2
+                elif position.board_full():
+                    score = 0
+                else:
+                    score = -self.solve(position)
+            finally:
+                position.undo()
+            if best is None or score > best:
+                best_col, best = col, score
+        return best_col, best
+
+    def negamax(self, current, occupied, moves, alpha, beta):
+        """
+        Negamax with alpha-beta pruning over the mover's mask and the occupied mask. The mover must not be
+        able to win with their next move.
+
+        Parameters:
+        current (int): Bitmask of the mover's tokens
+        occupied (int): Bitmask of every token
+        moves (int): Tokens on the board
+        alpha (int): Lower bound of the window
+        beta (int): Upper bound of the window
+
+        Returns:
+        int: Exact score if inside the window, otherwise a bound on the side it fell
+
+        Raises:
+        SearchTimeout: If stop returns True
+        """
+        self.nodes += 1
+        if not self.nodes & 1023 and self.stop is not None and self.stop():
+            raise SearchTimeout()
+        candidates = EndgameSolver.non_losing_moves(current, occupied)
+        if not candidates:
+            return -((EndgameSolver.CELLS - moves) // 2)
+        if moves >= EndgameSolver.CELLS - 2:
+            return 0
+
+        # The opponent cannot win on their next move, so the mover cannot lose sooner than that
+        low = -((EndgameSolver.CELLS - 2 - moves) // 2)
+        if alpha < low:
+            alpha = low
+            if alpha >= beta:
+                return alpha
+        key = current + occupied
+        high = self.table.get(key, (EndgameSolver.CELLS - 1 - moves) // 2)
+        if beta > high:
+            beta = high
+            if alpha >= beta:
+                return beta
+
+        # Moves that leave the most winning cells behind go first, center columns break ties
+        ordered = []
+        for col in AI.CENTER_ORDER:
+            move = candidates & (Bitboard.COLUMN_MASK << (col * Bitboard.HEIGHT))
+            if move:
+                threats = bin(EndgameSolver.winning_cells(current | move, occupied)).count("1")
+                ordered.append((-threats, len(ordered), move))
+        ordered.sort()
+
+        for _, _, move in ordered:
+            score = -self.negamax(current ^ occupied, occupied | move, moves + 1, -beta, -alpha)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+
+        if len(self.table) >= self.size:
+            self.table.clear()
+        self.table[key] = alpha
+        return alpha
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time budget for a move runs out
+    """
+
+
+class SearchStats:
+    """
+    SearchStats class records what one AI move cost and where the work went
+
+    The search bumps plain integer counters and list slots in place, so the stats are cheap enough to keep
+    on during play. Each move's stats can be written out as one JSON log line.
+
+    Attributes:
+        source (str): Where the move came from, "search", "parallel", "forced", "book" or "endgame"
+        move (int): Column played, None if there was none
+        score (int): Score returned with the move
+        depth (int): Deepest completed search iteration
+        seconds (float): Wall time of the whole move
+        nodes (list): Positions visited at each ply from the root
+        leaves (int): Heuristic evaluations at the search horizon
+        cutoffs (list): Beta cutoffs, counted by the position in move order of the move that caused them
+        tt_probes (int): Transposition table lookups
+        tt_hits (int): Lookups that found an entry for the position
+        tt_cutoffs (int): Hits whose stored bound settled the node without searching it
+        solver_nodes (int): Positions visited by the exact endgame solver
+        forced_nodes (int): Positions settled by threat analysis without searching their moves
+        pruned_moves (int): Moves skipped by threat analysis because they lose at once or leave a win unblocked
+        researches (int): Null-window searches of principal variation search that failed high and were searched again
+        aspiration_fails (int): Iterations whose score fell outside the aspiration window and were searched again
+        pondered (bool): True if the move was found while the opponent was thinking and answered at once
+        iterations (list): (depth, seconds, nodes) as each search iteration finished
+
+    Methods:
+        __init__(source="search", geometry=None): Initializes empty counters
+        total_nodes(): Returns the positions visited at every ply
+        record_iteration(depth, seconds): Records a finished search iteration
+        branching_factor(): Returns the effective branching factor
+        merge(other): Adds the counters of another process's stats
+        to_dict(): Returns the stats as a dict of plain values
+        log_line(): Returns the stats as one line of JSON
+    """
+    def __init__(self, source="search", geometry=None):
+        """
+        Constructor for SearchStats Class
+
+        Parameters:
+        source (str, optional): Where the move came from
+        geometry (Geometry, optional): Board size of the search, which sizes the counters, 6x7 if None
+        """
+        geometry = geometry if geometry is not None else Geometry.STANDARD
+        self.source = source
+        self.move = None
+        self.score = None
+        self.depth = 0
+        self.seconds = 0.0
+        self.nodes = [0] * (geometry.rows * geometry.cols + 2)
+        self.leaves = 0
+        self.cutoffs = [0] * geometry.cols
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.solver_nodes = 0
+        self.forced_nodes = 0
+        self.pruned_moves = 0
+        self.researches = 0
+        self.aspiration_fails = 0
+        self.pondered = False
+        self.iterations = []
+
+    def total_nodes(self):
+        """
+        Returns the positions visited at every ply
+
+        Returns:
+        int: Node count
+        """
+        return sum(self.nodes)
+
+    def record_iteration(self, depth, seconds):
+        """
+        Records a finished search iteration
+
+        Parameters:
+        depth (int): Depth of the iteration
+        seconds (float): Time since the move started
+        """
+        self.iterations.append((depth, seconds, self.total_nodes()))
+        self.depth = max(self.depth, depth)
+
+    def branching_factor(self):
+        """
+        Returns the effective branching factor: how many times more nodes the last iteration took than the
+        one before it, or the depth-th root of the node count if there was a single iteration
+
+        Returns:
+        float: Effective branching factor, None if nothing was searched
+        """
+        counts = [nodes for depth, seconds, nodes in self.iterations]
+        if len(counts) >= 3 and counts[-2] > counts[-3]:
+            return (counts[-1] - counts[-2]) / (counts[-2] - counts[-3])
+        if self.depth and self.total_nodes():
+            return self.total_nodes() ** (1 / self.depth)
+        return None
+
+    def merge(self, other):
+        """
+        Adds the counters of another process's stats, keeping this one's move, depth and iterations
+
+        Parameters:
+        other (SearchStats): Stats to add
+        """
+        self.nodes = [mine + theirs for mine, theirs in zip(self.nodes, other.nodes)]
+        self.cutoffs = [mine + theirs for mine, theirs in zip(self.cutoffs, other.cutoffs)]
+        self.leaves += other.leaves
+        self.tt_probes += other.tt_probes
+        self.tt_hits += other.tt_hits
+        self.tt_cutoffs += other.tt_cutoffs
+        self.solver_nodes += other.solver_nodes
+        self.forced_nodes += other.forced_nodes
+        self.pruned_moves += other.pruned_moves
+        self.researches += other.researches
+        self.aspiration_fails += other.aspiration_fails
+
+    def to_dict(self):
+        """
+        Returns the stats as a dict of plain values
+
+        Returns:
+        dict: Every counter along with the rates derived from them
+        """
+        nodes_per_ply = list(self.nodes)
+        while nodes_per_ply and not nodes_per_ply[-1]:
+            nodes_per_ply.pop()
+        branching = self.branching_factor()
+        return {"source": self.source, "move": self.move, "score": self.score, "depth": self.depth,
+                "seconds": round(self.seconds, 6), "nodes": self.total_nodes(), "nodes_per_ply": nodes_per_ply,
+                "nps": round(self.total_nodes() / self.seconds) if self.seconds else 0, "leaves": self.leaves,
+                "cutoffs": sum(self.cutoffs), "cutoffs_by_move": self.cutoffs,
+                "first_move_cutoffs": self.cutoffs[0] / sum(self.cutoffs) if sum(self.cutoffs) else None,
+                "tt_probes": self.tt_probes, "tt_hits": self.tt_hits, "tt_cutoffs": self.tt_cutoffs,
+                "tt_hit_rate": self.tt_hits / self.tt_probes if self.tt_probes else None,
+                "branching_factor": None if branching is None else round(branching, 3),
+                "solver_nodes": self.solver_nodes, "forced_nodes": self.forced_nodes,
+                "pruned_moves": self.pruned_moves, "researches": self.researches,
+                "aspiration_fails": self.aspiration_fails, "pondered": self.pondered,
+                "iterations": [[depth, round(seconds, 6), nodes] for depth, seconds, nodes in self.iterations]}
+
+    def log_line(self):
+        """
+        Returns the stats as one line of JSON
+
+        Returns:
+        str: Compact JSON object without a trailing newline
+        """
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+
+class AI(Player):
+    '''
+    """
+    AI class for automated ConnectFour Moves
+
+    AI uses a minimax algorithm with alpha-beta pruning, based on a custom heuristic function
+    to determine optimal moves.
+
+    Attributes:
+        human_token (int): Token for opponent
+        token (int): AI's Token (1)
+        name (str): AI name (AI)
+        table (TranspositionTable): Searched positions, kept across moves of the same game
+        best_move (int): Best column found by the latest search
+        depth (int): Search depth for fixed-depth moves
+        time_budget (int): Milliseconds per move, None to search to a fixed depth instead
+        completed_depth (int): Deepest iteration finished by the latest timed search
+        stats (SearchStats): Counters for the latest move
+        stats_log (str): File that gets one JSON line of stats per move, None for no log
+        nodes (int): Positions visited by the latest search
+        deadline (float): perf_counter time at which the running search stops, None for no limit
+        ordering (set): Move ordering heuristics in use, any of ORDERINGS
+        killers (list): Two moves per ply that last caused a beta cutoff, reset every search
+        history (list): Cutoff counts per player and column, kept across searches
+        center_order (tuple): Column order used by the center heuristic
+        weights (tuple): Heuristic weights handed to the Evaluator
+        batch (BatchEvaluator): Scores each depth-1 frontier as one NumPy batch, None to score leaves one by one
+        book (OpeningBook): Opening moves played without searching, None for no book
+        endgame_threshold (int): Below this many empty cells, moves come from the exact EndgameSolver
+        solver (EndgameSolver): Exact solver, kept across moves
+        cache (str): File of a DiskTranspositionTable used as the transposition table, None to keep it in memory
+        endgame_score (int): Exact score of the latest solved move, None if the move was searched
+        workers (int): Processes used by choose_move, more than 1 runs a Lazy SMP search
+        stop_event (Event): When set, the running search stops as if its deadline had passed
+        worker_errors (list): Why Lazy SMP workers of the latest parallel search failed, empty if none did
+        geometry (Geometry): Board size and line length the AI plays on
+        forcing (bool): Plays forced moves without searching, and has the search settle forced positions and skip
+            moves that lose at once
+        pvs (bool): Searches with principal variation search in negamax form instead of plain alpha-beta
+        aspiration (int): Half width of the window around the previous iteration's score when pvs is set
+        ponder_thread (Thread): Thread searching the answers to the opponent's moves, None when not pondering
+        ponder_root (int): Bitboard key of the position being pondered, with the opponent to move
+        pondered (dict): Moves found by pondering, by position key, time budget and depth
+
+    Methods:
+        transpose(s): Transposes the board to check moves
+        valid_moves(s): Returns a list of valid moves for AI
+        switch_nested_values(nested_lists): Switches column and row values for valid move checking
+        win_check(s): Checks the board for a winner (horizontal, vertical, or diagonal)
+        count_score(s): Evaluates the game board with heuristic and returns a score difference
+        token: Getter and setter for the AI's token, which is not taken from Player.available_tokens
+        choose_move(board, player_bool): Answers a pondered position at once, or finds the move and records its
+            stats
+        find_move(board, player_bool, parallel=True): Plays a book move, solves the endgame, or searches with the
+            time budget or fixed depth
+        ponder(board): Starts finding the answers to the opponent's moves in a background thread
+        stop_pondering(): Stops the pondering thread and waits for it
+        ponder_replies(position): Body of the pondering thread
+        minimax(board, depth, alpha, beta, player_bool): Implements the minimax algorithm with alpha-beta pruning
+        timed_search(board, budget, player_bool, max_depth=None): Iterative deepening within a time budget
+        parallel_search(board, player_bool, depth=None, budget=None): Lazy SMP search over several processes
+        out_of_time(): Checks the deadline and the stop event
+        close(): Frees the shared transposition table, if the AI has one
+        start_search(): Resets the per-search state before a new move
+        order_moves(possibles, side, ply, tt_move=None): Sorts columns so the likeliest cutoffs come first
+        record_cutoff(col, side, ply, depth): Updates killer and history tables after a beta cutoff
+        forced_move(position): Returns the move threat analysis leaves no choice about, if there is one
+        prune_threats(position, possibles, ply): Settles or narrows a position with threat analysis
+        search_frontier(position, ply, possibles): Scores every child of a depth-1 node in one batch
+        search(position, depth, alpha, beta, ply=0): Alpha-beta search that makes and undoes moves on a Bitboard
+        root_search(position, depth, alpha, beta): Runs search or pvs_search from the root
+        aspiration_search(position, depth, guess): Searches within a window around guess, widening it on a miss
+        pvs_search(position, depth, alpha, beta, ply=0): Principal variation search in negamax form
+    """
+    '''
+    ORDERINGS = ("center", "tt", "killer", "history")
+    CENTER_ORDER = Geometry.STANDARD.center_order
+    ASPIRATION = 20
+    WORKER_GRACE = 5.0
+
+    def __init__(self, name, token, human, table_size=1 << 18, depth=5, time_budget=None, ordering=ORDERINGS,
+                 workers=1, weights=Evaluator.WEIGHTS, batch_leaves=False, book=None, endgame_threshold=16,
+                 cache=None, stats_log=None, geometry=None, forcing=True, pvs=False, aspiration=ASPIRATION):
+        """
+        AI Class Initialization, Inheritance of Player attributes
+
+        Parameters:
+        name (str): AI name (AI)
+        token (int): AI token (1)
+        human (int): Human token used for minimax algorithm
+        table_size (int, optional): Entry cap for the transposition table, 0 to turn it off
+        depth (int, optional): Search depth when there is no time budget
+        time_budget (int, optional): Milliseconds per move for iterative deepening
+        ordering (iterable, optional): Move ordering heuristics to use, any of ORDERINGS
+        workers (int, optional): Search processes per move, the table is put in shared memory if more than 1
+        weights (tuple, optional): Heuristic weights, see Evaluator.WEIGHTS
+        batch_leaves (bool, optional): Score depth-1 frontiers with a BatchEvaluator, needs NumPy
+        book (OpeningBook, optional): Opening book to play from before searching
+        endgame_threshold (int, optional): Empty cell count below which moves are solved exactly, 0 to never solve
+        cache (str, optional): Cache file shared with other processes and later runs, see DiskTranspositionTable
+        stats_log (str, optional): File to append the stats of every move to, as JSON lines
+        geometry (Geometry, optional): Board size and line length, 6x7 connect-4 if None. Other sizes play
+            without the opening book, position cache or endgame solver
+        forcing (bool, optional): Use threat analysis to play forced moves at once and prune the search
+        pvs (bool, optional): Use principal variation search, with aspiration windows when deepening iteratively
+        aspiration (int, optional): Half width of the aspiration window
+
+        Raises:
+        ValueError: If a book or cache is given for a board other than 6x7 connect-4
+        """
+        self.geometry = geometry if geometry is not None else Geometry.STANDARD
+        standard = self.geometry is Geometry.STANDARD
+        if not standard and (book is not None or cache is not None):
+            raise ValueError("The opening book and position cache only hold 6x7 connect-4 positions.")
+        super().__init__(name, token)
+        self.human_token = human
+        self.workers = workers
+        self.weights = tuple(weights)
+        self.cache = cache
+        if cache is not None:
+            self.table = DiskTranspositionTable(cache, table_size, self.weights)
+        elif workers > 1:
+            self.table = SharedTranspositionTable(table_size)
+        else:
+            self.table = TranspositionTable(table_size)
+        self.best_move = None
+        self.depth = depth
+        self.time_budget = time_budget
+        self.completed_depth = 0
+        self.stats = SearchStats(geometry=self.geometry)
+        self.stats_log = stats_log
+        self.nodes = 0
+        self.deadline = None
+        self.ordering = set(ordering)
+        self.killers = [[None, None] for ply in range(self.geometry.rows * self.geometry.cols + 1)]
+        self.history = [[0] * self.geometry.cols, [0] * self.geometry.cols]
+        self.center_order = self.geometry.center_order
+        self.stop_event = None
+        self.worker_errors = []
+        self.batch = BatchEvaluator(self.weights, self.geometry) if batch_leaves else None
+        self.book = book
+        self.endgame_threshold = endgame_threshold
+        # The solver stops with the search, so a pondered solve never holds up the opponent's move
+        self.solver = EndgameSolver(stop=self.out_of_time) if standard else None
+        self.endgame_score = None
+        self.forcing = forcing
+        self.pvs = pvs
+        self.aspiration = aspiration
+        self.ponder_thread = None
+        self.ponder_root = None
+        self.pondered = {}
+
+    @property
+    def token(self):
+        """Getter for Token"""
+        return self._token
+
+    @token.setter
+    def token(self, token_num):
+        """
+        Setter for token. Search workers and benchmarks build many AIs, so the AI's token is not
+        removed from Player.available_tokens.
+
+        Parameters:
+        token_num (int): Token number for the AI
+
+        Raises:
+        ValueError: If token is 0
+        """
+        if token_num == 0:
+            raise ValueError("Please input a one number token that is not 0.\n")
+        self._token = token_num
+
+    def transpose(self, s):
+        """
+        Transposes a 2D array for move checking
+
+        Parameters:
+        s (list): Board to transpose
+
+        Returns:
+        list: 2D transposed array
+        """
+        return [[s[j][i] for j in range(len(s))] for i in range(len(s[0]))]
+
+    def valid_moves(self, s):
+        """
+        Checks for valid moves in each column of the board.
+
+        Parameters:
+        s (list): 2D board to check for moves
+
+        Returns:
+        list: List of possible moves, each represented by a list of coordinates [col, row]
+        """
+        new_s = self.transpose(s)
+        possible_moves = []
+        for col in range(len(new_s)):
+            for row in range(len(new_s[0]) - 1, -1, -1):
+                if new_s[col][row] == 0:
+                    possible_moves.append([col, row])
+                    break
+        self.switch_nested_values(possible_moves)
+        return possible_moves
+
+    def switch_nested_values(self, nested_lists):
+        """
+        Switches the values from col, row to row, col to be implemented onto board
+
+        Parameters:
+        nested_lists (list): List of pairs to switch
+        """
+        for nested_list in nested_lists:
+            nested_list[0], nested_list[1] = nested_list[1], nested_list[0]
+
+    def win_check(self, s):
+        """
+        Checks the board for a winner:
+            a full row, diagonal, or column
+
+        Parameters:
+        s (list): Board being checked
+
+        Returns:
+        int: Token for the winner, if any
+        """
+        cells = [cell for row in s for cell in row]
+        for window in self.geometry.flat_windows:
+            first = cells[window[0]]
+            if first != 0 and all(cells[index] == first for index in window):
+                return first
+        return False
+
+    def count_score(self, s):
+        """
+        Custom heuristic function to evaluate moves based on AI and opponent move potential. This is the
+        reference the incremental Evaluator and the BatchEvaluator agree with, using the same weights.
+
+        Parameters:
+        s (list): Board to eval
+
+        Returns:
+        int: Potential score difference between player and AI
+        """
+        window_scores = self.geometry.window_scores(self.weights)
+        cells = [cell for row in s for cell in row]
+        player1Score = 0
         player2Score = 0
-        # Check horizontally
-        for row in range(len(s)):
-            for col in range(len(s[0]) - 3):
-                if s[row][col:col + 4].count([self.token]) == 4:
-                    player1Score += 100
-                elif s[row][col:col + 4].count([self.token]) == 3:
-                    player1Score += 5
-                elif s[row][col:col + 4].count([self.token]) == 2:
-                    player1Score += 2
-                if s[row][col:col + 4].count([self.human_token]) == 4:
-                    player2Score += 100
-                elif s[row][col:col + 4].count([self.human_token]) == 3:
-                    player2Score += 5
-                elif s[row][col:col + 4].count([self.human_token]) == 2:
-                    player2Score += 2
-
-        # Check vertically
-        for col in range(len(s[0])):
-            for row in range(len(s) - 3):
-                if [s[row + i][col] for i in range(4)].count([self.token]) == 4:
-                    player1Score += 100
-                elif [s[row + i][col] for i in range(4)].count([self.token]) == 3:
-                    player1Score += 5
-                elif [s[row + i][col] for i in range(4)].count([self.token]) == 2:
-                    player1Score += 2
-                if [s[row + i][col] for i in range(4)].count([self.human_token]) == 4:
-                    player2Score += 100
-                elif [s[row + i][col] for i in range(4)].count([self.human_token]) == 3:
-                    player2Score += 5
-                elif [s[row + i][col] for i in range(4)].count([self.human_token]) == 2:
-                    player2Score += 2
-
-        # Check diagonally
-        for row in range(len(s) - 3):
-            for col in range(len(s[0]) - 3):
-                if [s[row + i][col + i] for i in range(4)].count([self.token]) == 4:
-                    player1Score += 100
-                elif [s[row + i][col + i] for i in range(4)].count([self.token]) == 3:
-                    player1Score += 5
-                elif [s[row + i][col + i] for i in range(4)].count([self.token]) == 2:
-                    player1Score += 2
-                if [s[row + i][col + i] for i in range(4)].count([self.human_token]) == 4:
-                    player2Score += 100
-                elif [s[row + i][col + i] for i in range(4)].count([self.human_token]) == 3:
-                    player2Score += 5
-                elif [s[row + i][col + i] for i in range(4)].count([self.human_token]) == 2:
-                    player2Score += 2
-                if [s[row + i][col + 3 - i] for i in range(4)].count([self.token]) == 4:
-                    player1Score += 100
-                elif [s[row + i][col + 3 - i] for i in range(4)].count([self.token]) == 3:
-                    player1Score += 5
-                elif [s[row + i][col + 3 - i] for i in range(4)].count([self.token]) == 2:
-                    player1Score += 2
-                if [s[row + i][col + 3 - i] for i in range(4)].count([self.human_token]) == 4:
-                    player2Score += 100
-                elif [s[row + i][col + 3 - i] for i in range(4)].count([self.human_token]) == 3:
-                    player2Score += 5
-                elif [s[row + i][col + 3 - i] for i in range(4)].count([self.human_token]) == 2:
-                    player2Score += 2
-
-        for rows in range(3, 6):
-            for cols in range(2, 5):
-                if s[rows][cols] == self.human_token:
-                    player2Score += 2
-                elif s[rows][cols] == self.token:
-                    player1Score += 2
+        # Every row, column and diagonal window, scored by how many tokens each player has in it
+        for window in self.geometry.flat_windows:
+            tokens = [cells[index] for index in window]
+            player1Score += window_scores[tokens.count(self.token)]
+            player2Score += window_scores[tokens.count(self.human_token)]
+
+        for index in self.geometry.flat_center:
+            if cells[index] == self.human_token:
+                player2Score += self.weights[3]
+            elif cells[index] == self.token:
+                player1Score += self.weights[3]
 
         return player1Score - player2Score
 
+    def choose_move(self, board, player_bool):
+        """
+        Picks a move. Any pondering is stopped first, and a position it already answered is played at once
+        with the stats of the search that found it. Otherwise the move comes from find_move. The move's stats
+        are kept in stats and appended to stats_log if it is set.
+
+        Parameters:
+        board (list): The current game board.
+        player_bool (bool): True if it is the AI's turn, False if it is the player's turn.
+
+        Returns:
+        list: The chosen move as [row, col], 0-indexed, along with the score.
+        """
+        start = time.perf_counter()
+        position = Bitboard.from_board(board, (self.token, self.human_token), 0 if player_bool else 1, self.geometry)
+        self.stop_pondering()
+        pondered = self.pondered.get((position.key(), self.time_budget, self.depth))
+        self.pondered = {}
+        if pondered is not None:
+            result, self.stats, self.best_move, self.endgame_score = pondered
+            self.stats.pondered = True
+            self.nodes = self.stats.total_nodes()
+        else:
+            result = self.find_move(board, player_bool)
+
+        self.stats.move = self.best_move
+        self.stats.score = result[1]
+        self.stats.seconds = time.perf_counter() - start
+        if self.stats_log is not None:
+            with open(self.stats_log, "a") as file:
+                file.write(self.stats.log_line() + "\n")
+        return result
+
+    def find_move(self, board, player_bool, parallel=True):
+        """
+        Finds a move. A move that wins at once, the only block of an opponent's win, or the only move that
+        does not hand the opponent a win is played without searching. Positions in the opening book are
+        answered from the book, positions with fewer than endgame_threshold empty cells are solved exactly,
+        and the rest are searched within time_budget if one is set and to the fixed depth otherwise. With a
+        time budget, a solve that takes more than half of it is given up and the position searched instead.
+
+        Parameters:
+        board (list): The current game board.
+        player_bool (bool): True if it is the AI's turn, False if it is the player's turn.
+        parallel (bool, optional): Run a Lazy SMP search if workers is more than 1, pondering searches in its
+            own thread instead
+
+        Returns:
+        list: The chosen move as [row, col], 0-indexed, along with the score.
+
+        Raises:
+        SearchTimeout: If stop_event is set during a fixed-depth search or an endgame solve
+        """
+        position = Bitboard.from_board(board, (self.token, self.human_token), 0 if player_bool else 1, self.geometry)
+        rows = self.geometry.rows
+        self.endgame_score = None
+        empty = rows * self.geometry.cols - sum(position.heights)
+        entry = self.book.lookup(position) if self.book is not None else None
+        forced = self.forced_move(position) if self.forcing and empty and not position.winner() else None
+        if forced is not None:
+            self.stats = SearchStats("forced", self.geometry)
+            col, score = forced
+            self.best_move = col
+            if score is None:
+                # Nothing is settled yet, so the move gets the heuristic score of the position it leads to
+                position.play(col)
+                score = Evaluator(position, self.weights).score
+                position.undo()
+            else:
+                # Settled scores belong to the player to move
+                score = score if player_bool else -score
+            result = [rows - 1 - position.heights[col], col], score
+        elif self.solver is not None and 0 < empty < self.endgame_threshold and not position.winner():
+            start = time.perf_counter()
+            solved = self.solver.nodes
+            # With a time budget the solver gets half of it, and if it runs out the search gets the rest
+            self.deadline = start + self.time_budget / 2000 if self.time_budget else None
+            try:
+                col, self.endgame_score = self.solver.best_move(position)
+            except SearchTimeout:
+                # Only a budget that ran out falls back to the search, a stopped move stays stopped
+                if self.deadline is None or (self.stop_event is not None and self.stop_event.is_set()):
+                    raise
+                col = None
+            finally:
+                self.deadline = None
+            if col is None:
+                remaining = self.time_budget - (time.perf_counter() - start) * 1000
+                result = self.timed_search(board, max(remaining, 0), player_bool)
+                self.stats.solver_nodes = self.solver.nodes - solved
+            else:
+                self.stats = SearchStats("endgame")
+                self.stats.solver_nodes = self.solver.nodes - solved
+                self.best_move = col
+                # Searches score a win as 99999 for the AI, so solved results use the same scale
+                score = 99999 if self.endgame_score > 0 else -99999 if self.endgame_score < 0 else 0
+                result = [rows - 1 - position.heights[col], col], (score if player_bool else -score)
+        elif entry is not None:
+            self.stats = SearchStats("book")
+            col, score = entry
+            self.best_move = col
+            # Book scores belong to the player to move
+            result = [rows - 1 - position.heights[col], col], (score if player_bool else -score)
+        elif self.workers > 1 and parallel:
+            if self.time_budget:
+                result = self.parallel_search(board, player_bool, budget=self.time_budget)
+            else:
+                result = self.parallel_search(board, player_bool, depth=self.depth)
+        elif self.time_budget:
+            result = self.timed_search(board, self.time_budget, player_bool)
+        else:
+            result = self.minimax(board, self.depth, -99999, 99999, player_bool)
+        return result
+
+    def ponder(self, board):
+        """
+        Starts finding the AI's answer to each move the opponent can make, in a background thread that shares the
+        transposition table, while the opponent thinks. The move the AI's last search expected is tried first,
+        then the rest from the center out. Calling it again for the position already being pondered does nothing.
+
+        Parameters:
+        board (list): Board with the opponent to move, copied before the thread starts
+        """
+        position = Bitboard.from_board(board, (self.token, self.human_token), 1, self.geometry)
+        if self.ponder_thread is not None and self.ponder_root == position.key():
+            return
+        self.stop_pondering()
+        self.pondered = {}
+        self.ponder_root = position.key()
+        self.stop_event = threading.Event()
+        self.ponder_thread = threading.Thread(target=self.ponder_replies, args=(position,), daemon=True)
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        """
+        Stops the pondering thread, if there is one, and waits for it. The search it is in the middle of is
+        thrown away and the answers it finished are kept in pondered.
+        """
+        if self.ponder_thread is None:
+            return
+        self.stop_event.set()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        self.ponder_root = None
+        self.stop_event = None
+
+    def ponder_replies(self, position):
+        """
+        Body of the pondering thread: finds the answer to each of the opponent's moves and keeps it in pondered,
+        under the time budget and depth the thread started with, until every move is answered, stop_event is
+        set, or the budget or depth is changed
+
+        Parameters:
+        position (Bitboard): Position with the opponent to move, owned by the thread
+        """
+        stop = self.stop_event
+        settings = self.time_budget, self.depth
+        entry = self.table.probe(position.hash)
+        replies = [col for col in self.center_order if position.can_play(col)]
+        if entry is not None and entry[4] in replies:
+            replies.remove(entry[4])
+            replies.insert(0, entry[4])
+        for col in replies:
+            position.play(col)
+            over = position.last_move_won() or position.board_full()
+            board, key = position.to_board(), position.key()
+            position.undo()
+            if over:
+                continue
+            try:
+                result = self.find_move(board, True, parallel=False)
+            except SearchTimeout:
+                return
+            # A timed search that was stopped returns its last finished depth, which is not the move it would play
+            if stop.is_set() or (self.time_budget, self.depth) != settings:
+                return
+            self.pondered[(key,) + settings] = result, self.stats, self.best_move, self.endgame_score
+
     def minimax(self, board, depth, alpha, beta, player_bool):
         """
         Minimax algorithm with alpha-beta pruning to choose the best move for the AI.
 
+        The board is converted to a Bitboard once. The search then makes and undoes moves on that one
+        working position instead of copying it for every child. Results are kept in the transposition
+        table, which lives as long as the AI does, so each move reuses the work of the previous ones.
+
         Parameters:
         board (list): The current game board.
         depth (int): The search depth for the minimax algorithm.
@@ -750,45 +3536,651 @@ class AI(Player):
         Returns:
         list: The optimal move for the AI along with the score.
         """
-        possibles = self.valid_moves(board)
-        # Base Case
-        if depth == 0 or self.win_check(board):
-            if self.win_check(board):
-                if self.win_check(board) == self.token:
-                    return [None, 99999]
-                elif self.win_check(board) == self.human_token:
-                    return [None, -99999]
+        position = Bitboard.from_board(board, (self.token, self.human_token), 0 if player_bool else 1, self.geometry)
+        position.evaluator = Evaluator(position, self.weights)
+        self.start_search()
+        start = time.perf_counter()
+        value = self.root_search(position, depth, alpha, beta)
+        self.stats.record_iteration(depth, time.perf_counter() - start)
+        if self.best_move is None:
+            return [None, value]
+        return [self.geometry.rows - 1 - position.heights[self.best_move], self.best_move], value
+
+    def timed_search(self, board, budget, player_bool, max_depth=None):
+        """
+        Iterative deepening: searches depth 1, 2, 3 and so on until the time budget runs out.
+
+        Each iteration tries the previous iteration's best move first, and with pvs set it searches a window
+        around the previous iteration's score first. When the deadline passes in the
+        middle of an iteration, that iteration is thrown away and the last completed one is used. Depth 1
+        always completes, so there is always a move to return.
+
+        Parameters:
+        board (list): The current game board.
+        budget (int): Time budget in milliseconds.
+        player_bool (bool): True if it is the AI's turn, False if it is the player's turn.
+        max_depth (int, optional): Deepest iteration to run, defaults to the number of empty cells
+
+        Returns:
+        list: The optimal move for the AI along with the score.
+        """
+        position = Bitboard.from_board(board, (self.token, self.human_token), 0 if player_bool else 1, self.geometry)
+        position.evaluator = Evaluator(position, self.weights)
+        empty = self.geometry.rows * self.geometry.cols - sum(position.heights)
+        max_depth = empty if max_depth is None else min(max_depth, empty)
+        self.start_search()
+        self.completed_depth = 0
+        start = time.perf_counter()
+        deadline = start + budget / 1000
+        best, value = None, self.search(position, 0, -99999, 99999)
+
+        for depth in range(1, max_depth + 1):
+            self.deadline = deadline if depth > 1 else None
+            try:
+                if self.pvs:
+                    score = self.aspiration_search(position, depth, value)
                 else:
-                    return [None, self.count_score(board)]
-            else:
-                return [None, self.count_score(board)]
+                    score = self.search(position, depth, -99999, 99999)
+            except SearchTimeout:
+                break
+            finally:
+                self.deadline = None
+            best, value = self.best_move, score
+            self.completed_depth = depth
+            self.stats.record_iteration(depth, time.perf_counter() - start)
+            # A forced result will not change with more depth
+            if abs(score) >= 99999 or time.perf_counter() >= deadline:
+                break
+
+        self.best_move = best
+        if best is None:
+            return [None, value]
+        # An abandoned iteration leaves moves on the working position, so count heights on a fresh one
+        heights = Bitboard.from_board(board, (self.token, self.human_token), geometry=self.geometry).heights
+        return [self.geometry.rows - 1 - heights[best], best], value
+
+    def parallel_search(self, board, player_bool, depth=None, budget=None):
+        """
+        Lazy SMP: runs workers processes on the same root, sharing one transposition table.
+
+        With a depth, the first worker to finish its search gives the move and the rest are stopped. With a
+        time budget, every worker runs until the deadline and the deepest completed search gives the move.
+        A worker that raises, dies without reporting, or has not reported WORKER_GRACE seconds after the budget
+        is over is given up on, and if no worker finished the move is searched in this process instead.
+
+        Parameters:
+        board (list): The current game board.
+        player_bool (bool): True if it is the AI's turn, False if it is the player's turn.
+        depth (int, optional): Depth to search to
+        budget (int, optional): Time budget in milliseconds, used when depth is None
+
+        Returns:
+        list: The optimal move for the AI along with the score.
+        """
+        if not isinstance(self.table, SharedTranspositionTable):
+            self.table = SharedTranspositionTable(self.table.size)
+        self.table.new_search()
+        context = multiprocessing.get_context()
+        stop = context.Event()
+        results = context.Queue()
+        settings = {"token": self.token, "human_token": self.human_token, "ordering": self.ordering,
+                    "weights": self.weights, "geometry": self.geometry, "forcing": self.forcing, "pvs": self.pvs,
+                    "aspiration": self.aspiration}
+        processes = [context.Process(target=lazy_smp_worker,
+                                     args=(settings, self.table, board, player_bool, depth, budget, index, stop,
+                                           results))
+                     for index in range(self.workers)]
+        for process in processes:
+            process.start()
+
+        # Every worker reports once, stopped or not, so the queue is drained before joining. Workers that die
+        # before reporting are found by polling, so a crash cannot leave the game waiting forever
+        limit = None if budget is None else time.perf_counter() + budget / 1000 + self.WORKER_GRACE
+        finished, all_results, reported = [], [], set()
+        self.worker_errors = []
+        while len(reported) < len(processes):
+            dead = [index for index, process in enumerate(processes)
+                    if index not in reported and not process.is_alive()]
+            try:
+                result = results.get(timeout=1.0)
+            except queue.Empty:
+                if limit is not None and time.perf_counter() > limit:
+                    self.worker_errors.append("Workers did not report before the time budget ran out.")
+                    break
+                for index in dead:
+                    reported.add(index)
+                    self.worker_errors.append(f"Worker {index} exited with code {processes[index].exitcode}.")
+                continue
+            reported.add(result[0])
+            if result[6] is not None:
+                self.worker_errors.append(f"Worker {result[0]} failed: {result[6]}")
+                continue
+            all_results.append(result)
+            if result[5]:
+                finished.append(result)
+                if depth is not None:
+                    stop.set()
+        stop.set()
+        for process in processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        if not finished:
+            return self.timed_search(board, float("inf") if budget is None else budget, player_bool, max_depth=depth)
+
+        # Deepest result first, then the lowest worker number
+        index, best, value, completed, stats, done, error = max(finished, key=lambda result: (result[3], -result[0]))
+        self.best_move = best
+        self.completed_depth = completed
+        self.nodes = stats.total_nodes()
+        # The counters cover every worker, the iterations are the chosen worker's
+        self.stats = SearchStats("parallel", self.geometry)
+        self.stats.iterations, self.stats.depth = stats.iterations, stats.depth
+        for result in all_results:
+            self.stats.merge(result[4])
+        if best is None:
+            return [None, value]
+        heights = Bitboard.from_board(board, (self.token, self.human_token), geometry=self.geometry).heights
+        return [self.geometry.rows - 1 - heights[best], best], value
+
+    def close(self):
+        """
+        Stops pondering and frees the shared transposition table, if the AI has one. A cache file is flushed and
+        kept.
+        """
+        self.stop_pondering()
+        if isinstance(self.table, SharedTranspositionTable):
+            self.table.close()
+            self.table.unlink()
+            self.table = TranspositionTable(self.table.size)
+
+    def out_of_time(self):
+        """
+        Checks whether the running search has to stop
+
+        Returns:
+        bool: True if the deadline has passed or the stop event is set
+        """
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return True
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def start_search(self):
+        """
+        Resets the per-search state before a new move. History scores are halved rather than cleared, so
+        they keep their ranking across moves without growing without bound.
+        """
+        self.table.new_search()
+        self.best_move = None
+        self.nodes = 0
+        self.stats = SearchStats(geometry=self.geometry)
+        for killer in self.killers:
+            killer[0] = killer[1] = None
+        for side in self.history:
+            for col in range(len(side)):
+                side[col] //= 2
+
+    def order_moves(self, possibles, side, ply, tt_move=None):
+        """
+        Sorts columns so the moves likeliest to cause a cutoff are searched first.
+
+        Center columns come before edge columns and columns with more history cutoffs before fewer. In
+        front of them go the previous iteration's best move at the root, the transposition table move,
+        and the killer moves for this ply, each only if enabled in ordering.
+
+        Parameters:
+        possibles (list): Playable columns
+        side (int): Index of the player to move
+        ply (int): Distance from the root
+        tt_move (int, optional): Best column stored for this position in the transposition table
+
+        Returns:
+        list: The same columns in search order
+        """
+        if "center" in self.ordering:
+            possibles = [col for col in self.center_order if col in possibles]
+        if "history" in self.ordering:
+            history = self.history[side]
+            possibles.sort(key=lambda col: -history[col])
+
+        first = []
+        if ply == 0 and self.best_move is not None:
+            first.append(self.best_move)
+        if "tt" in self.ordering and tt_move is not None:
+            first.append(tt_move)
+        if "killer" in self.ordering:
+            first.extend(self.killers[ply])
+        for col in reversed(first):
+            if col in possibles:
+                possibles.remove(col)
+                possibles.insert(0, col)
+        return possibles
+
+    def record_cutoff(self, col, side, ply, depth):
+        """
+        Updates the killer moves and history scores after a move causes a beta cutoff
+
+        Parameters:
+        col (int): Column that caused the cutoff
+        side (int): Index of the player who played it
+        ply (int): Distance from the root
+        depth (int): Remaining depth at the cutoff, deeper cutoffs weigh more
+        """
+        killers = self.killers[ply]
+        if killers[0] != col:
+            killers[1] = killers[0]
+            killers[0] = col
+        self.history[side][col] += depth * depth
+
+    def forced_move(self, position):
+        """
+        Finds a move that needs no search: a win on the spot, the only block of an opponent's win, or the only
+        move that does not put a token right under a cell the opponent wins on
+
+        Parameters:
+        position (Bitboard): Position with the AI's move to find
+
+        Returns:
+        tuple: (column, score for the player to move), the score is None if the move does not settle the game,
+            or None if there is more than one move to choose from
+        """
+        wins, blocks, unsafe = position.threats()
+        if wins:
+            return wins[0], 99999
+        if blocks:
+            # Two wins to block, or a block that opens a win above it, lose whatever is played
+            return blocks[0], (-99999 if len(blocks) > 1 or blocks[0] in unsafe else None)
+        possibles = [col for col in self.center_order if position.can_play(col)]
+        safe = [col for col in possibles if col not in unsafe]
+        if not safe:
+            return possibles[0], -99999
+        if len(safe) == 1:
+            return safe[0], None
+        return None
+
+    def prune_threats(self, position, possibles, ply):
+        """
+        Settles a position with an immediate win or an unstoppable loss, or narrows its moves to the block of an
+        opponent's win or to the moves that do not lose at once
+
+        Parameters:
+        position (Bitboard): Position being searched
+        possibles (list): Playable columns
+        ply (int): Distance from the root, the root's forced column is saved to best_move
 
-        if player_bool:
+        Returns:
+        tuple: (score for the player to move, None if the position is not settled, columns left to search)
+        """
+        stats = self.stats
+        wins, blocks, unsafe = position.threats()
+        if wins:
+            best_col, settled = wins[0], 99999
+        elif blocks and (len(blocks) > 1 or blocks[0] in unsafe):
+            best_col, settled = blocks[0], -99999
+        elif blocks:
+            stats.pruned_moves += len(possibles) - 1
+            return None, blocks
+        else:
+            safe = [col for col in possibles if col not in unsafe]
+            if safe:
+                stats.pruned_moves += len(possibles) - len(safe)
+                return None, safe
+            best_col, settled = possibles[0], -99999
+        stats.forced_nodes += 1
+        if ply == 0:
+            self.best_move = best_col
+        return settled, possibles
+
+    def search_frontier(self, position, ply, possibles):
+        """
+        Scores every child of a depth-1 node in one BatchEvaluator call instead of one leaf at a time.
+
+        Gives the same score as searching the node to depth 1, but all children are scored, since a batch
+        cannot stop early at a cutoff.
+
+        Parameters:
+        position (Bitboard): Position one move above the leaves
+        ply (int): Distance from the root
+        possibles (list): Columns to score
+
+        Returns:
+        int: Score of the position
+        """
+        side = position.turn
+        maximize = side == 0
+        children, masks, value, best_col = [], [], None, None
+        geometry = position.geometry
+        for col in possibles:
+            cell = col * geometry.height + position.heights[col]
+            mask = position.masks[side] | 1 << cell
+            self.nodes += 1
+            self.stats.nodes[ply + 1] += 1
+            if geometry.is_win_at(mask, cell):
+                value, best_col = (99999 if maximize else -99999), col
+                break
+            children.append(col)
+            masks.append((mask, position.masks[1]) if maximize else (position.masks[0], mask))
+        if value is None:
+            self.stats.leaves += len(masks)
+            scores = self.batch.scores_from_masks(masks).tolist()
+            best = max(scores) if maximize else min(scores)
+            value, best_col = best, children[scores.index(best)]
+
+        self.table.store(position.hash, 1, value, TranspositionTable.EXACT, best_col)
+        if ply == 0:
+            self.best_move = best_col
+        return value
+
+    def search(self, position, depth, alpha, beta, ply=0):
+        """
+        Alpha-beta search over a Bitboard. The AI maximizes when position.turn is 0.
+
+        Parameters:
+        position (Bitboard): Position to search, the AI's tokens at index 0, with an Evaluator attached
+        depth (int): Remaining search depth
+        alpha (int): The current best score for the maximizing player.
+        beta (int): The current best score for the minimizing player.
+        ply (int, optional): Distance from the root, the root's best column is saved to best_move
+
+        Returns:
+        int: Score of the position
+
+        Raises:
+        SearchTimeout: If deadline is set and has passed, or stop_event is set
+        """
+        self.nodes += 1
+        stats = self.stats
+        stats.nodes[ply] += 1
+        if not self.nodes & 1023 and self.out_of_time():
+            raise SearchTimeout()
+
+        # Base Case: below the root only the move just made can have won, and it was made by the other side
+        if ply == 0:
+            winner = position.winner()
+            if winner:
+                return 99999 if winner == self.token else -99999
+        elif position.last_move_won():
+            return 99999 if position.turn else -99999
+        if depth == 0:
+            stats.leaves += 1
+            return position.evaluator.score
+        possibles = position.valid_moves()
+        if not possibles:
+            return 0
+
+        stats.tt_probes += 1
+        entry = self.table.probe(position.hash)
+        if entry is not None:
+            stats.tt_hits += 1
+        if entry is not None and entry[1] >= depth:
+            if entry[3] == TranspositionTable.EXACT:
+                alpha = beta = entry[2]
+            elif entry[3] == TranspositionTable.LOWER:
+                alpha = max(alpha, entry[2])
+            else:
+                beta = min(beta, entry[2])
+            if alpha >= beta:
+                stats.tt_cutoffs += 1
+                if ply == 0:
+                    self.best_move = entry[4]
+                return entry[2]
+        if self.forcing and depth > 1:
+            # One move above the leaves the children are cheaper to score than to analyse, so it starts at depth 2
+            settled, possibles = self.prune_threats(position, possibles, ply)
+            if settled is not None:
+                return settled if position.turn == 0 else -settled
+        if depth == 1 and self.batch is not None:
+            return self.search_frontier(position, ply, possibles)
+        window_alpha, window_beta = alpha, beta
+        possibles = self.order_moves(possibles, position.turn, ply, entry[4] if entry is not None else None)
+
+        best_col = possibles[0]
+        if position.turn == 0:
             value = -99999
-            best_position = random.choice(possibles)
-            for possible in possibles:
-                board_copy = copy.deepcopy(board)
-                board_copy[possible[0]][possible[1]] = self.token
-                value = max(value, self.minimax(board_copy, depth - 1, alpha, beta, False)[1])
+            for index, col in enumerate(possibles):
+                position.play(col)
+                score = self.search(position, depth - 1, alpha, beta, ply + 1)
+                position.undo()
+                if score > value:
+                    value, best_col = score, col
                 alpha = max(alpha, value)
                 if alpha >= beta:
+                    stats.cutoffs[index] += 1
+                    self.record_cutoff(col, 0, ply, depth)
                     break
-            return best_position, value
         else:
             value = 99999
-            best_position = random.choice(possibles)
-            for possible in possibles:
-                board_copy = copy.deepcopy(board)
-                board_copy[possible[0]][possible[1]] = self.human_token
-                value = min(value, self.minimax(board_copy, depth - 1, alpha, beta, True)[1])
+            for index, col in enumerate(possibles):
+                position.play(col)
+                score = self.search(position, depth - 1, alpha, beta, ply + 1)
+                position.undo()
+                if score < value:
+                    value, best_col = score, col
                 beta = min(beta, value)
                 if alpha >= beta:
+                    stats.cutoffs[index] += 1
+                    self.record_cutoff(col, 1, ply, depth)
                     break
-            return best_position, value
+
+        if value <= window_alpha:
+            flag = TranspositionTable.UPPER
+        elif value >= window_beta:
+            flag = TranspositionTable.LOWER
+        else:
+            flag = TranspositionTable.EXACT
+        self.table.store(position.hash, depth, value, flag, best_col)
+        if ply == 0:
+            self.best_move = best_col
+        return value
+
+    def root_search(self, position, depth, alpha, beta):
+        """
+        Searches the root with pvs_search if pvs is set and with search otherwise
+
+        Parameters:
+        position (Bitboard): Root position, with an Evaluator attached
+        depth (int): Search depth
+        alpha (int): The current best score for the maximizing player.
+        beta (int): The current best score for the minimizing player.
+
+        Returns:
+        int: Score of the position for the AI, like search
+        """
+        if not self.pvs:
+            return self.search(position, depth, alpha, beta)
+        if position.turn == 0:
+            return self.pvs_search(position, depth, alpha, beta)
+        return -self.pvs_search(position, depth, -beta, -alpha)
+
+    def aspiration_search(self, position, depth, guess):
+        """
+        Searches the root within aspiration away from guess. A score outside the window only bounds the real
+        one, so the side it fell out of is widened, twice as far each time, and the root searched again.
+
+        Parameters:
+        position (Bitboard): Root position, with an Evaluator attached
+        depth (int): Search depth
+        guess (int): Expected score for the AI, usually the previous iteration's
+
+        Returns:
+        int: Score of the position for the AI, the same as a full window search gives
+        """
+        delta = self.aspiration
+        alpha, beta = max(guess - delta, -99999), min(guess + delta, 99999)
+        while True:
+            score = self.root_search(position, depth, alpha, beta)
+            if score <= alpha and alpha > -99999:
+                alpha = max(score - delta, -99999)
+            elif score >= beta and beta < 99999:
+                beta = min(score + delta, 99999)
+            else:
+                return score
+            self.stats.aspiration_fails += 1
+            delta *= 2
+
+    def pvs_search(self, position, depth, alpha, beta, ply=0):
+        """
+        Principal variation search in negamax form. The first move is searched with the full window and the
+        rest with a null window that only asks whether they beat it, and a move that does is searched again with
+        the full window. Scores and windows are for the player to move, the transposition table keeps them for
+        the AI like search does, so both searches can share one table.
+
+        Parameters:
+        position (Bitboard): Position to search, the AI's tokens at index 0, with an Evaluator attached
+        depth (int): Remaining search depth
+        alpha (int): Score the player to move already has
+        beta (int): Score the opponent already has, negated
+        ply (int, optional): Distance from the root, the root's best column is saved to best_move
+
+        Returns:
+        int: Score of the position for the player to move
+
+        Raises:
+        SearchTimeout: If deadline is set and has passed, or stop_event is set
+        """
+        self.nodes += 1
+        stats = self.stats
+        stats.nodes[ply] += 1
+        if not self.nodes & 1023 and self.out_of_time():
+            raise SearchTimeout()
+
+        sign = 1 if position.turn == 0 else -1
+        if ply == 0:
+            winner = position.winner()
+            if winner:
+                return sign * (99999 if winner == self.token else -99999)
+        elif position.last_move_won():
+            return -99999
+        if depth == 0:
+            stats.leaves += 1
+            return sign * position.evaluator.score
+        possibles = position.valid_moves()
+        if not possibles:
+            return 0
+
+        stats.tt_probes += 1
+        entry = self.table.probe(position.hash)
+        if entry is not None:
+            stats.tt_hits += 1
+        if entry is not None and entry[1] >= depth:
+            score = sign * entry[2]
+            if entry[3] == TranspositionTable.EXACT:
+                alpha = beta = score
+            elif (entry[3] == TranspositionTable.LOWER) == (sign == 1):
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if alpha >= beta:
+                stats.tt_cutoffs += 1
+                if ply == 0:
+                    self.best_move = entry[4]
+                return score
+        if self.forcing and depth > 1:
+            settled, possibles = self.prune_threats(position, possibles, ply)
+            if settled is not None:
+                return settled
+        if depth == 1 and self.batch is not None:
+            return sign * self.search_frontier(position, ply, possibles)
+        window_alpha, window_beta = alpha, beta
+        side = position.turn
+        possibles = self.order_moves(possibles, side, ply, entry[4] if entry is not None else None)
+
+        best_col, value = possibles[0], -99999
+        for index, col in enumerate(possibles):
+            position.play(col)
+            if index == 0:
+                score = -self.pvs_search(position, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self.pvs_search(position, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    stats.researches += 1
+                    score = -self.pvs_search(position, depth - 1, -beta, -alpha, ply + 1)
+            position.undo()
+            if score > value:
+                value, best_col = score, col
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                stats.cutoffs[index] += 1
+                self.record_cutoff(col, side, ply, depth)
+                break
+
+        if value <= window_alpha:
+            flag = TranspositionTable.UPPER if sign == 1 else TranspositionTable.LOWER
+        elif value >= window_beta:
+            flag = TranspositionTable.LOWER if sign == 1 else TranspositionTable.UPPER
+        else:
+            flag = TranspositionTable.EXACT
+        self.table.store(position.hash, depth, sign * value, flag, best_col)
+        # A root score at or below alpha is only a bound, so its column is no better than the one already saved
+        if ply == 0 and (value > window_alpha or self.best_move is None):
+            self.best_move = best_col
+        return value
+
+
+def book_entry(job):
+    """
+    Searches one opening book position for OpeningBook.build
+
+    Parameters:
+    job (tuple): (key, mover's mask, other player's mask, depth)
+
+    Returns:
+    tuple: (key, score for the mover, best column)
+    """
+    key, mover, other, depth = job
+    heights = [(bin((mover | other) >> (col * Bitboard.HEIGHT) & Bitboard.COLUMN_MASK).count("1"))
+               for col in range(Bitboard.COLS)]
+    board = Bitboard((1, 2), [mover, other], heights).to_board()
+    ai = AI("Book", 1, 2)
+    score = ai.timed_search(board, float("inf"), True, max_depth=depth)[1]
+    return key, score, ai.best_move
+
+
+def lazy_smp_worker(settings, table, board, player_bool, depth, budget, index, stop, results):
+    """
+    Runs one Lazy SMP search process for AI.parallel_search
+
+    Odd workers search one ply deeper than asked and every worker starts its center ordering from a
+    different column, so the workers spread over the tree and fill the shared table for each other.
+
+    Parameters:
+    settings (dict): token, human_token, ordering, weights, geometry, forcing, pvs and aspiration of the searching AI
+    table (SharedTranspositionTable): Table shared by the workers, attached to again in this process
+    board (list): The current game board.
+    player_bool (bool): True if it is the AI's turn, False if it is the player's turn.
+    depth (int): Depth to reach, None when searching on a time budget
+    budget (int): Time budget in milliseconds, used when depth is None
+    index (int): Worker number
+    stop (Event): Set by the parent when the search is over
+    results (Queue): Receives (index, best column, score, completed depth, SearchStats, finished, error), error
+        is None unless the search raised, and then the other fields are empty
+    """
+    try:
+        ai = AI("Worker", settings["token"], settings["human_token"], table_size=0, ordering=settings["ordering"],
+                weights=settings["weights"], geometry=settings["geometry"], forcing=settings["forcing"],
+                pvs=settings["pvs"], aspiration=settings["aspiration"])
+        ai.table = table
+        ai.stop_event = stop
+        start = index % ai.geometry.cols
+        ai.center_order = ai.geometry.center_order[start:] + ai.geometry.center_order[:start]
+        if depth is None:
+            value = ai.timed_search(board, budget, player_bool)[1]
+        else:
+            value = ai.timed_search(board, float("inf"), player_bool, max_depth=depth + index % 2)[1]
+        results.put((index, ai.best_move, value, ai.completed_depth, ai.stats, not stop.is_set(), None))
+    except Exception as error:
+        results.put((index, None, None, 0, None, False, repr(error)))
+    finally:
+        table.close()
 
 
 # Main Game Loop
 if __name__ == "__main__":
+    # An optional argument gives the AI a time budget per move in milliseconds
+    if len(sys.argv) > 1:
+        Game.ai_time_budget = int(sys.argv[1])
+
     history = GameHistory()
     if len(history.history) > 0:
         history.disp_history()
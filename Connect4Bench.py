@@ -0,0 +1,544 @@
+import sys
+import json
+import time
+import random
+import argparse
+
+from Connect4 import AI, Bitboard, EndgameSolver, Geometry, GameState
+from Connect4Test import parse_engine, make_ai
+
+# Openings and middlegames used for the reports, as 0-indexed columns played from the empty board
+POSITIONS = {
+    "empty": "",
+    "center": "33",
+    "opening": "3324",
+    "early": "334224",
+    "middle": "32443524",
+}
+
+# Version of SUITE, bumped whenever a position or reference changes so results of different suites are never compared
+SUITE_VERSION = 1
+# Benchmark suite as (name, category, 0-indexed columns played, columns that keep the best game result for the
+# player to move). None of the positions has a win or forced block on the next move. References come from the
+# exact EndgameSolver, or known theory for the empty board, and are None where neither reaches.
+SUITE = [
+    ("empty", "opening", "", (3,)),
+    ("center", "opening", "3", None),
+    ("center-reply", "opening", "33", None),
+    ("opening", "opening", "3324", None),
+    ("midgame-1", "midgame", "6615141331245", (3, 4)),
+    ("midgame-2", "midgame", "5214444055335", (3,)),
+    ("midgame-3", "midgame", "5234140116322", (4,)),
+    ("tactical-1", "tactical", "5325530043412560063", (2,)),
+    ("tactical-2", "tactical", "56606514525315524131112", (4,)),
+    ("tactical-3", "tactical", "3634430343403114221", (1,)),
+    ("endgame-1", "endgame", "435505634164340152215611103", (3, 4)),
+    ("endgame-2", "endgame", "1210011664230120062463423451", (3, 4)),
+    ("endgame-3", "endgame", "66264064260242615102401023", (3, 4)),
+]
+
+
+def board_from_moves(moves, tokens=(1, 2)):
+    '''
+    Builds a 6x7 board by playing columns from the empty board, first player first
+
+    :param moves: string or list of 0-indexed columns
+    :param tokens: tokens of the first and second player
+    :return: the board as a list of lists, and whether the first player is to move
+    '''
+    position = Bitboard(tokens)
+    for col in moves:
+        position.play(int(col))
+    return position.to_board(), position.turn == 0
+
+
+def count_nodes(ai, moves, depth):
+    '''
+    Runs iterative deepening to a fixed depth from a position and counts the nodes it visits
+
+    :param ai: AI to search with, its settings are left as they are
+    :param moves: columns played to reach the position
+    :param depth: depth to search to
+    :return: nodes visited by every iteration up to depth
+    '''
+    board, ai_to_move = board_from_moves(moves, (ai.token, ai.human_token))
+    ai.table.clear()
+    ai.history = [[0] * Bitboard.COLS, [0] * Bitboard.COLS]
+    ai.timed_search(board, float("inf"), ai_to_move, max_depth=depth)
+    return ai.nodes
+
+
+def ordering_report(depth=8, positions=POSITIONS):
+    '''
+    Reports how much each move ordering heuristic cuts the node count at a fixed depth
+
+    Every heuristic is measured on its own and all together, against left-to-right ordering.
+
+    :param depth: depth to search each position to
+    :param positions: dict of name to columns played
+    :return: dict of ordering name to total nodes across the positions
+    '''
+    ai = AI("Bench", 1, 2)
+    configs = [("none", ())] + [(name, (name,)) for name in AI.ORDERINGS] + [("all", AI.ORDERINGS)]
+    totals = {}
+    print(f"Nodes to depth {depth}")
+    print(f"{'ordering':<10}" + "".join(f"{name:>12}" for name in positions) + f"{'total':>12}{'saved':>8}")
+    for name, ordering in configs:
+        ai.ordering = set(ordering)
+        counts = [count_nodes(ai, moves, depth) for moves in positions.values()]
+        totals[name] = sum(counts)
+        saved = 1 - totals[name] / totals["none"]
+        print(f"{name:<10}" + "".join(f"{count:>12}" for count in counts) + f"{totals[name]:>12}{saved:>8.1%}")
+    return totals
+
+
+def smp_report(depth=9, worker_counts=(1, 2, 4, 8), positions=POSITIONS):
+    '''
+    Reports the Lazy SMP speedup to a fixed depth as the number of worker processes grows
+
+    :param depth: depth to search each position to
+    :param worker_counts: numbers of workers to try, the first one is the baseline
+    :param positions: dict of name to columns played
+    :return: dict of worker count to total seconds across the positions
+    '''
+    ai = AI("Bench", 1, 2, workers=2)
+    totals = {}
+    print(f"Seconds to depth {depth}")
+    print(f"{'workers':<10}" + "".join(f"{name:>10}" for name in positions) + f"{'total':>10}{'speedup':>9}")
+    try:
+        for workers in worker_counts:
+            ai.workers = workers
+            times = []
+            for moves in positions.values():
+                board, ai_to_move = board_from_moves(moves, (ai.token, ai.human_token))
+                ai.table.clear()
+                start = time.perf_counter()
+                ai.parallel_search(board, ai_to_move, depth=depth)
+                times.append(time.perf_counter() - start)
+            totals[workers] = sum(times)
+            speedup = totals[worker_counts[0]] / totals[workers]
+            print(f"{workers:<10}" + "".join(f"{seconds:>10.3f}" for seconds in times)
+                  + f"{totals[workers]:>10.3f}{speedup:>8.2f}x")
+    finally:
+        ai.close()
+    return totals
+
+
+def random_endgame(rng, empty):
+    '''
+    Plays random moves that never end the game until only a given number of cells are empty
+
+    :param rng: random.Random to draw moves from
+    :param empty: empty cells to leave
+    :return: Bitboard with the game still undecided
+    '''
+    while True:
+        position = Bitboard((1, 2))
+        while Bitboard.ROWS * Bitboard.COLS - sum(position.heights) > empty:
+            moves = position.valid_moves()
+            rng.shuffle(moves)
+            for col in moves:
+                position.play(col)
+                if not position.winner():
+                    break
+                position.undo()
+            else:
+                break
+        else:
+            return position
+
+
+def endgame_report(empties=range(4, 25, 2), samples=10, seed=0):
+    '''
+    Reports how long the exact endgame solver takes for each number of empty cells
+
+    :param empties: empty cell counts to measure
+    :param samples: random positions per count
+    :param seed: seed for the positions
+    :return: dict of empty cells to (mean seconds, max seconds, mean nodes)
+    '''
+    rng = random.Random(seed)
+    report = {}
+    print(f"{'empty':<8}{'mean ms':>10}{'max ms':>10}{'nodes':>10}")
+    for empty in empties:
+        times, nodes = [], []
+        for _ in range(samples):
+            position = random_endgame(rng, empty)
+            solver = EndgameSolver()
+            start = time.perf_counter()
+            solver.best_move(position)
+            times.append(time.perf_counter() - start)
+            nodes.append(solver.nodes)
+        report[empty] = (sum(times) / samples, max(times), sum(nodes) / samples)
+        print(f"{empty:<8}{report[empty][0] * 1000:>10.2f}{report[empty][1] * 1000:>10.2f}{report[empty][2]:>10.0f}")
+    return report
+
+
+def forcing_report(samples=40, depth=7, seed=0):
+    '''
+    Reports the move latency with and without threat analysis on positions where a threat is on the board
+
+    Positions come from random games and are kept when the player to move can win at once, has to block, or has
+    a move that hands the opponent a win, which are the positions where a player is most often kept waiting.
+    Each one is answered by a fresh fixed-depth AI, with forcing off and then on.
+
+    :param samples: positions to measure
+    :param depth: search depth of the AI
+    :param seed: seed for the positions
+    :return: dict of "off" and "on" to (mean ms, max ms, total nodes, moves played without searching)
+    '''
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < samples:
+        position = Bitboard((1, 2))
+        for _ in range(rng.randrange(6, 30)):
+            position.play(rng.choice(position.valid_moves()))
+            if position.last_move_won() or position.board_full():
+                break
+        else:
+            if any(position.threats()):
+                positions.append(position)
+    report = {}
+    print(f"Move latency to depth {depth} on {samples} positions with a threat")
+    print(f"{'forcing':<10}{'mean ms':>10}{'max ms':>10}{'nodes':>10}{'forced':>8}")
+    for label, forcing in (("off", False), ("on", True)):
+        times, nodes, forced = [], 0, 0
+        for position in positions:
+            mover = position.tokens[position.turn]
+            ai = AI("Bench", mover, position.tokens[position.turn ^ 1], depth=depth, endgame_threshold=0,
+                    forcing=forcing)
+            start = time.perf_counter()
+            ai.choose_move(position.to_board(), True)
+            times.append(time.perf_counter() - start)
+            nodes += ai.stats.total_nodes()
+            forced += ai.stats.source == "forced"
+        report[label] = (sum(times) / samples * 1000, max(times) * 1000, nodes, forced)
+        print(f"{label:<10}{report[label][0]:>10.2f}{report[label][1]:>10.2f}{nodes:>10}{forced:>8}")
+    print(f"Mean latency cut by {1 - report['on'][0] / report['off'][0]:.1%}")
+    return report
+
+
+def pvs_report(depth=8, suite=SUITE):
+    '''
+    Reports the nodes principal variation search with aspiration windows saves over plain alpha-beta
+
+    Each suite position is searched by two fresh AIs deepening iteratively to the same depth, one with pvs off and
+    one with it on, and their scores are checked to be the same.
+
+    :param depth: depth to search each position to
+    :param suite: list of (name, category, moves, reference)
+    :return: dict of position name to (alpha-beta nodes, pvs nodes, re-searches, aspiration misses, same score)
+    '''
+    report = {}
+    print(f"Nodes to depth {depth}")
+    print(f"{'position':<14}{'alphabeta':>11}{'pvs':>11}{'saved':>8}{'research':>10}{'aspiration':>12}{'score':>7}")
+    for name, category, moves, reference in suite:
+        tokens = (1, 2) if len(moves) % 2 == 0 else (2, 1)
+        board, _ = board_from_moves(moves, tokens)
+        runs = []
+        for pvs in (False, True):
+            ai = AI("Bench", 1, 2, endgame_threshold=0, pvs=pvs)
+            score = ai.timed_search(board, float("inf"), True, max_depth=depth)[1]
+            runs.append((ai.nodes, score, ai.stats))
+        (plain, plain_score, _), (nodes, score, stats) = runs
+        report[name] = (plain, nodes, stats.researches, stats.aspiration_fails, score == plain_score)
+        print(f"{name:<14}{plain:>11}{nodes:>11}{1 - nodes / plain:>8.1%}{stats.researches:>10}"
+              f"{stats.aspiration_fails:>12}{'same' if score == plain_score else 'DIFF':>7}")
+    plain = sum(row[0] for row in report.values())
+    nodes = sum(row[1] for row in report.values())
+    print(f"{'total':<14}{plain:>11}{nodes:>11}{1 - nodes / plain:>8.1%}")
+    return report
+
+
+def ponder_report(games=3, think=1.0, depth=7, budget=None, seed=0):
+    '''
+    Reports the AI's move latency with and without pondering, against a stand-in human who thinks for a fixed time
+
+    The human plays random moves, the same ones in both runs as long as the AI answers the same, and waits think
+    seconds before each one, during which the AI ponders if it is turned on.
+
+    :param games: games to play
+    :param think: seconds the human takes over every move
+    :param depth: search depth of the AI
+    :param budget: time budget of the AI in milliseconds, None to search to depth
+    :param seed: seed for the human's moves
+    :return: dict of "off" and "on" to (mean ms, max ms, AI moves, moves answered from pondering)
+    '''
+    report = {}
+    print(f"AI move latency, depth {depth}" if budget is None else f"AI move latency, {budget} ms budget")
+    print(f"{'ponder':<10}{'mean ms':>10}{'max ms':>10}{'moves':>8}{'pondered':>10}")
+    for label, ponder in (("off", False), ("on", True)):
+        rng = random.Random(seed)
+        times, pondered = [], 0
+        for _ in range(games):
+            state = GameState.new(("Human", "AI"), ai={"depth": depth, "time_budget": budget})
+            ai = state.players[1]
+            try:
+                while not state.is_over():
+                    if isinstance(state.current(), AI):
+                        start = time.perf_counter()
+                        state.ai_move()
+                        times.append(time.perf_counter() - start)
+                        pondered += ai.stats.pondered
+                    else:
+                        if ponder:
+                            state.ponder()
+                        time.sleep(think)
+                        state.apply_move(rng.choice(state.legal_moves()))
+            finally:
+                state.close()
+        report[label] = (sum(times) / len(times) * 1000, max(times) * 1000, len(times), pondered)
+        print(f"{label:<10}{report[label][0]:>10.2f}{report[label][1]:>10.2f}{len(times):>8}{pondered:>10}")
+    return report
+
+
+def suite_position(config, moves, reference):
+    '''
+    Searches one suite position with a fresh AI, which is always the player to move
+
+    Fixed-depth engines deepen iteratively up to their depth, timed engines until their budget runs out. The
+    opening book and endgame solver are left out so only the search is measured.
+
+    :param config: engine configuration, see Connect4Test.parse_engine
+    :param moves: columns played to reach the position
+    :param reference: columns that keep the best result, or None
+    :return: dict with the move, score, depth, nodes, seconds, nodes per second, time to each depth and agreement
+    '''
+    tokens = (1, 2) if len(moves) % 2 == 0 else (2, 1)
+    board, _ = board_from_moves(moves, tokens)
+    ai = make_ai(config, 1, 2)
+    ai.endgame_threshold = 0
+    budget = float("inf") if config["budget"] is None else config["budget"]
+    max_depth = config["depth"] if config["budget"] is None else None
+    try:
+        start = time.perf_counter()
+        spot, score = ai.timed_search(board, budget, True, max_depth=max_depth)
+        seconds = time.perf_counter() - start
+    finally:
+        ai.close()
+    col = None if spot is None else spot[1]
+    return {"move": col, "score": score, "depth": ai.completed_depth, "nodes": ai.nodes,
+            "seconds": round(seconds, 6), "nps": round(ai.nodes / seconds) if seconds else 0,
+            "time_to_depth": [[depth, round(elapsed, 6)] for depth, elapsed, nodes in ai.stats.iterations],
+            "stats": ai.stats.to_dict(),
+            "agrees": None if reference is None else col in reference}
+
+
+def suite_engine(config, suite=SUITE):
+    '''
+    Runs one engine over the suite and prints a row per position
+
+    :param config: engine configuration, see Connect4Test.parse_engine
+    :param suite: list of (name, category, moves, reference)
+    :return: dict with the configuration, per-position results and a summary
+    '''
+    print(f"{config['name']}")
+    print(f"{'position':<14}{'category':<10}{'move':>5}{'ok':>4}{'depth':>6}{'nodes':>10}{'ms':>10}{'knps':>8}")
+    positions = {}
+    for name, category, moves, reference in suite:
+        result = suite_position(config, moves, reference)
+        result["category"] = category
+        positions[name] = result
+        agrees = {None: "-", True: "y", False: "n"}[result["agrees"]]
+        print(f"{name:<14}{category:<10}{str(result['move']):>5}{agrees:>4}{result['depth']:>6}{result['nodes']:>10}"
+              f"{result['seconds'] * 1000:>10.1f}{result['nps'] / 1000:>8.1f}")
+
+    nodes = sum(result["nodes"] for result in positions.values())
+    seconds = sum(result["seconds"] for result in positions.values())
+    checked = [result["agrees"] for result in positions.values() if result["agrees"] is not None]
+    summary = {"nodes": nodes, "seconds": round(seconds, 6), "nps": round(nodes / seconds) if seconds else 0,
+               "mean_latency": round(seconds / len(positions), 6),
+               "max_latency": max(result["seconds"] for result in positions.values()),
+               "mean_depth": sum(result["depth"] for result in positions.values()) / len(positions),
+               "agreement": sum(checked) / len(checked) if checked else None}
+    agreement = "-" if summary["agreement"] is None else f"{summary['agreement']:.0%}"
+    print(f"{'total':<24}{agreement:>9}{summary['mean_depth']:>6.1f}{nodes:>10}{seconds * 1000:>10.1f}"
+          f"{summary['nps'] / 1000:>8.1f}\n")
+    # Round trip through JSON so the settings compare equal to ones read back from a baseline file
+    settings = json.loads(json.dumps({key: value for key, value in config.items() if key != "name"}))
+    return {"config": settings, "positions": positions, "summary": summary}
+
+
+def compare_baseline(results, baseline, tolerance=0.1):
+    '''
+    Compares suite results with a stored baseline and lists the regressions
+
+    Node counts of fixed-depth engines are deterministic, so any growth past the tolerance is a regression.
+    Nodes per second, mean depth of timed engines and best-move agreement are compared for every engine.
+    Engines missing from the baseline are skipped.
+
+    :param results: results from suite_report
+    :param baseline: earlier results from suite_report
+    :param tolerance: fraction by which a measurement may get worse before it counts
+    :return: list of regression messages
+    '''
+    if baseline.get("version") != results["version"]:
+        raise ValueError(f"Baseline is for suite version {baseline.get('version')}, not {results['version']}.")
+    # Settings added after a baseline was written count as their default value in it
+    defaults = json.loads(json.dumps({key: value for key, value in parse_engine("").items() if key != "name"}))
+    regressions = []
+    for name, engine in results["engines"].items():
+        old = baseline["engines"].get(name)
+        if old is None:
+            continue
+        if dict(defaults, **old["config"]) != engine["config"]:
+            regressions.append(f"{name}: configuration changed from {old['config']} to {engine['config']}")
+            continue
+        for position, result in engine["positions"].items():
+            previous = old["positions"].get(position)
+            if previous is None:
+                continue
+            if engine["config"]["budget"] is None and result["nodes"] > previous["nodes"] * (1 + tolerance):
+                regressions.append(f"{name} {position}: {result['nodes']} nodes, baseline {previous['nodes']}")
+            if previous["agrees"] and not result["agrees"]:
+                regressions.append(f"{name} {position}: played {result['move']}, baseline agreed with the reference")
+        summary, previous = engine["summary"], old["summary"]
+        if summary["nps"] < previous["nps"] * (1 - tolerance):
+            regressions.append(f"{name}: {summary['nps']} nodes/s, baseline {previous['nps']}")
+        if engine["config"]["budget"] is not None and summary["mean_depth"] < previous["mean_depth"] * (1 - tolerance):
+            regressions.append(f"{name}: mean depth {summary['mean_depth']:.1f}, baseline {previous['mean_depth']:.1f}")
+    return regressions
+
+
+def suite_report(engines, out="bench.json", baseline=None, tolerance=0.1, suite=SUITE):
+    '''
+    Runs every engine over the benchmark suite, writes the results as JSON and checks them against a baseline
+
+    :param engines: engine configurations, see Connect4Test.parse_engine
+    :param out: JSON file to write, None to skip writing
+    :param baseline: JSON file written by an earlier run, None to skip the comparison
+    :param tolerance: fraction by which a measurement may get worse before it counts as a regression
+    :param suite: list of (name, category, moves, reference)
+    :return: the results and the list of regressions
+    '''
+    results = {"version": SUITE_VERSION, "engines": {}}
+    for config in engines:
+        results["engines"][config["name"]] = suite_engine(config, suite)
+    if out is not None:
+        with open(out, "w") as file:
+            json.dump(results, file, indent=2)
+
+    regressions = []
+    if baseline is not None:
+        with open(baseline) as file:
+            regressions = compare_baseline(results, json.load(file), tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if not regressions:
+            print(f"No regressions against {baseline}")
+    return results, regressions
+
+
+def parse_size(text):
+    '''
+    Reads a board size written as ROWSxCOLSxCONNECT, such as 9x9x5
+
+    :param text: size description
+    :return: (rows, cols, connect)
+    '''
+    try:
+        rows, cols, connect = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Size {text} is not ROWSxCOLSxCONNECT.")
+    return rows, cols, connect
+
+
+def scaling_report(sizes=((6, 7, 4), (7, 8, 4), (9, 9, 5)), depth=6, openings=3, seed=0):
+    '''
+    Reports how search speed holds up as the board grows
+
+    Each size gets a fresh AI that searches the same number of random openings to a fixed depth. The line and
+    window tables are built once per size, and the time that takes is shown separately from the search.
+
+    :param sizes: (rows, cols, connect) of each board, the first one is the baseline
+    :param depth: depth to search each opening to
+    :param openings: random openings per size, of four moves that do not win
+    :param seed: seed for the openings
+    :return: dict of size to (windows, table ms, nodes, seconds, nodes per second)
+    '''
+    report = {}
+    print(f"Nodes per second to depth {depth}, {openings} openings per size")
+    print(f"{'size':<10}{'cells':>7}{'windows':>9}{'tables ms':>11}{'nodes':>11}{'seconds':>9}{'nodes/s':>10}"
+          f"{'relative':>10}")
+    for rows, cols, connect in sizes:
+        start = time.perf_counter()
+        geometry = Geometry(rows, cols, connect)
+        table_ms = (time.perf_counter() - start) * 1000
+        geometry = Geometry.get(rows, cols, connect)
+        rng = random.Random(seed)
+        nodes, seconds = 0, 0.0
+        for _ in range(openings):
+            position = Bitboard((1, 2), geometry=geometry)
+            while len(position.moves) < 4:
+                position.play(rng.choice(position.valid_moves()))
+                if position.last_move_won():
+                    position.undo()
+            ai = AI("Bench", 1, 2, geometry=geometry, endgame_threshold=0)
+            start = time.perf_counter()
+            ai.timed_search(position.to_board(), float("inf"), True, max_depth=depth)
+            seconds += time.perf_counter() - start
+            nodes += ai.nodes
+        nps = nodes / seconds if seconds else 0.0
+        name = f"{rows}x{cols}x{connect}"
+        report[name] = (len(geometry.windows), table_ms, nodes, seconds, nps)
+        baseline = report[next(iter(report))][4]
+        print(f"{name:<10}{rows * cols:>7}{len(geometry.windows):>9}{table_ms:>11.2f}{nodes:>11}{seconds:>9.3f}"
+              f"{nps:>10.0f}{nps / baseline if baseline else 0:>9.2f}x")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Connect4 AI benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ordering = commands.add_parser("ordering", help="node count saved by each move ordering heuristic")
+    ordering.add_argument("--depth", type=int, default=8)
+    smp = commands.add_parser("smp", help="Lazy SMP speedup to a fixed depth by worker count")
+    smp.add_argument("--depth", type=int, default=9)
+    smp.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    endgame = commands.add_parser("endgame", help="exact solver time by number of empty cells")
+    endgame.add_argument("--max-empty", type=int, default=24)
+    endgame.add_argument("--samples", type=int, default=10)
+    forcing = commands.add_parser("forcing", help="move latency with and without threat analysis")
+    forcing.add_argument("--samples", type=int, default=40)
+    forcing.add_argument("--depth", type=int, default=7)
+    pvs = commands.add_parser("pvs", help="nodes saved by principal variation search over plain alpha-beta")
+    pvs.add_argument("--depth", type=int, default=8)
+    ponder = commands.add_parser("ponder", help="AI move latency with and without pondering on the human's turn")
+    ponder.add_argument("--games", type=int, default=3)
+    ponder.add_argument("--think", type=float, default=1.0)
+    ponder.add_argument("--depth", type=int, default=7)
+    ponder.add_argument("--budget", type=int, default=None)
+    suite = commands.add_parser("suite", help="nodes, speed, time to depth and best-move agreement on fixed positions")
+    suite.add_argument("--engine", action="append", type=parse_engine,
+                       help="name:depth=N,budget=MS,weights=TWO/THREE/FOUR/CENTER,forcing=0|1,pvs=0|1, "
+                            "may be given several times")
+    suite.add_argument("--category", choices=("opening", "midgame", "tactical", "endgame"), action="append")
+    suite.add_argument("--out", default="bench.json")
+    suite.add_argument("--baseline", default=None)
+    suite.add_argument("--tolerance", type=float, default=0.1)
+    scaling = commands.add_parser("scaling", help="nodes per second as the board size and line length grow")
+    scaling.add_argument("--sizes", type=parse_size, nargs="+", default=[(6, 7, 4), (7, 8, 4), (9, 9, 5)],
+                         help="board sizes as ROWSxCOLSxCONNECT")
+    scaling.add_argument("--depth", type=int, default=6)
+    scaling.add_argument("--openings", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "ordering":
+        ordering_report(args.depth)
+    elif args.command == "smp":
+        smp_report(args.depth, args.workers)
+    elif args.command == "endgame":
+        endgame_report(range(4, args.max_empty + 1, 2), args.samples)
+    elif args.command == "forcing":
+        forcing_report(args.samples, args.depth)
+    elif args.command == "pvs":
+        pvs_report(args.depth)
+    elif args.command == "ponder":
+        ponder_report(args.games, args.think, args.depth, args.budget)
+    elif args.command == "suite":
+        positions = [position for position in SUITE if not args.category or position[1] in args.category]
+        _, regressions = suite_report(args.engine or [parse_engine("depth8:depth=8")], args.out, args.baseline,
+                                      args.tolerance, positions)
+        sys.exit(1 if regressions else 0)
+    elif args.command == "scaling":
+        scaling_report(args.sizes, args.depth, args.openings)
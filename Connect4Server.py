@@ -0,0 +1,440 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+import concurrent.futures
+
+from Connect4 import AI, GameState, GameArchive, Geometry
+
+# AIs of a pool worker process, one per token pair, kept so their transposition tables carry over between moves
+worker_ais = {}
+
+
+def search_move(board, token, human_token, budget, geometry=None):
+    '''
+    Picks the AI's move inside a pool worker process
+
+    :param board: the game board as a list of lists
+    :param token: token of the AI, which is to move
+    :param human_token: token of its opponent
+    :param budget: time budget in milliseconds
+    :param geometry: board size and line length of the game, 6x7 connect-4 if None
+    :return: column, score and the search stats as a dict
+    '''
+    ai = worker_ais.get((token, human_token, geometry))
+    if ai is None:
+        ai = worker_ais[(token, human_token, geometry)] = AI("AI", token, human_token, geometry=geometry)
+    ai.time_budget = budget
+    best_spot, score = ai.choose_move(board, True)
+    return best_spot[1], score, ai.stats.to_dict()
+
+
+class ServerBusy(Exception):
+    """
+    Raised when every search slot of the pool is taken
+    """
+
+
+class GameServer:
+    """
+    GameServer class hosts many human-versus-AI games over a line-delimited JSON protocol
+
+    Each request is one JSON object on its own line and gets one JSON line back, with "ok" and either the
+    result or an "error". Games live in memory as GameStates, and AI moves are searched in a bounded process
+    pool so the event loop never waits on a search. A connection handles its requests in order, so a client
+    that pipelines faster than the pool can answer stops being read. When more searches are running or
+    queued than the pool allows, moves are refused with the "busy" error before anything is played, and can
+    be sent again.
+
+    Requests:
+        {"op": "new", "name": str, "ai_first": bool, "budget": ms, "rows": int, "cols": int, "connect": int}:
+            Starts a game, 6x7 connect-4 unless a size is given, and the AI moves if it goes first
+        {"op": "move", "game": id, "col": int, "budget": ms}: Plays the human's column and the AI's reply
+        {"op": "ai", "game": id, "budget": ms}: Plays the AI's move, if it is the AI's turn
+        {"op": "status", "game": id}: Returns the status of a game
+        {"op": "close", "game": id}: Forgets a game
+    An optional "id" in a request is copied into its reply. A budget must be at least 1 ms, and larger budgets
+    are cut to max_budget.
+
+    Attributes:
+        max_cells (int): Largest board a game may ask for, in cells
+        budget (int): Default milliseconds per AI move
+        max_budget (int): Largest budget a request may ask for
+        max_games (int): Games that can be open at once
+        limit (int): Searches that can be running or queued in the pool at once
+        pool (ProcessPoolExecutor): Worker processes running the AI searches
+        games (dict): Open games by id, each a (GameState, asyncio.Lock, index of the AI player) tuple
+        pending (int): Searches running or queued in the pool
+        ids (itertools.count): Source of game ids
+        archive (GameArchive): Archive that gets every finished game, and every game closed or left open at
+            shutdown before it ended, None for none
+
+    Methods:
+        __init__(workers=None, budget=100, max_budget=2000, queue=None, max_games=10000, archive=None): Starts the
+            pool
+        serve(host="127.0.0.1", port=4004): Accepts connections until cancelled
+        handle(reader, writer): Answers the requests of one connection
+        dispatch(request): Runs one request and returns the reply
+        game(request): Looks up the game a request names
+        play_ai(state, budget): Searches and plays the AI's move in the pool
+        archive_game(state): Appends a game to the archive
+        close(): Archives the games left unfinished and shuts the pool down
+    """
+    max_cells = 256
+
+    def __init__(self, workers=None, budget=100, max_budget=2000, queue=None, max_games=10000, archive=None):
+        """
+        Constructor for GameServer Class
+
+        Parameters:
+        workers (int, optional): Pool processes, defaults to one per CPU
+        budget (int, optional): Default milliseconds per AI move
+        max_budget (int, optional): Largest budget a request may ask for
+        queue (int, optional): Searches that may wait for a free worker, defaults to the number of workers
+        max_games (int, optional): Games that can be open at once
+        archive (str, optional): GameArchive file that gets every finished game
+        """
+        workers = workers or os.cpu_count() or 1
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers)
+        self.budget = budget
+        self.max_budget = max_budget
+        self.max_games = max_games
+        self.limit = workers + (workers if queue is None else queue)
+        self.games = {}
+        self.pending = 0
+        self.ids = itertools.count(1)
+        self.archive = GameArchive(archive) if archive is not None else None
+
+    async def serve(self, host="127.0.0.1", port=4004):
+        """
+        Accepts connections until cancelled
+
+        Parameters:
+        host (str, optional): Address to listen on
+        port (int, optional): Port to listen on
+        """
+        server = await asyncio.start_server(self.handle, host, port, limit=1 << 16)
+        print(f"Serving Connect4 on {host}:{port} with {self.limit} search slots")
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        """
+        Answers the requests of one connection, in order, until it closes
+
+        Parameters:
+        reader (StreamReader): Incoming requests
+        writer (StreamWriter): Outgoing replies
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("A request must be a JSON object.")
+                    reply = await self.dispatch(request)
+                    reply["ok"] = True
+                except ServerBusy:
+                    reply = {"ok": False, "error": "busy"}
+                except (ValueError, KeyError, TypeError) as error:
+                    reply = {"ok": False, "error": str(error)}
+                if isinstance(request, dict) and "id" in request:
+                    reply["id"] = request["id"]
+                writer.write((json.dumps(reply) + "\n").encode())
+                # Stop reading while the client is not taking its replies
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        """
+        Runs one request
+
+        Parameters:
+        request (dict): Decoded request
+
+        Returns:
+        dict: Reply without the "ok" and "id" fields
+
+        Raises:
+        ValueError: If the request is malformed, asks for a budget under 1 ms, names an unknown game or makes an
+            illegal move
+        ServerBusy: If an AI move is needed and the pool has no free slot
+        """
+        op = request.get("op")
+        budget = min(int(request.get("budget", self.budget)), self.max_budget)
+        # A budget of 0 would turn the time limit off and search to a fixed depth instead
+        if budget < 1:
+            raise ValueError("The budget must be at least 1 ms.")
+        if op == "new":
+            if len(self.games) >= self.max_games:
+                raise ValueError("Too many open games.")
+            ai_index = 0 if request.get("ai_first") else 1
+            names = [str(request.get("name", "Player"))] * 2
+            names[ai_index] = "AI"
+            rows, cols = int(request.get("rows", 6)), int(request.get("cols", 7))
+            if rows * cols > self.max_cells:
+                raise ValueError(f"Boards are limited to {self.max_cells} cells.")
+            state = GameState.new(names, ai=None, rows=rows, cols=cols, connect=int(request.get("connect", 4)))
+            if ai_index == 0 and self.pending >= self.limit:
+                raise ServerBusy()
+            game_id = str(next(self.ids))
+            self.games[game_id] = (state, asyncio.Lock(), ai_index)
+            reply = {"game": game_id}
+            if ai_index == 0:
+                async with self.games[game_id][1]:
+                    reply["ai_move"] = await self.play_ai(state, budget)
+            reply["status"] = state.status()
+            return reply
+
+        game_id = str(request.get("game"))
+        state, lock, ai_index = self.game(request)
+        if op == "status":
+            return {"game": game_id, "status": state.status()}
+        if op not in ("move", "ai", "close"):
+            raise ValueError(f"Unknown op {op}.")
+
+        async with lock:
+            # The game may have been closed while this request waited for the lock
+            if game_id not in self.games:
+                raise ValueError(f"No game {game_id}.")
+            if op == "close":
+                # A finished game was archived when it ended
+                if not state.is_over():
+                    self.archive_game(state)
+                del self.games[game_id]
+                return {"game": game_id}
+            reply = {"game": game_id}
+            if op == "move":
+                if state.turn == ai_index and not state.is_over():
+                    raise ValueError("It is the AI's turn.")
+                if int(request["col"]) not in state.legal_moves():
+                    raise ValueError(f"Column {request['col']} is not a legal move.")
+                # Refuse before the human's move is played, so a busy reply leaves the game unchanged
+                if self.pending >= self.limit:
+                    raise ServerBusy()
+                state.apply_move(int(request["col"]))
+            elif state.turn != ai_index or state.is_over():
+                raise ValueError("It is not the AI's turn.")
+            if not state.is_over():
+                reply["ai_move"] = await self.play_ai(state, budget)
+            # A shutdown during the AI's search has already archived the game
+            if state.is_over() and game_id in self.games:
+                self.archive_game(state)
+            reply["status"] = state.status()
+            return reply
+
+    def game(self, request):
+        """
+        Looks up the game a request names
+
+        Parameters:
+        request (dict): Decoded request with a "game" id
+
+        Returns:
+        tuple: The GameState, its lock and the index of the AI player
+
+        Raises:
+        ValueError: If there is no such game
+        """
+        game = self.games.get(str(request.get("game")))
+        if game is None:
+            raise ValueError(f"No game {request.get('game')}.")
+        return game
+
+    async def play_ai(self, state, budget):
+        """
+        Searches the AI's move in the pool and plays it
+
+        Parameters:
+        state (GameState): Game with the AI to move
+        budget (int): Milliseconds for the search
+
+        Returns:
+        dict: The column played, its score and the milliseconds the search took
+
+        Raises:
+        ServerBusy: If the pool has no free slot
+        """
+        if self.pending >= self.limit:
+            raise ServerBusy()
+        self.pending += 1
+        try:
+            ai, human = state.current(), state.players[state.turn ^ 1]
+            start = time.perf_counter()
+            col, score, stats = await asyncio.get_running_loop().run_in_executor(
+                self.pool, search_move, state.board.board, ai.token, human.token, budget, state.board.geometry)
+        finally:
+            self.pending -= 1
+        state.apply_move(col)
+        return {"col": col, "score": score, "ms": round((time.perf_counter() - start) * 1000, 1),
+                "depth": stats["depth"], "nodes": stats["nodes"]}
+
+    def archive_game(self, state):
+        """
+        Appends a game to the archive, if there is one. The archive only holds 6x7 connect-4 games, and games
+        without a move are left out.
+
+        Parameters:
+        state (GameState): Game to record, unfinished games are recorded as such
+        """
+        if self.archive is not None and state.moves and state.board.geometry is Geometry.STANDARD:
+            self.archive.record_game(state)
+
+    def close(self):
+        """
+        Archives the games still open and unfinished, then shuts the pool down
+        """
+        for state, lock, ai_index in self.games.values():
+            if not state.is_over():
+                self.archive_game(state)
+        self.games.clear()
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def request(reader, writer, message):
+    '''
+    Sends one request and waits for its reply
+
+    :param reader: StreamReader of the connection
+    :param writer: StreamWriter of the connection
+    :param message: request as a dict
+    :return: reply as a dict
+    '''
+    writer.write((json.dumps(message) + "\n").encode())
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def request_until_served(reader, writer, message, counts):
+    '''
+    Sends a request again after a short wait for as long as the server replies busy
+
+    :param reader: StreamReader of the connection
+    :param writer: StreamWriter of the connection
+    :param message: request as a dict
+    :param counts: dict whose "busy" count is raised for every busy reply
+    :return: reply as a dict
+    '''
+    while True:
+        reply = await request(reader, writer, message)
+        if reply["ok"]:
+            return reply
+        if reply["error"] != "busy":
+            raise RuntimeError(reply["error"])
+        counts["busy"] += 1
+        await asyncio.sleep(0.01)
+
+
+async def load_client(host, port, games, budget, rng, latencies, counts):
+    '''
+    Plays games against the server with random moves over one connection, timing every move
+
+    :param host: server address
+    :param port: server port
+    :param games: games to play
+    :param budget: AI milliseconds per move to ask for
+    :param rng: random.Random for the moves
+    :param latencies: list that gets the seconds from sending each move to its reply
+    :param counts: dict counting finished games and busy replies
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(games):
+            reply = await request_until_served(reader, writer, {"op": "new", "budget": budget,
+                                                                "ai_first": rng.random() < 0.5}, counts)
+            game, status = reply["game"], reply["status"]
+            while status["state"] == "playing":
+                # Latency includes any busy replies and retries before the move is served
+                start = time.perf_counter()
+                reply = await request_until_served(reader, writer, {"op": "move", "game": game, "budget": budget,
+                                                                    "col": rng.choice(status["legal_moves"])}, counts)
+                latencies.append(time.perf_counter() - start)
+                status = reply["status"]
+            await request(reader, writer, {"op": "close", "game": game})
+            counts["games"] += 1
+    finally:
+        writer.close()
+
+
+def percentile(values, fraction):
+    '''
+    Returns a percentile of a list by the nearest rank
+
+    :param values: sorted list of numbers
+    :param fraction: percentile between 0 and 1
+    :return: the value at that rank, 0 for an empty list
+    '''
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def load_test(host="127.0.0.1", port=4004, concurrency=50, games=4, budget=50, seed=0):
+    '''
+    Runs concurrent clients against a server and reports the move latency
+
+    :param host: server address
+    :param port: server port
+    :param concurrency: simultaneous connections, each playing its games one after another
+    :param games: games per connection
+    :param budget: AI milliseconds per move to ask for
+    :param seed: seed for the random moves
+    :return: dict with games, moves, busy replies, moves per second and p50, p99 and max latency in ms
+    '''
+    latencies, counts = [], {"games": 0, "busy": 0}
+    start = time.perf_counter()
+    await asyncio.gather(*(load_client(host, port, games, budget, random.Random(seed + client), latencies, counts)
+                           for client in range(concurrency)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    report = {"games": counts["games"], "moves": len(latencies), "busy": counts["busy"],
+              "moves_per_second": len(latencies) / seconds if seconds else 0.0,
+              "p50_ms": percentile(latencies, 0.5) * 1000, "p99_ms": percentile(latencies, 0.99) * 1000,
+              "max_ms": latencies[-1] * 1000 if latencies else 0}
+    print(f"{report['games']} games, {report['moves']} moves in {seconds:.1f}s ({report['moves_per_second']:.1f} moves/s) "
+          f"at concurrency {concurrency}, {report['busy']} busy replies")
+    print(f"Move latency p50 {report['p50_ms']:.1f}ms  p99 {report['p99_ms']:.1f}ms  max {report['max_ms']:.1f}ms")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Connect4 AI game server and its load test")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="host human-versus-AI games")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=4004)
+    serve.add_argument("--workers", type=int, default=None)
+    serve.add_argument("--budget", type=int, default=100)
+    serve.add_argument("--max-budget", type=int, default=2000)
+    serve.add_argument("--queue", type=int, default=None)
+    serve.add_argument("--max-games", type=int, default=10000)
+    serve.add_argument("--archive", default=None, help="game archive file for finished and abandoned games")
+    load = commands.add_parser("load", help="play random games against a server and report move latency")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, default=4004)
+    load.add_argument("--concurrency", type=int, default=50)
+    load.add_argument("--games", type=int, default=4)
+    load.add_argument("--budget", type=int, default=50)
+    load.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        game_server = GameServer(args.workers, args.budget, args.max_budget, args.queue, args.max_games, args.archive)
+        try:
+            asyncio.run(game_server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            game_server.close()
+    elif args.command == "load":
+        asyncio.run(load_test(args.host, args.port, args.concurrency, args.games, args.budget, args.seed))
@@ -1,258 +1,270 @@
-import copy
+import sys
+import csv
+import json
+import math
+import time
 import random
+import argparse
+import multiprocessing
 
-#Variables used to simplify functions
-AI = 1
-player = -1
-empty = 0
-ROW_NUM = 6
-COL_NUM = 7
-
-#Function prints board to user in 2D
-
-def printboard(s):
-    for nested_list in s:  # this will print the board
-        print(' '.join(map(str, nested_list)))
-
-#Function determining whose turn it is
-
-def turn(s):
-    x_times = 0
-    #let X represent 1(AI)
-    o_times = 0
-    #let O represent -1(player)
-    for row in range(len(s)):
-        for val in range(len(s[row])):
-            #for loops iterate through each row to check for filled in spaces
-            if s[row][val] == AI:
-                x_times +=1
-            elif s[row][val] == player:
-                o_times +=1
-    if x_times > o_times:
-        return player
-    elif o_times > x_times:
-        return AI
-    elif x_times + o_times == 9:
-        return None
-
-#Array tranposed from [rows][cols] to [cols][rows] for more logical valid_moves searching
-def transpose(s):
-    return [[s[j][i] for j in range(len(s))] for i in range(len(s[0]))]
-
-#Function checks each columns for the lowest empty space
-def valid_moves(s):
-        new_s = transpose(s)
-        possible_moves = []
-        for col in range(len(new_s)):
-            for row in range(len(new_s[0])-1, -1, -1):
-                if new_s[col][row] == 0:
-                    possible_moves.append([col, row])
-                    break
-                # Once we find an empty space in this row, move to the next row
-        switch_nested_values(possible_moves)
-
-        if len(possible_moves) == 0:
-            return False
-
-        return possible_moves
-        #returns a list of nested lists with coordinates
-
-#Function switches the values back from [col][row] to [row][col]
-def switch_nested_values(nested_lists):
-    for nested_list in nested_lists:
-        nested_list[0], nested_list[1] = nested_list[1], nested_list[0]
-
-#Function efficiently checks each column, row, and diagonal once to see if there is four consecutive pieces
-def win_check(s):
-        #Horizontal Checks
-        for row in range(len(s)):
-            for col in range(len(s[0]) - 3):
-                if s[row][col] == s[row][col + 1] == s[row][col + 2] == s[row][col + 3] and s[row][col] != 0:
-                    return s[row][col]
-        #Vertical Checks
-        for y in range(len(s) - 3):
-            for z in range(len(s[0])):
-                if s[y][z] == s[y + 1][z] == s[y + 2][z] == s[y + 3][z] and s[y][z] != 0:
-                    return s[y][z]
-        #Two sets of diagonal checks
-        for a in range(len(s) - 3):
-            for b in range(len(s[0]) - 3):
-                if s[a][b] == s[a + 1][b + 1] == s[a + 2][b + 2] == s[a + 3][b + 3] and s[a][b] != 0:
-                    return s[a][b]
-                elif s[a][6 - b] == s[a + 1][5 - b] == s[a + 2][4 - b] == s[a + 3][3 - b] and s[a][b] != 0:
-                    return s[a][b]
-        return False
-        #if there is no winner, function returns false
-
-#Heuristic Evaluation function uses by Minimax Algorithm to give priority to certain moves
-def count_score(s):
-        player1Score = 0
-        player2Score = 0
-        print(AI)
-        # Check horizontally
-        for row in range(len(s)):
-            for col in range(len(s[0]) - 3):
-                if s[row][col:col + 4].count([AI]) == 4:
-                    player1Score += 100
-                elif s[row][col:col + 4].count([AI]) == 3:
-                    player1Score += 5
-                elif s[row][col:col + 4].count([AI]) == 2:
-                    player1Score += 2
-                if s[row][col:col + 4].count([player]) == 4:
-                    player2Score += 100
-                elif s[row][col:col + 4].count([player]) == 3:
-                    player2Score += 5
-                elif s[row][col:col + 4].count([player]) == 2:
-                    player2Score += 2
-        print(player1Score)
-        print(player2Score)
-        # Check vertically
-        for col in range(len(s[0])):
-            for row in range(len(s) - 3):
-                if [s[row + i][col] for i in range(4)].count([AI]) == 4:
-                    player1Score += 100
-                elif [s[row + i][col] for i in range(4)].count([AI]) == 3:
-                    player1Score += 5
-                elif [s[row + i][col] for i in range(4)].count([AI]) == 2:
-                    player1Score += 2
-                if [s[row + i][col] for i in range(4)].count([player]) == 4:
-                    player2Score += 100
-                elif [s[row + i][col] for i in range(4)].count([player]) == 3:
-                    player2Score += 5
-                elif [s[row + i][col] for i in range(4)].count([player]) == 2:
-                    player2Score += 2
-        print(player1Score)
-        print(player2Score)
-        # Check diagonally
-        for row in range(len(s) - 3):
-            for col in range(len(s[0]) - 3):
-                if [s[row + i][col + i] for i in range(4)].count([AI]) == 4:
-                    player1Score += 100
-                elif [s[row + i][col + i] for i in range(4)].count([AI]) == 3:
-                    player1Score += 5
-                elif [s[row + i][col + i] for i in range(4)].count([AI]) == 2:
-                    player1Score += 2
-                if [s[row + i][col + i] for i in range(4)].count([player]) == 4:
-                    player2Score += 100
-                elif [s[row + i][col + i] for i in range(4)].count([player]) == 3:
-                    player2Score += 5
-                elif [s[row + i][col + i] for i in range(4)].count([player]) == 2:
-                    player2Score += 2
-                if [s[row + i][col + 3 - i] for i in range(4)].count([AI]) == 4:
-                    player1Score += 100
-                elif [s[row + i][col + 3 - i] for i in range(4)].count([AI]) == 3:
-                    player1Score += 5
-                elif [s[row + i][col + 3 - i] for i in range(4)].count([AI]) == 2:
-                    player1Score += 2
-                if [s[row + i][col + 3 - i] for i in range(4)].count([player]) == 4:
-                    player2Score += 100
-                elif [s[row + i][col + 3 - i] for i in range(4)].count([player]) == 3:
-                    player2Score += 5
-                elif [s[row + i][col + 3 - i] for i in range(4)].count([player]) == 2:
-                    player2Score += 2
-
-        for rows in range(3, 6):
-            for cols in range(2, 5):
-                if s[rows][cols]==player:
-                    player2Score +=2
-                elif s[rows][cols]==AI:
-                    player1Score += 2
-
-        return player1Score - player2Score
-
-#Minimax Algorithm with Alpha Beta Pruning
-#Sets player to true or false value
-def minimax(board, depth, alpha, beta, player_bool):
+from Connect4 import AI, Bitboard, Evaluator, BatchEvaluator, Geometry, Board, Game, numpy
+
+#Tokens used by the engine moving first and the engine moving second
+FIRST = 1
+SECOND = 2
+
+#Function turns an engine description such as "deep:depth=6,budget=200,weights=2/5/100/2,cache=deep.tt" into a configuration
+
+def parse_engine(text):
     '''
 
-    :param board: takes in the desired board for the first call and recursion
-    :param depth: can be changed by user depending on priority of accuracy vs time efficiency
-    :param alpha: set as very low value, incorporated to improve algorithm efficiency
-    :param beta: set as very high value, incorporated to improve algorithm efficiency
-    :param player_bool: takes in a true or false depending on whose turn the program is simulating
-    :return: returns the game score based on the heuristic evaluation, and the optimal coordinates corresponding to it
+    :param text: engine name, then a colon and comma separated depth, budget (ms), weights, cache file, forcing
+    (0 turns threat analysis off) and pvs (1 turns principal variation search on) settings
+    :return: dict with name, depth, budget, weights, cache, forcing and pvs
     '''
-    possibles = valid_moves(board)
-    #Base Case
-    if depth == 0 or win_check(board):
-        if win_check(board):
-            if win_check(board) == AI:
-                return (None, 99999)
-            elif win_check(board) == player:
-                return (None, -99999)
-            else:
-                return (None, count_score(board))
+    name, _, settings = text.partition(":")
+    config = {"name": name, "depth": 5, "budget": None, "weights": Evaluator.WEIGHTS, "cache": None, "forcing": True,
+              "pvs": False}
+    for setting in filter(None, settings.split(",")):
+        key, value = setting.split("=")
+        if key == "weights":
+            config["weights"] = tuple(int(weight) for weight in value.split("/"))
+        elif key in ("depth", "budget"):
+            config[key] = int(value)
+        elif key == "cache":
+            config[key] = value
+        elif key in ("forcing", "pvs"):
+            config[key] = value not in ("0", "off", "false")
         else:
-            #This is the situation where depth is reached before possible game ending
-            print("Score:", count_score(board))
-            return (None, count_score(board))
-
-    if player_bool:
-        #Let the AI be the true
-        value = -99999
-        best_position = random.choice(possibles)
-        for possible in possibles:
-            board_copy = copy.deepcopy(board)
-            board_copy[possible[0]][possible[1]] = AI
-            value = max(value, minimax(board_copy, depth - 1, alpha, beta,False)[1])
-            alpha = max(alpha, value)
-            if alpha >= beta:
+            raise ValueError(f"Unknown engine setting {key}")
+    return config
+
+#Function builds the AI for one side of a game
+
+def make_ai(config, token, other):
+    return AI(config["name"], token, other, depth=config["depth"], time_budget=config["budget"],
+              weights=config["weights"], cache=config.get("cache"), forcing=config.get("forcing", True),
+              pvs=config.get("pvs", False))
+
+#Function picks random opening moves so the games of a tournament are not all the same game
+
+def random_opening(rng, plies):
+    '''
+
+    :param rng: random.Random to draw moves from
+    :param plies: number of opening moves
+    :return: list of 0-indexed columns that does not end the game
+    '''
+    while True:
+        position = Bitboard((FIRST, SECOND))
+        for _ in range(plies):
+            position.play(rng.choice(position.valid_moves()))
+            if position.winner():
                 break
-            print("AI Move:", possible, "Value:", value)
-        return best_position, value
+        else:
+            return list(position.moves)
+
+#Function plays one game between two engines, run inside the process pool
+
+def play_game(job):
+    '''
+
+    :param job: game number, engine A, engine B, whether A moves first, and the opening columns
+    :return: dict describing the finished game
+    '''
+    game, engine_a, engine_b, a_first, opening = job
+    start = time.perf_counter()
+    first, second = (engine_a, engine_b) if a_first else (engine_b, engine_a)
+    engines = [make_ai(first, FIRST, SECOND), make_ai(second, SECOND, FIRST)]
+    position = Bitboard((FIRST, SECOND))
+    for col in opening:
+        position.play(col)
+    while not position.winner() and not position.board_full():
+        best_spot = engines[position.turn].choose_move(position.to_board(), True)[0]
+        position.play(best_spot[1])
+    for engine in engines:
+        engine.close()
+
+    winner = position.winner()
+    if not winner:
+        result = "draw"
+    elif (winner == FIRST) == a_first:
+        result = "a"
     else:
-        #This is the player situation
-        value = 99999
-        best_position = random.choice(possibles)
-        for possible in possibles:
-            board_copy = copy.deepcopy(board)
-            board_copy[possible[0]][possible[1]] = player
-            value = min(value, minimax(board_copy, depth - 1, alpha, beta, True)[1])
-            print("Player Move:", possible, "Value:", value)
-            beta = min(beta, value)
-            if alpha >= beta:
-                break
-        return best_position, value
+        result = "b"
+    return {"game": game, "engine_a": engine_a["name"], "engine_b": engine_b["name"], "first": first["name"],
+            "opening": "".join(map(str, opening)), "moves": "".join(map(str, position.moves)), "result": result,
+            "plies": len(position.moves), "seconds": round(time.perf_counter() - start, 3)}
+
+#Function gives the 95% Wilson interval of a proportion
+
+def wilson(count, total, z=1.96):
+    if total == 0:
+        return 0.0, 1.0
+    rate = count / total
+    centre = (rate + z * z / (2 * total)) / (1 + z * z / total)
+    spread = z * math.sqrt(rate * (1 - rate) / total + z * z / (4 * total * total)) / (1 + z * z / total)
+    return max(0.0, centre - spread), min(1.0, centre + spread)
 
-def accuracy_test(depth1, depth2, num_games):
+#Function prints the win/draw/loss summary of a tournament from engine A's side
+
+def summarize(results, seconds, name_a, name_b):
     '''
 
-    :param depth1: takes in depth of first minimax (player)
-    :param depth2: takes in depth of second minimax (AI)
-    :param num_games: takes in number of desired games played
-    :return:
+    :param results: dict with the a, b and draw counts
+    :param seconds: wall time of the tournament
+    :param name_a: name of engine A
+    :param name_b: name of engine B
+    :return: dict with the counts, score, its 95% interval, Elo difference and games per second
+    '''
+    total = results["a"] + results["b"] + results["draw"]
+    score = (results["a"] + results["draw"] / 2) / total if total else 0.5
+    # Per-game variance of a win = 1, draw = 0.5, loss = 0 score
+    variance = sum(count * (value - score) ** 2 for count, value in
+                   ((results["a"], 1), (results["draw"], 0.5), (results["b"], 0)))
+    error = 1.96 * math.sqrt(variance / total) / math.sqrt(total) if total else 0.5
+    low, high = max(0.0, score - error), min(1.0, score + error)
+    elo = -400 * math.log10(1 / score - 1) if 0 < score < 1 else math.copysign(math.inf, score - 0.5)
+    summary = {"games": total, "wins": results["a"], "draws": results["draw"], "losses": results["b"],
+               "score": score, "score_interval": (low, high), "elo": elo,
+               "games_per_second": total / seconds if seconds else 0.0}
+
+    print(f"{name_a} vs {name_b}: {total} games in {seconds:.1f}s ({summary['games_per_second']:.2f} games/s)")
+    for label, key in (("Wins", "a"), ("Draws", "draw"), ("Losses", "b")):
+        rate_low, rate_high = wilson(results[key], total)
+        print(f"{label:<7}{results[key]:>6}  {results[key] / max(total, 1):6.1%}  "
+              f"95% CI {rate_low:6.1%} - {rate_high:6.1%}")
+    print(f"Score  {score:6.1%}  95% CI {low:6.1%} - {high:6.1%}  Elo {elo:+.0f}")
+    return summary
+
+#Function runs a tournament between two engines across a process pool, streaming each game to a CSV or JSONL file
+
+def tournament(engine_a, engine_b, num_games, workers=None, out="tournament.jsonl", opening_plies=4, seed=0):
     '''
-    results = {"depth1" : 0, "depth2" : 0, "draw": 0}
-    error = 0
-    for _ in range(num_games):
-        boardmain = [[0 for number in range(7)] for num in range(6)]
-        current_depth_ai1 = depth1
-        current_depth_ai2 = depth2
-        while valid_moves(boardmain):
-            best_spot_ai1 = minimax(boardmain, current_depth_ai1, -99999, 99999, True)[0]
-            if best_spot_ai1 is not None and (best_spot_ai1[0] is not None or best_spot_ai1[1] is not None):
-                boardmain[best_spot_ai1[0]][best_spot_ai1[1]] = AI
-            else:
-                results['draw'] +=1
-                break
-            printboard(boardmain)
-            if win_check(boardmain) == AI:
-                results['depth1'] += 1
-                break
 
-            best_spot_ai2 = minimax(boardmain, current_depth_ai2, -99999, 99999, False)[0]
-            if best_spot_ai2 is not None and (best_spot_ai2[0] is not None or best_spot_ai2[1] is not None):
-                boardmain[best_spot_ai2[0]][best_spot_ai2[1]] = AI
+    :param engine_a: configuration of the first engine, see parse_engine
+    :param engine_b: configuration of the second engine
+    :param num_games: number of games; each opening is played twice with the engines swapping sides
+    :param workers: size of the process pool, defaults to one per CPU
+    :param out: results file, CSV if it ends in .csv and JSON lines otherwise
+    :param opening_plies: random moves played before the engines take over
+    :param seed: seed for the openings, so a tournament can be repeated
+    :return: the summary from summarize
+    '''
+    rng = random.Random(seed)
+    jobs = []
+    while len(jobs) < num_games:
+        opening = random_opening(rng, opening_plies)
+        jobs.append((len(jobs), engine_a, engine_b, True, opening))
+        jobs.append((len(jobs), engine_a, engine_b, False, opening))
+    jobs = jobs[:num_games]
+
+    results = {"a": 0, "b": 0, "draw": 0}
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool, open(out, "w", newline="") as file:
+        writer = None
+        for record in pool.imap_unordered(play_game, jobs):
+            if out.endswith(".csv"):
+                if writer is None:
+                    writer = csv.DictWriter(file, fieldnames=list(record))
+                    writer.writeheader()
+                writer.writerow(record)
             else:
-                results['draw'] += 1
-                break
-            printboard(boardmain)
-            if win_check(boardmain) == player:
-                results['depth2'] += 1
-                break
+                file.write(json.dumps(record) + "\n")
+            file.flush()
+            results[record["result"]] += 1
+    return summarize(results, time.perf_counter() - start, engine_a["name"], engine_b["name"])
+
+#Function compares the AI against itself at two depths, kept for the old depth-versus-depth runs
+
+def accuracy_test(depth1, depth2, num_games, out="accuracy_test.jsonl"):
+    '''
+
+    :param depth1: takes in depth of first minimax
+    :param depth2: takes in depth of second minimax
+    :param num_games: takes in number of desired games played
+    :return: wins at each depth and the number of draws
+    '''
+    summary = tournament({"name": f"depth{depth1}", "depth": depth1, "budget": None, "weights": Evaluator.WEIGHTS},
+                         {"name": f"depth{depth2}", "depth": depth2, "budget": None, "weights": Evaluator.WEIGHTS},
+                         num_games, out=out)
+    return {"depth1": summary["wins"], "depth2": summary["losses"], "draw": summary["draws"]}
+
+
+#Function checks the fast evaluators and win checks against the board-scanning reference on random positions
+
+def check_evaluators(samples=1000, sizes=((6, 7, 4),), weights=Evaluator.WEIGHTS, seed=0):
+    '''
+
+    :param samples: random positions per board size
+    :param sizes: (rows, cols, connect) of each board size to check
+    :param weights: heuristic weights given to every evaluator
+    :param seed: seed for the positions
+    :return: list of (size, moves played, what disagreed), empty if everything agrees
+    '''
+    rng = random.Random(seed)
+    mismatches = []
+    for rows, cols, connect in sizes:
+        geometry = Geometry.get(rows, cols, connect)
+        ai = AI("Check", FIRST, SECOND, table_size=0, weights=weights, endgame_threshold=0, geometry=geometry)
+        batch = BatchEvaluator(weights, geometry) if numpy is not None else None
+        for _ in range(samples):
+            position = Bitboard((FIRST, SECOND), geometry=geometry)
+            position.evaluator = Evaluator(position, weights)
+            for _ in range(rng.randrange(rows * cols + 1)):
+                moves = position.valid_moves()
+                if not moves:
+                    break
+                position.play(rng.choice(moves))
+                if position.last_move_won():
+                    break
+            board = position.to_board()
+            #Game.win_check only reads the board, so the prompts in the constructor are skipped
+            game = Game.__new__(Game)
+            game.board = Board("Old", board, connect=connect)
+            reference = ai.count_score(board)
+            winner = ai.win_check(board)
+            #Board.wins_at only looks through one cell, so every token on the board is tried
+            cells = [(row, col) for row in range(rows) for col in range(cols) if board[row][col]]
+            line_owners = {board[row][col] for row, col in cells
+                           if game.board.wins_at(row + 1, col + 1, board[row][col])}
+            checks = {"Evaluator": position.evaluator.score == reference,
+                      "Evaluator from scratch": Evaluator(position, weights).score == reference,
+                      "Bitboard.winner": position.winner() == winner,
+                      "Game.win_check": [game.win_check(token) for token in (FIRST, SECOND)]
+                      == [winner == FIRST, winner == SECOND],
+                      "Board.wins_at": line_owners == ({winner} if winner else set())}
+            if batch is not None:
+                checks["BatchEvaluator"] = batch.scores_from_masks([position.masks])[0] == reference
+                checks["BatchEvaluator boards"] = batch.scores([board], FIRST, SECOND)[0] == reference
+            for name, agrees in checks.items():
+                if not agrees:
+                    mismatches.append((f"{rows}x{cols}x{connect}", list(position.moves), name))
+        print(f"{rows}x{cols}x{connect}: {samples} positions checked")
+    print(f"{len(mismatches)} disagreements with count_score and win_check")
+    for size, moves, name in mismatches[:10]:
+        print(f"  {size} {name} after {''.join(map(str, moves))}")
+    return mismatches
 
-    print(error)
-    return results
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Self-play tournament between two Connect4 AI configurations")
+    parser.add_argument("--engine", action="append", type=parse_engine,
+                        help="name:depth=N,budget=MS,weights=TWO/THREE/FOUR/CENTER,cache=FILE,forcing=0|1,pvs=0|1, "
+                             "given twice")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="tournament.jsonl")
+    parser.add_argument("--opening-plies", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check-evaluators", type=int, default=None, metavar="SAMPLES",
+                        help="instead of a tournament, check the evaluators against count_score on random positions")
+    args = parser.parse_args()
 
-print(accuracy_test(3, 6, 20))
+    if args.check_evaluators is not None:
+        sizes = ((6, 7, 4), (7, 8, 4), (9, 9, 5))
+        sys.exit(1 if check_evaluators(args.check_evaluators, sizes, seed=args.seed) else 0)
+    engines = args.engine or [parse_engine("depth3:depth=3"), parse_engine("depth6:depth=6")]
+    if len(engines) != 2:
+        parser.error("--engine must be given exactly twice")
+    tournament(engines[0], engines[1], args.games, args.workers, args.out, args.opening_plies, args.seed)
@@ -0,0 +1,76 @@
+import time
+import argparse
+
+from Connect4 import OpeningBook, DiskTranspositionTable, GameArchive
+
+#Function builds the opening book file read by the AI
+
+def build_book(path, plies, depth, workers=None):
+    '''
+
+    :param path: book file to write
+    :param plies: deepest opening move to store
+    :param depth: search depth for every book position
+    :param workers: size of the process pool, defaults to one per CPU
+    :return: number of positions written
+    '''
+    start = time.perf_counter()
+    count = OpeningBook.build(path, plies, depth, workers)
+    print(f"Wrote {count} positions to {path} in {time.perf_counter() - start:.1f}s")
+    return count
+
+#Function compacts a position cache file, dropping shallow entries and optionally resizing it
+
+def compact_cache(path, size=None, min_depth=0):
+    '''
+
+    :param path: cache file to compact, no process should have it open
+    :param size: new entry cap, defaults to the current one
+    :param min_depth: entries searched to less than this depth are dropped
+    :return: entries kept and entries dropped
+    '''
+    kept, dropped = DiskTranspositionTable.compact(path, size, min_depth)
+    print(f"Kept {kept} positions in {path}, dropped {dropped}")
+    return kept, dropped
+
+#Function summarizes a game archive, streaming it without loading it into memory
+
+def archive_stats(path):
+    '''
+
+    :param path: game archive to read
+    :return: dict with the number of games, moves and games of each result
+    '''
+    start = time.perf_counter()
+    counts = GameArchive(path).results()
+    seconds = time.perf_counter() - start
+    games = counts["games"]
+    print(f"{games} games, {counts['moves']} moves in {path}, scanned in {seconds:.2f}s")
+    for label, result in (("First player wins", GameArchive.FIRST), ("Second player wins", GameArchive.SECOND),
+                          ("Draws", GameArchive.DRAW), ("Unfinished", GameArchive.UNFINISHED)):
+        print(f"{label:<20}{counts[result]:>10}  {counts[result] / max(games, 1):6.1%}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline tools for the Connect4 AI")
+    commands = parser.add_subparsers(dest="command", required=True)
+    book = commands.add_parser("book", help="build the opening book")
+    book.add_argument("--out", default="opening_book.bin")
+    book.add_argument("--plies", type=int, default=6)
+    book.add_argument("--depth", type=int, default=12)
+    book.add_argument("--workers", type=int, default=None)
+    cache = commands.add_parser("compact-cache", help="compact a position cache file")
+    cache.add_argument("path")
+    cache.add_argument("--size", type=int, default=None)
+    cache.add_argument("--min-depth", type=int, default=0)
+    archive = commands.add_parser("archive-stats", help="count the games in a game archive by result")
+    archive.add_argument("path", nargs="?", default="games.c4a")
+    args = parser.parse_args()
+
+    if args.command == "book":
+        build_book(args.out, args.plies, args.depth, args.workers)
+    elif args.command == "compact-cache":
+        compact_cache(args.path, args.size, args.min_depth)
+    elif args.command == "archive-stats":
+        archive_stats(args.path)